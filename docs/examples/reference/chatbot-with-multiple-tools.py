@@ -2,10 +2,10 @@
 # w/ towel
 
 import json
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, cast
 from pydantic import BaseModel
 from towel.tools import color, LogLevel, stream, say, slurp
-from towel.brain.base import TextThought, ToolUseThought
+from towel.brain.base import DeepThought, TextThought, ToolUseThought
 from towel import thinker, towel, tow
 
 class FakeDatabase:
@@ -197,10 +197,10 @@ def simple_chat():
         say("chat log", f"> {messages}", color.GRAY_DIUM, color.GRAY_ME)
 
         # ask llm what it thinks
-        response = llm.think(messages,
-                             temperature=0.2,
-                             tools=tools,
-                             max_tokens=4096)
+        response = cast(DeepThought, llm.think(messages,
+                                               temperature=0.2,
+                                               tools=tools,
+                                               max_tokens=4096))   ## not streamed, no response_model
 
         say("chat log", f"< {response}", color.GRAY_DIUM, color.GRAY_ME)
 
@@ -0,0 +1,85 @@
+## model swaps of many plans that share a single GPU Ollama server, with and without "group_by_model"
+##
+##   $ python hyperland/lab/model_swaps.py
+##
+## every plan drafts with one model, reviews with another and revises with the first one again,
+## and does a bit of work of its own (a tool call, parsing, etc.) between the thoughts that takes a different time every time:
+## which is what makes the plans fall out of step and their thoughts come in for the models in turns
+
+import time
+import random
+import argparse
+
+from towel import towel, tow, step, plan
+from towel.thinker import Ollama, plan_many
+from towel.tools import LogLevel
+
+from stand_in_ollama import serve
+
+def work(most: float):
+    time.sleep(random.uniform(0, most))
+
+def the_plan(most: float):
+
+    @towel
+    def draft(input: str):
+        llm, *_ = tow()
+        work(most)
+        return {"draft": llm.think(f"draft {input}").content[0].text}
+
+    @towel
+    def review(draft: str):
+        llm, *_ = tow()
+        work(most)
+        return {"review": llm.think(f"review {draft}").content[0].text}
+
+    @towel
+    def revise(draft: str, review: str):
+        llm, *_ = tow()
+        work(most)
+        return {"revised": llm.think(f"revise {draft} with {review}").content[0].text}
+
+    return plan([step(draft),
+                 step(review),
+                 step(revise)])
+
+def run(stand_in, url, grouped, inputs, max_concurrency, most):
+    random.seed(42)
+    stand_in.swaps = 0
+    drafter = Ollama(model="a:latest", url=url, health_check=None)
+    reviewer = Ollama(model="b:latest", url=url, health_check=None)
+    started = time.monotonic()
+    outcomes = list(plan_many(the_plan(most),
+                              inputs=range(inputs),
+                              llm=drafter,
+                              mind_map={"draft": drafter, "review": reviewer, "revise": drafter},
+                              max_concurrency=max_concurrency,
+                              group_by_model=grouped,
+                              log_level=LogLevel.ERROR))
+    took = time.monotonic() - started
+    assert all(outcome.ok for outcome in outcomes), [outcome.error for outcome in outcomes if not outcome.ok]
+    return stand_in.swaps, took
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="model swaps with and without \"group_by_model\"")
+    parser.add_argument("--port", type=int, default=11436)
+    parser.add_argument("--inputs", type=int, default=40)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds a thought takes")
+    parser.add_argument("--swap", type=float, default=0.2, help="seconds it takes to load a model in place of another one")
+    parser.add_argument("--work", type=float, default=0.05, help="at most this many seconds of a plan's own work between thoughts")
+    args = parser.parse_args()
+
+    server, stand_in = serve(args.port,
+                             background=True,
+                             models=("a:latest", "b:latest"),
+                             delay=args.delay,
+                             swap=args.swap)
+    url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{args.inputs} plans, {args.max_concurrency} at a time, {args.swap}s a swap, up to {args.work}s of work between thoughts\n")
+    for grouped in (False, True):
+        swaps, took = run(stand_in, url, grouped, args.inputs, args.max_concurrency, args.work)
+        print(f"group_by_model={grouped!s:5}  swaps: {swaps:3}  took: {took:.2f}s")
+
+    server.shutdown()
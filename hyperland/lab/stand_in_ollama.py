@@ -0,0 +1,172 @@
+## a stand in for an Ollama server: it answers /api/tags, /api/show, /api/chat and /api/generate with canned thoughts
+## so brains (and brains made of brains) can be taken for a spin without any models
+##
+##   $ python hyperland/lab/stand_in_ollama.py --port 11435 --delay 0.1 --stall-every 5 --stall 3
+##
+## "--stall-every 5 --stall 3" makes every 5th thought take 3 more seconds: i.e. a tail latency
+## "--swap 2" makes loading a model in place of another one take 2 seconds, as it would on a single GPU
+
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StandIn:
+    def __init__(self,
+                 models=("llama3:latest",),
+                 delay=0.0,
+                 stall_every=0,
+                 stall=0.0,
+                 swap=0.0,
+                 answer="42",
+                 tools=True,
+                 tool_calls=()):
+        self.models = list(models)
+        self.delay = delay
+        self.stall_every = stall_every
+        self.stall = stall
+        self.swap = swap                   ## seconds it takes to load a model in place of another one
+        self.answer = answer
+        self.tools = tools                 ## whether its models call tools natively
+        self.tool_calls = list(tool_calls) ## [(name, arguments)] it calls when it is given tools
+        self.thoughts = 0
+        self.loaded = []           ## one model in memory at a time, as on a single GPU
+        self.swaps = 0             ## times a model was loaded in place of another one
+        self.last = None           ## the last thought it was asked to think: i.e. to look at its "format"
+        self.lock = threading.Lock()
+
+        ## as Ollama's scheduler: thoughts are let in in the order they came, a thought for a model that is not loaded
+        ## waits for the thoughts of the loaded one to be done, and the ones that came after it wait as well
+        self.queue = threading.Condition()
+        self.tickets = 0
+        self.serving = 0
+        self.running = 0
+
+    def load(self, model):
+        with self.queue:
+            ticket = self.tickets
+            self.tickets += 1
+            while not (self.serving == ticket and (self.loaded == [model] or self.running == 0)):
+                self.queue.wait()
+            if self.loaded != [model]:
+                self.swaps += bool(self.loaded)
+                self.loaded = [model]
+                time.sleep(self.swap)
+            self.running += 1
+            self.serving += 1
+            self.queue.notify_all()
+
+    def done(self):
+        with self.queue:
+            self.running -= 1
+            self.queue.notify_all()
+
+    def think_time(self):
+        with self.lock:
+            self.thoughts += 1
+            stalls = self.stall_every and self.thoughts % self.stall_every == 0
+        return self.delay + (self.stall if stalls else 0)
+
+def handler(stand_in):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, body, status=200):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self.reply({"models": [{"name": model, "model": model} for model in stand_in.models]})
+            elif self.path == "/api/ps":
+                self.reply({"models": [{"name": model, "model": model} for model in stand_in.loaded]})
+            else:
+                self.reply({"error": "not found"}, 404)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.end_headers()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            stand_in.last = request
+            model = request.get("model")
+            if model not in stand_in.models:
+                return self.reply({"error": f"model \"{model}\" not found, try pulling it first"}, 404)
+
+            if self.path == "/api/show":
+                return self.reply({"template": "{{ .Prompt }}",
+                                   "model_info": {},
+                                   "capabilities": ["completion", "tools"] if stand_in.tools else ["completion"]})
+
+            if request.get("tools") and not stand_in.tools:
+                return self.reply({"error": f"registry.ollama.ai/library/{model} does not support tools"}, 400)
+
+            stand_in.load(model)
+            think_time = stand_in.think_time()
+            time.sleep(think_time)
+            stand_in.done()
+
+            done = {"model": model,
+                    "done": True,
+                    "done_reason": "stop",
+                    "prompt_eval_count": 7,
+                    "eval_count": 1,
+                    "prompt_eval_duration": 1000000,             ## nanoseconds, as Ollama has them
+                    "eval_duration": int(think_time * 1e9)}
+
+            if self.path == "/api/chat" and request.get("tools") and stand_in.tool_calls:
+                self.reply({**done, "message": {"role": "assistant",
+                                                "content": "",
+                                                "tool_calls": [{"function": {"name": name, "arguments": arguments}}
+                                                               for name, arguments in stand_in.tool_calls]}})
+            elif self.path == "/api/chat":
+                self.reply({**done, "message": {"role": "assistant", "content": stand_in.answer}})
+            elif self.path == "/api/generate":
+                self.reply({**done, "response": stand_in.answer, "context": [1, 2, 3]})
+            else:
+                self.reply({"error": "not found"}, 404)
+
+    return Handler
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 128       ## thoughts come in bursts: the default 5 makes connections wait on SYN retries
+    daemon_threads = True
+
+def serve(port=11435,
+          background=False,
+          **kwargs):
+    "serves a stand in on \"port\", returns the server (to \"shutdown()\") and its stand in (to look at and change)"
+    stand_in = StandIn(**kwargs)
+    server = Server(("127.0.0.1", port), handler(stand_in))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server, stand_in
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="a stand in Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", action="append", help="models it has, could be given more than once")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds every thought takes")
+    parser.add_argument("--stall-every", type=int, default=0, help="every n-th thought stalls")
+    parser.add_argument("--stall", type=float, default=0.0, help="seconds a stalled thought takes on top of the delay")
+    parser.add_argument("--swap", type=float, default=0.0, help="seconds it takes to load a model in place of another one")
+    args = parser.parse_args()
+
+    print(f"stand in Ollama is up on http://127.0.0.1:{args.port}")
+    serve(args.port,
+          models=args.model or ("llama3:latest",),
+          delay=args.delay,
+          stall_every=args.stall_every,
+          stall=args.stall,
+          swap=args.swap)
@@ -0,0 +1,83 @@
+## per call overhead of a no-op @towel function
+##
+##   $ python hyperland/lab/towel_overhead.py
+##
+## "before" is the @towel wrapper as it was, inspecting the function on every call
+##          and changing a shared, mutable context dict in place
+## "after"  is towel.base.towel, with the call plan made once at decoration time
+##          and a persistent context, where every call derives its own version
+
+import inspect
+import timeit
+from functools import wraps
+from contextvars import ContextVar
+
+from towel.base import towel, intel
+
+_before_context = ContextVar('before_context', default={})
+
+def towel_before(llm=None,
+                 iam=None,
+                 tools=[],
+                 prompts={}):
+
+    def decorator(func):
+        whoami = iam if iam is not None else f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            context = _before_context.get()
+            context.update({
+                'llm': llm or context.get('llm'),
+                'iam': whoami,
+                'tools': tools or context.get('tools', []),
+                'prompts': prompts or context.get('prompts', {})
+            })
+
+            sig = inspect.signature(func)
+            context_args = {}
+            bound_args = sig.bind_partial(*args)
+            context_args.update(bound_args.arguments)
+            for param in sig.parameters:
+                if param in context:
+                    context_args[param] = context[param]
+            context_args.update(kwargs)
+
+            result = func(**context_args)
+
+            if isinstance(result, dict):
+                context.update(result)
+            else:
+                context[func.__name__] = result
+
+            _before_context.set(context)
+            return result
+        return wrapper
+
+    return decorator
+
+def noop(meaning, of_life=42):
+    return None
+
+before = towel_before()(noop)
+after = towel()(noop)
+
+def per_call(func, calls):
+    seconds = min(timeit.repeat(lambda: func(), number=calls, repeat=5))
+    return seconds / calls * 1e6
+
+if __name__ == "__main__":
+    calls = 100_000
+
+    plain = per_call(lambda: noop(42), calls)
+
+    token = _before_context.set({'meaning': 42})
+    slow = per_call(before, calls)
+    _before_context.reset(token)
+
+    with intel(meaning=42):
+        fast = per_call(after, calls)
+
+    print(f"plain function call:    {plain:6.2f} µs")
+    print(f"@towel (before):        {slow:6.2f} µs   (+{slow - plain:.2f} µs overhead)")
+    print(f"@towel (after):         {fast:6.2f} µs   (+{fast - plain:.2f} µs overhead)")
@@ -1,7 +1,7 @@
 from . import base, guide, thinker, tools
 from .base import tow, towel, intel
-from .guide import step, route, plan, pin
+from .guide import step, parallel, route, plan, pin
 from .toolbox import web
 from . import brain
 
-__all__ = ['tow', 'towel', 'intel', 'step', 'route', 'pin', 'thinker', 'tools', 'web', 'brain']
+__all__ = ['tow', 'towel', 'intel', 'step', 'parallel', 'route', 'pin', 'thinker', 'tools', 'web', 'brain']
@@ -1,10 +1,87 @@
 from functools import wraps
 from contextvars import ContextVar
 from contextlib import contextmanager
-from typing import Any, Dict
+from typing import Any, Dict, Mapping, Optional
+from types import MappingProxyType
 import inspect
 
-_towel_context = ContextVar('towel_context', default={})
+class Intel(Mapping):
+    """
+    an immutable, persistent context: a new version is derived by layering new intel on top of an existing one,
+    all the versions share what is below them, nothing is ever copied or changed in place
+
+    so concurrent plans and threads never see each other's intel, and a version is released with its scope
+    lookups walk the layers, which are flattened once there are more than "max_depth" of them
+    """
+
+    max_depth = 8
+
+    __slots__ = ('layer', 'parent', 'depth', '_flat')
+
+    def __init__(self,
+                 layer: Mapping[str, Any] = MappingProxyType({}),
+                 parent: Optional["Intel"] = None):
+        self.layer = layer
+        self.parent = parent
+        self.depth: int = parent.depth + 1 if parent is not None else 1
+        self._flat: Optional[Dict[str, Any]] = None
+
+    def derive(self,
+               *layers: Mapping[str, Any]) -> "Intel":
+        "a new version with the layers on top: the last one wins, it is a version of its own even with nothing new in it"
+        version = self
+        for layer in layers:
+            if layer:
+                version = Intel(layer, version)
+        if version is self:
+            version = Intel(MappingProxyType({}), self)
+        if version.depth > Intel.max_depth:
+            version = Intel(version.flat())
+        return version
+
+    def flat(self) -> Dict[str, Any]:
+        if self._flat is None:
+            flat = self.parent.flat().copy() if self.parent is not None else {}
+            flat.update(self.layer)
+            self._flat = flat
+        return self._flat
+
+    def __getitem__(self, key):
+        version = self
+        while version is not None:
+            if key in version.layer:
+                return version.layer[key]
+            version = version.parent
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        version = self
+        while version is not None:
+            if key in version.layer:
+                return version.layer[key]
+            version = version.parent
+        return default
+
+    def __contains__(self, key):
+        version = self
+        while version is not None:
+            if key in version.layer:
+                return True
+            version = version.parent
+        return False
+
+    def __iter__(self):
+        return iter(self.flat())
+
+    def __len__(self):
+        return len(self.flat())
+
+    def __repr__(self):
+        return f"Intel({self.flat()})"
+
+_NO_INTEL = Intel()
+
+_towel_context: ContextVar[Intel] = ContextVar('towel_context', default=_NO_INTEL)
 
 def towel(llm=None,
           iam=None,
@@ -16,54 +93,97 @@ def towel(llm=None,
         # 'iam' to the function's fully qualified name if not provided
         whoami = iam if iam is not None else f"{func.__module__}.{func.__name__}"
 
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            context = _towel_context.get()
+        ## the call plan is made once here, instead of inspecting the function on every call
+        sig = inspect.signature(func)
+        params = tuple(sig.parameters)
+        positional = tuple(name for name, param in sig.parameters.items()
+                           if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD))
+        takes_var_positional = any(param.kind == param.VAR_POSITIONAL for param in sig.parameters.values())
+
+        def bind(args, kwargs):
+            outer = _towel_context.get()
 
-            # Update context with towel-specific items
-            context.update({
-                'llm': llm or context.get('llm'),
+            # a version of the context for this call, with towel-specific items
+            context = outer.derive({
+                'llm': llm or outer.get('llm'),
                 'iam': whoami,
-                'tools': tools or context.get('tools', []),
-                'prompts': prompts or context.get('prompts', {})
+                'tools': tools or outer.get('tools', []),
+                'prompts': prompts or outer.get('prompts', {})
             })
 
-            sig = inspect.signature(func)
-            context_args = {}
-
             # handle positional arguments: i.e. when towels used without a Guide / plan
-            bound_args = sig.bind_partial(*args)
-            context_args.update(bound_args.arguments)
+            if not args:
+                context_args = {}
+            elif len(args) <= len(positional) and not takes_var_positional:
+                context_args = dict(zip(positional, args))
+            else:
+                context_args = dict(sig.bind_partial(*args).arguments)
 
             # Only include arguments that are in the function signature
-            for param in sig.parameters:
+            for param in params:
                 if param in context:
                     context_args[param] = context[param]
 
             # Update with explicitly passed arguments
-            context_args.update(kwargs)
+            if kwargs:
+                context_args.update(kwargs)
+
+            return outer, context, context_args
 
-            result = func(**context_args)
+        def remember(outer, result):
 
-            # Update context with the result
+            # the result is remembered in the scope this towel was called from: i.e. an "intel" block, an outer towel,
+            # or the top level, where towels called one after another see each other's results
             if isinstance(result, dict):
-                context.update(result)
+                _towel_context.set(outer.derive(result))
             else:
-                context[func.__name__] = result
+                _towel_context.set(outer.derive({func.__name__: result}))
 
-            _towel_context.set(context)
+        if inspect.iscoroutinefunction(func):
+
+            ## async towels: the context lives in the task's contextvars, so concurrent tasks do not share it
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                outer, context, context_args = bind(args, kwargs)
+                token = _towel_context.set(context)
+                try:
+                    result = await func(**context_args)
+                finally:
+                    _towel_context.reset(token)
+                remember(outer, result)
+                return result
+
+            async_wrapper.__towel__ = {'iam': whoami, 'llm': llm, 'prompts': prompts}   # type: ignore
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            outer, context, context_args = bind(args, kwargs)
+            token = _towel_context.set(context)
+            try:
+                result = func(**context_args)
+            finally:
+                _towel_context.reset(token)
+            remember(outer, result)
             return result
+
+        wrapper.__towel__ = {'iam': whoami, 'llm': llm, 'prompts': prompts}   # type: ignore
         return wrapper
 
     # handle @towel used without parentheses
     if callable(llm):
-        return decorator(llm)
+        return towel()(llm)
 
     return decorator
 
 @contextmanager
-def intel(**kwargs):
-    token = _towel_context.set(_towel_context.get() | kwargs)
+def intel(*layers: Mapping[str, Any],
+          **kwargs):
+    """
+    derives a new version of the current context with the given intel on top: nothing is copied,
+    everything towels remember within this block is released when it ends
+    """
+    token = _towel_context.set(_towel_context.get().derive(*reversed(layers), kwargs))
     try:
         yield
     finally:
@@ -1,10 +1,23 @@
 from abc import ABC, abstractmethod
 import os
-from typing import Dict, Any, List, Optional, Union, Generator, Literal
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator, Iterable, Tuple, Callable, Awaitable, Literal, cast
 from pydantic import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
 import logging
-from towel.tools import squuid
+import copy
+import json
+import time
+import asyncio
+import itertools
+import weakref
+from functools import partial
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from collections.abc import Iterator, AsyncIterator
+from towel.tools import squuid, _retry_after
+import towel.memo as memo
 
 class TextThought(BaseModel):
     text: str
@@ -16,15 +29,516 @@ class ToolUseThought(BaseModel):
     input: Dict[str, Any]
     type: Literal["tool_use"] = "tool_use"
 
+class Usage(BaseModel):
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_tokens: Optional[int] = None      ## input tokens read from a provider's prompt cache
+    cache_write_tokens: Optional[int] = None     ## input tokens written to it
+
+    ## seconds
+    latency: Optional[float] = None              ## from asking to the whole thought (a stream read to the end), retries included
+    time_to_first_token: Optional[float] = None  ## streams
+    load_duration: Optional[float] = None        ## ollama: loading the model
+    prompt_eval_duration: Optional[float] = None ## ollama: prefill
+    eval_duration: Optional[float] = None        ## ollama: generating
+
+    attempts: int = 1
+    attempt_tokens: Optional[List[int]] = None   ## tokens every try took (its re-asks included), failed ones included
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        "output tokens per second of generating (or of the whole thought, when a provider does not tell)"
+        took = self.eval_duration or self.latency
+        if self.output_tokens and took:
+            return self.output_tokens / took
+        return None
+
+    def fill(self,
+             other: "Usage"):
+        "takes whatever \"other\" knows"
+        for field, value in other:
+            if value is not None and field in other.model_fields_set:
+                setattr(self, field, value)
+
+class Stream:
+    "chunks of a streamed thought: once it is read to the end, its usage is filled in"
+    def __init__(self,
+                 chunks: Iterator[str],
+                 usage: Optional[Usage] = None):
+        self.chunks = chunks
+        self.usage = usage if usage is not None else Usage()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self.chunks)
+
+    def close(self):
+        "a stream that is not going to be read to the end: whatever it holds (i.e. a provider's slot) is given back"
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+class AsyncStream:
+    def __init__(self,
+                 chunks: AsyncIterator[str],
+                 usage: Optional[Usage] = None):
+        self.chunks = chunks
+        self.usage = usage if usage is not None else Usage()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.chunks.__anext__()
+
+    async def aclose(self):
+        if hasattr(self.chunks, 'aclose'):
+            await self.chunks.aclose()
+
+def usage_of(thought: Any) -> Optional[Usage]:
+    "usage of any thought: a DeepThought, a stream, or a \"response_model\" instance"
+    if isinstance(thought, DeepThought):
+        return thought.usage
+    if isinstance(thought, (Stream, AsyncStream)):
+        return thought.usage
+    return getattr(thought, '_usage', None)
+
+def instructed(result: Any,
+               attempts: List[int],
+               calls: Optional[int] = None) -> Any:
+    """
+    a "response_model" instance with usage of all the attempts it took, as told by instructor's raw response
+    "attempts" are tokens of every try, "calls" to the model (instructor's re-asks included) when known
+    """
+    usage = _usage_of_raw(getattr(result, '_raw_response', None))
+    usage.attempts = calls or max(len(attempts), 1)
+    usage.attempt_tokens = attempts or None
+    result._usage = usage
+    return result
+
+def _usage_of_raw(response: Any) -> Usage:
+    "anthropic's (input / output tokens) or openai's (prompt / completion tokens) usage"
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return Usage()
+    return Usage(input_tokens=_either(usage, 'input_tokens', 'prompt_tokens'),
+                 output_tokens=_either(usage, 'output_tokens', 'completion_tokens'),
+                 cache_read_tokens=getattr(usage, 'cache_read_input_tokens', None),
+                 cache_write_tokens=getattr(usage, 'cache_creation_input_tokens', None))
+
+def _either(usage: Any,
+            *names: str) -> Optional[int]:
+    for name in names:
+        value = getattr(usage, name, None)
+        if value is not None:
+            return value
+    return None
+
+def _timed(thought: Any,
+           started: float) -> Any:
+    "puts latency (and time to first token of a stream) into a thought's usage"
+
+    if isinstance(thought, Stream):
+        def timed(chunks, usage):
+            for chunk in chunks:
+                if usage.time_to_first_token is None:
+                    usage.time_to_first_token = time.monotonic() - started
+                yield chunk
+            usage.latency = time.monotonic() - started
+        return Stream(timed(thought.chunks, thought.usage), thought.usage)
+
+    if isinstance(thought, AsyncStream):
+        async def atimed(chunks, usage):
+            async for chunk in chunks:
+                if usage.time_to_first_token is None:
+                    usage.time_to_first_token = time.monotonic() - started
+                yield chunk
+            usage.latency = time.monotonic() - started
+        return AsyncStream(atimed(thought.chunks, thought.usage), thought.usage)
+
+    if isinstance(thought, DeepThought):
+        if thought.usage is None:
+            thought.usage = Usage()
+        thought.usage.latency = time.monotonic() - started
+    elif isinstance(thought, BaseModel):
+        usage = getattr(thought, '_usage', None) or Usage()
+        usage.latency = time.monotonic() - started
+        setattr(thought, '_usage', usage)      ## a "response_model" has no "_usage" field of its own
+
+    return thought
+
 class DeepThought(BaseModel):
     id: str
     content: List[Union[TextThought, ToolUseThought]]
     tokens_used: Optional[int] = None
     model: str
     stop_reason: str
+    usage: Optional[Usage] = None
+
+## concurrent "think"s per provider (i.e. "ollama", "claude") for the whole process
+_provider_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+def limit_concurrency(provider: str,
+                      max_concurrent: int):
+    "at most \"max_concurrent\" brains of this provider think at the same time, so a single server is not saturated"
+    _provider_limits[provider.lower()] = threading.BoundedSemaphore(max_concurrent)
+
+## concurrent "think"s per provider of a single batch (see thinker.plan_many): instead of the process ones, for its runs only
+_batch_limits: ContextVar[Optional[Dict[str, threading.BoundedSemaphore]]] = ContextVar('batch_limits', default=None)
+
+def _limit_of(provider: str) -> Optional[threading.BoundedSemaphore]:
+    batch = _batch_limits.get()
+    if batch and provider in batch:
+        return batch[provider]
+    return _provider_limits.get(provider)
+
+async def _acquire(limit: threading.BoundedSemaphore):
+    "a provider limit is shared with sync brains, waiting on it must not hold a worker thread that thinking needs"
+    wait = 0.005
+    while not limit.acquire(blocking=False):
+        await asyncio.sleep(wait)
+        wait = min(wait * 2, 0.1)
+
+class RateLimit:
+    """
+    a token bucket of requests and (LLM) tokens per minute:
+    it refills continuously, and a thought takes a request and its estimated tokens out of it before it is thought
+    """
+    def __init__(self,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = float(requests_per_minute or 0)
+        self.tokens = float(tokens_per_minute or 0)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.refilled_at
+        self.refilled_at = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def try_take(self,
+                 tokens: int) -> float:
+        "takes a request and its tokens, or tells how many seconds to wait before they are there"
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+
+            tokens = min(tokens, self.tpm) if self.tpm else 0    ## a thought bigger than a minute worth of tokens waits for a full bucket
+            wait = 0.0
+            if self.rpm and self.requests < 1:
+                wait = (1 - self.requests) * 60 / self.rpm
+            if self.tpm and self.tokens < tokens:
+                wait = max(wait, (tokens - self.tokens) * 60 / self.tpm)
+            if wait:
+                return wait
+
+            if self.rpm:
+                self.requests -= 1
+            self.tokens -= tokens
+            return 0.0
+
+    def take(self,
+             tokens: int):
+        while (wait := self.try_take(tokens)):
+            time.sleep(wait)
+
+    async def atake(self,
+                    tokens: int):
+        while (wait := self.try_take(tokens)):
+            await asyncio.sleep(wait)
+
+    def settle(self,
+               estimated: int,
+               used: int):
+        "gives back tokens that were estimated but not used, or takes the ones that were used over the estimate"
+        if self.tpm:
+            with self.lock:
+                self.tokens = min(self.tpm, self.tokens + min(estimated, self.tpm) - used)
+
+    def pause(self,
+              seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+## requests / tokens per minute per provider for the whole process
+_provider_rates: Dict[str, RateLimit] = {}
+
+_RATE_RETRIES = 3              ## times a thought is retried after a provider asks to "retry-after"
+_DEFAULT_MAX_TOKENS = 1024     ## estimated response tokens when "max_tokens" is not given
+
+def rate_limit(provider: str,
+               requests_per_minute: Optional[int] = None,
+               tokens_per_minute: Optional[int] = None):
+    "brains of this provider think at most at this rate, i.e. the provider's actual rate limits, so they are not met with 429s"
+    _provider_rates[provider.lower()] = RateLimit(requests_per_minute, tokens_per_minute)
+
+class _Estimate:
+    "tokens a thought is expected to take: ~4 characters per token of what is asked + at most what could be answered"
+    def __init__(self,
+                 messages: Union[List[Dict[str, str]], str],
+                 max_tokens: Optional[int]):
+        text = messages if isinstance(messages, str) else json.dumps(messages, default=str)
+        self.asked = len(text) // 4
+        self.tokens = self.asked + (max_tokens or _DEFAULT_MAX_TOKENS)
+
+    def used(self,
+             thought: Any) -> int:
+        if isinstance(thought, DeepThought) and thought.tokens_used:
+            return self.asked + thought.tokens_used
+        usage = usage_of(thought)
+        if usage is not None and usage.output_tokens:
+            return (usage.input_tokens or self.asked) + usage.output_tokens
+        return self.tokens
+
+def _wake(woken: asyncio.Future):
+    if not woken.done():
+        woken.set_result(None)
+
+class _Server:
+    "which model a server is thinking with, and who waits to think with which model"
+    def __init__(self):
+        self.active: Optional[str] = None
+        self.since = 0.0
+        self.running = 0
+        self.waiting: Dict[str, int] = {}
+
+class ModelTurns:
+    """
+    thoughts (of many plans) that share a server take turns by model:
+    while a model is thinking, thoughts for other models wait
+
+    a turn goes to the model with the most thoughts waiting, once the thinking model has no thoughts left,
+    or once it has been thinking for "max_hold" seconds while others wait
+    """
+    def __init__(self,
+                 max_hold: float = 30):
+        self.max_hold = max_hold
+        self.servers: Dict[Any, _Server] = {}
+        self.switches = 0
+        self.lock = threading.Condition()
+        self.awaiting: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []   ## "atake"s to wake up
+
+    def _admit(self,
+               server: _Server,
+               model: str) -> bool:
+
+        now = time.monotonic()
+        held_out = now - server.since > self.max_hold
+
+        if server.active == model:
+            others = any(n for m, n in server.waiting.items() if m != model)
+            if held_out and others:
+                return False                       ## let the others have a turn
+        else:
+            if server.running:
+                return False
+            wanted = {m: n for m, n in server.waiting.items()
+                      if n and (m != server.active or not held_out)}
+            if server.active in wanted:
+                return False                       ## the thinking model still has thoughts to think
+            if max(wanted, key=lambda m: wanted[m]) != model:
+                return False
+            if server.active is not None:
+                self.switches += 1
+            server.active, server.since = model, now
+
+        server.running += 1
+        return True
+
+    def _hold_left(self,
+                   server: _Server) -> Optional[float]:
+        "a hold could run out without anyone leaving: a waiter looks again once it does"
+        left = server.since + self.max_hold - time.monotonic()
+        return max(left, 0) + 0.001 if server.active is not None else None
+
+    def _enter(self,
+               key: Any,
+               model: str) -> _Server:
+        server = self.servers.setdefault(key, _Server())
+        server.waiting[model] = server.waiting.get(model, 0) + 1
+        return server
+
+    def _took(self,
+              server: _Server,
+              model: str) -> _Server:
+        server.waiting[model] -= 1
+        self._notify()                             ## a turn might have just changed hands
+        return server
+
+    def _notify(self):
+        self.lock.notify_all()
+        awaiting, self.awaiting = self.awaiting, []
+        for loop, woken in awaiting:
+            loop.call_soon_threadsafe(_wake, woken)
+
+    def take(self,
+             key: Any,
+             model: str) -> _Server:
+        "waits for a model's turn on a server: the turn is held until it is left"
+        with self.lock:
+            server = self._enter(key, model)
+            while not self._admit(server, model):
+                self.lock.wait(timeout=self._hold_left(server))
+            return self._took(server, model)
+
+    async def atake(self,
+                    key: Any,
+                    model: str) -> _Server:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            server = self._enter(key, model)
+        while True:
+            with self.lock:
+                if self._admit(server, model):
+                    return self._took(server, model)
+                woken = loop.create_future()
+                self.awaiting.append((loop, woken))
+                hold_left = self._hold_left(server)
+            try:
+                await asyncio.wait_for(woken, hold_left)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self.lock:
+                    server.waiting[model] -= 1     ## no longer waiting for a turn
+                    self._notify()
+                raise
+
+    def leave(self,
+              server: _Server):
+        with self.lock:
+            server.running -= 1
+            self._notify()
+
+_model_turns: ContextVar[Optional[ModelTurns]] = ContextVar('model_turns', default=None)
+
+class _Held:
+    """
+    what a thought holds while it is thought: a model's turn, a provider's concurrency slot, its rate limit estimate
+    a streamed thought holds them until it is read to the end, closed or dropped, everything else until it is back
+    """
+    def __init__(self):
+        self.releases: List[Callable[[], Any]] = []
+        self.lock = threading.Lock()
+
+    def hold(self,
+             release: Callable[[], Any]):
+        self.releases.append(release)
+
+    def release(self):
+        with self.lock:
+            releases, self.releases = self.releases, []
+        for release in reversed(releases):
+            release()
+
+def _holding(thought: Any,
+             held: _Held) -> Any:
+    "a thought that gives back what it holds once it is done"
+
+    if isinstance(thought, Stream):
+        def chunks(chunks):
+            try:
+                yield from chunks
+            finally:
+                held.release()
+        holding = chunks(thought.chunks)
+        weakref.finalize(holding, held.release)       ## a stream that was never read
+        return Stream(holding, thought.usage)
+
+    if isinstance(thought, AsyncStream):
+        async def achunks(chunks):
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                held.release()
+        aholding = achunks(thought.chunks)
+        weakref.finalize(aholding, held.release)
+        return AsyncStream(aholding, thought.usage)
+
+    held.release()
+    return thought
+
+class TokenMeter:
+    "tokens used by all the brains that think within a \"metered\" block: i.e. a plan"
+    def __init__(self,
+                 parent: Optional["TokenMeter"] = None):
+        self.tokens = 0
+        self.parent = parent
+        self.lock = threading.Lock()
+
+    def add(self,
+            tokens: int):
+        with self.lock:
+            self.tokens += tokens
+        if self.parent:
+            self.parent.add(tokens)
+
+_token_meter: ContextVar[Optional[TokenMeter]] = ContextVar('token_meter', default=None)
+
+@contextmanager
+def metered() -> Generator[TokenMeter, None, None]:
+    meter = TokenMeter(parent=_token_meter.get())
+    token = _token_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _token_meter.reset(token)
+
+class Replay:
+    "chunks of a remembered stream, and its usage"
+    def __init__(self,
+                 chunks: List[str],
+                 usage: Optional[Usage] = None):
+        self.chunks = chunks
+        self.usage = usage
+
+def _as_asked(thought: Any,
+              response_model: Any) -> Any:
+    """
+    instructor (and "repairing") answer with a subclass of "response_model" made on the fly, that can not be pickled:
+    i.e. remembered by a SqliteCache or journaled by a checkpoint. it is made the "response_model" it was asked for
+    """
+    if response_model is None or type(thought) is response_model or not isinstance(thought, response_model):
+        return thought
+    asked = response_model.model_construct(_fields_set=thought.model_fields_set, **dict(thought))
+    asked.__dict__.update({name: value for name, value in vars(thought).items() if name.startswith("_")})   ## its usage, raw response
+    return asked
+
+def _is_error(thought: Any) -> bool:
+    return isinstance(thought, DeepThought) and thought.stop_reason == "error"
+
+def _copied(thought: Any) -> Any:
+    "a remembered thought is not shared with whoever changes what they got back"
+    return thought.model_copy(deep=True) if isinstance(thought, BaseModel) else copy.deepcopy(thought)
+
+def _replay(thought: Any) -> Any:
+    if isinstance(thought, Replay):
+        return Stream(iter(list(thought.chunks)), _copied(thought.usage))
+    return _copied(thought)
+
+def _replay_async(thought: Any) -> Any:
+    if isinstance(thought, Replay):
+        async def replaying():
+            for chunk in thought.chunks:
+                yield chunk
+        return AsyncStream(replaying(), _copied(thought.usage))
+    return _copied(thought)
 
 class Brain(ABC):
 
+    memo = None    ## a store of thoughts, see "cache"
+
     def __init__(self,
                  api_key: Optional[str] = None,
                  model: Optional[str] = None):
@@ -38,6 +552,20 @@ class Brain(ABC):
         self.api_key = api_key
         self.model = model
 
+    def provider(self) -> str:
+        return self.__class__.__name__.lower()
+
+    def cache(self,
+              store=None):
+        """
+        a thought is looked up instead of thinking it again,
+        when the model, messages, sampling params, tools and the response model are all the same
+
+        streamed thoughts are recorded as they are read, and replayed chunk by chunk
+        """
+        self.memo = store or memo.default_cache
+        return self
+
     def __str__(self):
         if hasattr(self, 'model'):
             return f"{self.__class__.__name__} 🧠 {self.model} ✅"
@@ -55,7 +583,222 @@ class Brain(ABC):
               tools: Optional[List[Dict[str, Any]]] = None,
               tool_choice: Optional[str] = None,
               response_model: Optional[BaseModel] = None,
-              **kwargs) -> Union[Dict[str, Any], DeepThought, Generator[str, None, None]]:
+              **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+
+        messages = self._to_messages(messages, prompt, model)
+
+        key = None
+        if self.memo is not None:
+            key = self._thought_key(messages, stream, model, max_tokens, context_window,
+                                    temperature, tools, tool_choice, response_model, kwargs)
+        if key is not None:
+            hit, thought = self.memo.get(key)
+            if hit:
+                return _replay(thought)
+
+        held = _Held()
+        try:
+            started = time.monotonic()
+            self._turn(model or self.model, held)
+            thought = self._paced(lambda: self._think(messages,
+                                                      stream,
+                                                      model or self.model,
+                                                      max_tokens,
+                                                      context_window,
+                                                      temperature,
+                                                      tools,
+                                                      tool_choice,
+                                                      response_model,
+                                                      **kwargs),
+                                  lambda: _Estimate(messages, max_tokens),
+                                  held)
+
+            return self._remember(key, self._metered(_timed(_holding(_as_asked(thought, response_model), held), started)))
+
+        except Exception as e:
+            held.release()
+            return self._to_error_thought(e, model, response_model)
+
+    async def athink(self,
+                     messages: Optional[Union[List[Dict[str, str]], str]] = None,
+                     stream: Optional[bool] = False,
+                     prompt: Optional[str] = None,
+                     model: Optional[str] = None,
+                     max_tokens: Optional[int] = None,
+                     context_window: Optional[int] = None,
+                     temperature: Optional[float] = None,
+                     tools: Optional[List[Dict[str, Any]]] = None,
+                     tool_choice: Optional[str] = None,
+                     response_model: Optional[BaseModel] = None,
+                     **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+        "same as \"think\", but awaited: a stream is an async generator"
+
+        messages = self._to_messages(messages, prompt, model)
+
+        key = None
+        if self.memo is not None:
+            key = self._thought_key(messages, stream, model, max_tokens, context_window,
+                                    temperature, tools, tool_choice, response_model, kwargs)
+        if key is not None:
+            hit, thought = self.memo.get(key)
+            if hit:
+                return _replay_async(thought)
+
+        held = _Held()
+        try:
+            started = time.monotonic()
+            await self._aturn(model or self.model, held)
+            thought = await self._apaced(lambda: self._athink(messages,
+                                                              stream,
+                                                              model or self.model,
+                                                              max_tokens,
+                                                              context_window,
+                                                              temperature,
+                                                              tools,
+                                                              tool_choice,
+                                                              response_model,
+                                                              **kwargs),
+                                         lambda: _Estimate(messages, max_tokens),
+                                         held)
+
+            return self._remember_async(key, self._metered(_timed(_holding(_as_asked(thought, response_model), held), started)))
+
+        except Exception as e:
+            held.release()
+            return self._to_error_thought(e, model, response_model)
+
+    def think_many(self,
+                   prompts: Iterable[Union[List[Dict[str, str]], str]],
+                   max_concurrency: int = 8,
+                   **kwargs) -> Generator[Tuple[int, Any], None, None]:
+        """
+        thinks of all the prompts (or messages) at once, at most "max_concurrency" at a time,
+        paced by the provider's rate limit (see "rate_limit")
+
+        thoughts are yielded as "(index, thought)" as they come (not in the prompts order)
+        """
+
+        pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        try:
+            futures = {pool.submit(copy_context().run, partial(self.think, prompt, **kwargs)): index
+                       for index, prompt in enumerate(prompts)}
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def server(self) -> Any:
+        "the server that loads models to think: thoughts of a server take turns by model in a plan batch (see ModelTurns)"
+        return None
+
+    def _turn(self,
+              model: str,
+              held: _Held):
+        "takes the model's turn on its server for the whole thought, when thoughts take turns (see ModelTurns)"
+        turns = _model_turns.get()
+        server = self.server()
+        if turns is None or server is None:
+            return
+        taken = turns.take(server, model)
+        held.hold(lambda: turns.leave(taken))
+
+    async def _aturn(self,
+                     model: str,
+                     held: _Held):
+        turns = _model_turns.get()
+        server = self.server()
+        if turns is None or server is None:
+            return
+        taken = await turns.atake(server, model)
+        held.hold(lambda: turns.leave(taken))
+
+    def _paced(self,
+               think: Callable[[], Any],
+               estimated: Callable[[], "_Estimate"],
+               held: _Held) -> Any:
+        """
+        thinks within the provider's concurrency and rate limits, waiting out its "retry-after"s
+        the concurrency slot and the estimate are held by the thought (see _Held), so a stream keeps them while it is read
+        a thought is only "estimated" when its provider has rate limits
+        """
+
+        rate = _provider_rates.get(self.provider())
+        limit = _limit_of(self.provider())
+        estimate = estimated() if rate else None
+
+        for attempt in itertools.count():
+            if rate and estimate:
+                rate.take(estimate.tokens)
+            if limit:
+                limit.acquire()
+            try:
+                thought = think()
+            except Exception as e:
+                if limit:
+                    limit.release()
+                wait = _retry_after(e)
+                if wait is None or attempt >= _RATE_RETRIES:
+                    raise
+                self.logger.warning(f"{self.provider()} asked to retry after {wait}s")
+                if rate and estimate:
+                    rate.settle(estimate.tokens, 0)
+                    rate.pause(wait)       ## all the thoughts of this provider wait it out
+                else:
+                    time.sleep(wait)
+                continue
+
+            self._hold(thought, estimate, held, rate, limit)
+            return thought
+
+    async def _apaced(self,
+                      think: Callable[[], Awaitable[Any]],
+                      estimated: Callable[[], "_Estimate"],
+                      held: _Held) -> Any:
+
+        rate = _provider_rates.get(self.provider())
+        limit = _limit_of(self.provider())
+        estimate = estimated() if rate else None
+
+        for attempt in itertools.count():
+            if rate and estimate:
+                await rate.atake(estimate.tokens)
+            if limit:
+                await _acquire(limit)
+            try:
+                thought = await think()
+            except Exception as e:
+                if limit:
+                    limit.release()
+                wait = _retry_after(e)
+                if wait is None or attempt >= _RATE_RETRIES:
+                    raise
+                self.logger.warning(f"{self.provider()} asked to retry after {wait}s")
+                if rate and estimate:
+                    rate.settle(estimate.tokens, 0)
+                    rate.pause(wait)
+                else:
+                    await asyncio.sleep(wait)
+                continue
+
+            self._hold(thought, estimate, held, rate, limit)
+            return thought
+
+    def _hold(self,
+              thought: Any,
+              estimate: Optional["_Estimate"],
+              held: _Held,
+              rate: Optional[RateLimit],
+              limit: Optional[threading.BoundedSemaphore]):
+        if limit:
+            held.hold(limit.release)
+        if rate and estimate:
+            held.hold(lambda: rate.settle(estimate.tokens, estimate.used(thought)))   ## a stream's usage is known once it is read
+
+    def _to_messages(self,
+                     messages: Optional[Union[List[Dict[str, str]], str]],
+                     prompt: Optional[str],
+                     model: Optional[str]) -> Union[List[Dict[str, str]], str]:
 
         if not model and not self.model:
             raise ValueError("\"model\" is missing, and must be specified either in the constructor or when calling \"think\"")
@@ -67,43 +810,127 @@ class Brain(ABC):
         elif not messages:
             raise ValueError("either 'messages' or 'prompt' must be provided.")
 
+        return messages
+
+    def _thought_key(self,
+                     messages: Union[List[Dict[str, str]], str],
+                     stream: bool,
+                     model: Optional[str],
+                     max_tokens: Optional[int],
+                     context_window: Optional[int],
+                     temperature: Optional[float],
+                     tools: Optional[List[Dict[str, Any]]],
+                     tool_choice: Optional[str],
+                     response_model: Optional[BaseModel],
+                     kwargs: Dict[str, Any]) -> Optional[str]:
+        "a key to remember a thought by, or None when some of what goes into it has no stable form"
+
+        if kwargs.get('session') is not None:
+            return None    ## a session thought moves its session along, a remembered one would not
+
         try:
-            return self._think(messages,
-                               stream,
-                               model or self.model,
-                               max_tokens,
-                               context_window,
-                               temperature,
-                               tools,
-                               tool_choice,
-                               response_model,
-                               **kwargs)
-
-        except ValidationError as e:
+            return memo.thought_key(self.provider(),
+                                    model or self.model,
+                                    messages,
+                                    bool(stream),
+                                    {"max_tokens": max_tokens,
+                                     "context_window": context_window,
+                                     "temperature": temperature,
+                                     "tools": tools,
+                                     "tool_choice": tool_choice,
+                                     **kwargs},
+                                    response_model)
+        except TypeError as e:
+            self.logger.warning(f"this thought is not cached: {e}")
+            return None
 
-            error = f"model response could not load into a specified pydantic type {response_model.__name__ if response_model else ''}\n"
-            self.logger.error(error)
+    def _remember(self,
+                  key: Optional[str],
+                  thought: Any) -> Any:
 
-            error_thought = TextThought(text=f"{error} due to: {e}")
-            return DeepThought(
-                id = str(squuid()),
-                content=[error_thought],
-                model=model or self.model,
-                stop_reason="error"
-            )
+        if key is None or _is_error(thought):
+            return thought
 
-        except Exception as e:
+        if isinstance(thought, Iterator):
+            def recording():
+                chunks = []
+                for chunk in thought:
+                    chunks.append(chunk)
+                    yield chunk
+                self.memo.put(key, Replay(chunks, usage_of(thought)))    ## only a stream that was read to the end is remembered
+            return Stream(recording(), usage_of(thought))
+
+        self.memo.put(key, thought)
+        return _copied(thought)
 
+    def _remember_async(self,
+                        key: Optional[str],
+                        thought: Any) -> Any:
+
+        if key is None or _is_error(thought):
+            return thought
+
+        if isinstance(thought, AsyncIterator):
+            async def recording():
+                chunks = []
+                async for chunk in thought:
+                    chunks.append(chunk)
+                    yield chunk
+                self.memo.put(key, Replay(chunks, usage_of(thought)))
+            return AsyncStream(recording(), usage_of(thought))
+
+        self.memo.put(key, thought)
+        return _copied(thought)
+
+    def _metered(self,
+                 thought: Any) -> Any:
+
+        meter = _token_meter.get()
+        if not meter:
+            return thought
+
+        if isinstance(thought, Stream):                  ## once it is read to the end
+            def chunks(chunks, usage):
+                yield from chunks
+                meter.add(usage.output_tokens or 0)
+            return Stream(chunks(thought.chunks, thought.usage), thought.usage)
+
+        if isinstance(thought, AsyncStream):
+            async def achunks(chunks, usage):
+                async for chunk in chunks:
+                    yield chunk
+                meter.add(usage.output_tokens or 0)
+            return AsyncStream(achunks(thought.chunks, thought.usage), thought.usage)
+
+        if isinstance(thought, DeepThought):
+            tokens = thought.tokens_used
+        else:                                            ## a "response_model" instance
+            usage = usage_of(thought)
+            tokens = usage.output_tokens if usage else None
+        if tokens:
+            meter.add(tokens)
+
+        return thought
+
+    def _to_error_thought(self,
+                          e: Exception,
+                          model: Optional[str],
+                          response_model: Optional[BaseModel]) -> DeepThought:
+
+        if isinstance(e, ValidationError):
+            error = f"model response could not load into a specified pydantic type {response_model.__name__ if response_model else ''}\n"
+            self.logger.error(error)
+        else:
             error = "could not get a successful model's response"
             self.logger.error(f"{error} due to {e.__cause__ or e}\n")
 
-            error_thought = TextThought(text=f"{error} due to: {e}")
-            return DeepThought(
-                id = str(squuid()),
-                content=[error_thought],
-                model=model or self.model,
-                stop_reason="error"
-            )
+        error_thought = TextThought(text=f"{error} due to: {e}")
+        return DeepThought(
+            id = str(squuid()),
+            content=[error_thought],
+            model=model or self.model,
+            stop_reason="error"
+        )
 
     @abstractmethod
     def _think(self,
@@ -116,9 +943,42 @@ class Brain(ABC):
                tools: Optional[List[Dict[str, Any]]],
                tool_choice: Optional[str],
                response_model: Optional[BaseModel],
-               **kwargs) -> Union[Dict[str, Any], DeepThought, Generator[str, None, None]]:
+               **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
         pass
 
+    async def _athink(self,
+                      messages: Union[List[Dict[str, str]] | str],
+                      stream: bool,
+                      model: str,
+                      max_tokens: Optional[int],
+                      context_window: Optional[int],
+                      temperature: Optional[float],
+                      tools: Optional[List[Dict[str, Any]]],
+                      tool_choice: Optional[str],
+                      response_model: Optional[BaseModel],
+                      **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+        "brains without a native async client think in a worker thread"
+
+        thought = await asyncio.to_thread(self._think,
+                                          messages,
+                                          stream,
+                                          model,
+                                          max_tokens,
+                                          context_window,
+                                          temperature,
+                                          tools,
+                                          tool_choice,
+                                          response_model,
+                                          **kwargs)
+        if not stream:
+            return cast(Union[Dict[str, Any], DeepThought], thought)
+
+        async def response_generator():
+            chunks = iter(thought)
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                yield chunk
+        return AsyncStream(response_generator(), usage_of(thought))
+
     @abstractmethod
     def _to_deep_thought(self,
                          response) -> DeepThought:
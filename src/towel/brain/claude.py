@@ -1,18 +1,33 @@
 import time
-from typing import Dict, Any, List, Optional, Union, Generator
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator, Tuple
 
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from pydantic import BaseModel
 import instructor
 
-from .base import Brain, DeepThought, TextThought, ToolUseThought
-from towel.tools import with_retry
+from .base import Brain, DeepThought, TextThought, ToolUseThought, Usage, Stream, AsyncStream, instructed, _usage_of_raw
+from towel.tools import with_retry, with_retry_async, retry_params
 
 class Claude(Brain):
 
     def __init__(self,
                  api_key: Optional[str] = None,
-                 model: Optional[str] = None):
+                 model: Optional[str] = None,
+                 prompt_cache: Optional[Union[bool, str]] = "auto"):
+        """
+        "prompt_cache" marks prompt prefixes (tools, system, leading message blocks) to be cached by Anthropic:
+
+            "auto"  once a prefix (as long as Anthropic would cache) is seen again (default)
+            True    always
+            False   never
+
+        and could be changed for a single thought with "think(..., cache=...)"
+        """
 
         super().__init__(api_key, model)
 
@@ -24,6 +39,21 @@ class Claude(Brain):
 
         self.model = model
 
+        self.prompt_cache = prompt_cache
+        self.seen_prefixes: OrderedDict = OrderedDict()    ## prefix hash => None, the most recently seen last
+        self.lock = threading.Lock()
+
+    ## for "athink", made when first needed
+    @cached_property
+    def aclient(self) -> AsyncAnthropic:
+        return AsyncAnthropic(api_key=self.api_key)
+
+    @cached_property
+    def aiclient(self):
+        return instructor.from_anthropic(
+                self.aclient,
+                mode=instructor.Mode.ANTHROPIC_JSON)
+
     def _to_deep_thought(self,
                          response) -> DeepThought:
 
@@ -52,24 +82,82 @@ class Claude(Brain):
                            content=content,
                            tokens_used=tokens_used,
                            model=getattr(response, 'model', ''),
-                           stop_reason=getattr(response, 'stop_reason', ''))
+                           stop_reason=getattr(response, 'stop_reason', ''),
+                           usage=_usage_of_raw(response) if usage else None)
 
-    def _think(self,
-               messages: Union[List[Dict[str, str]] | str],
-               stream: bool,
-               model: Optional[str] = None,
-               max_tokens: Optional[int] = None,
-               context_window: Optional[int] = None,
-               temperature: Optional[float] = None,
-               tools: Optional[List[Dict[str, Any]]] = None,
-               tool_choice: Optional[str] = None,
-               response_model: Optional[BaseModel] = None,
-               **kwargs) -> Union[Dict[str, Any], DeepThought, Generator[str, None, None]]:
+    def _seen(self,
+              prefix: str) -> bool:
+        "whether a prompt prefix was seen before, it is remembered either way"
+        with self.lock:
+            seen = prefix in self.seen_prefixes
+            self.seen_prefixes[prefix] = None
+            self.seen_prefixes.move_to_end(prefix)
+            if len(self.seen_prefixes) > _MAX_SEEN_PREFIXES:
+                self.seen_prefixes.popitem(last=False)
+            return seen
+
+    def _mark_cached(self,
+                     api_kwargs: Dict[str, Any],
+                     auto: bool):
+        """
+        puts cache breakpoints at the end of tools, system and leading message blocks (all but the last one)
+        every breakpoint caches everything before it as well, so a prefix is hashed with everything that comes before it
+        "auto" only hashes a prefix once it is long enough for Anthropic to cache: shorter ones are not marked
+
+        a "system" of a structured thought is left a string: instructor adds its JSON instructions to it as to a string
+        """
+        prefix = hashlib.sha256()
+        size = 0
+        unhashed: List[Any] = []
+
+        def worth_it(part) -> bool:
+            nonlocal size
+            if not auto:
+                return True
+            size += _size(part)
+            unhashed.append(part)
+            if size < _MIN_CACHEABLE_CHARS:
+                return False
+            for earlier in unhashed:
+                prefix.update(json.dumps(earlier, sort_keys=True, default=str).encode('utf-8'))
+            unhashed.clear()
+            return self._seen(prefix.hexdigest())
+
+        tools = api_kwargs.get("tools")
+        if tools and worth_it(tools):
+            api_kwargs["tools"] = [*tools[:-1], {**tools[-1], "cache_control": _EPHEMERAL}]
+
+        system = api_kwargs.get("system")
+        if system and worth_it(system) and "response_model" not in api_kwargs:
+            blocks = [{"type": "text", "text": system}] if isinstance(system, str) else list(system)
+            api_kwargs["system"] = [*blocks[:-1], {**blocks[-1], "cache_control": _EPHEMERAL}]
+
+        messages = api_kwargs["messages"]
+        at = [(i, j) for i, message in enumerate(messages)
+                     for j in range(len(message["content"]) if isinstance(message["content"], list) else 1)]
+        if len(at) > 1:
+            i, j = at[-2]                      ## the last leading block
+            if worth_it([*messages[:i], _leading(messages[i], j)]):
+                api_kwargs["messages"] = [*messages[:i], _with_breakpoint(messages[i], j), *messages[i + 1:]]
+
+    def _to_api_kwargs(self,
+                       messages: Union[List[Dict[str, str]] | str],
+                       stream: bool,
+                       model: Optional[str] = None,
+                       max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None,
+                       tools: Optional[List[Dict[str, Any]]] = None,
+                       tool_choice: Optional[str] = None,
+                       response_model: Optional[BaseModel] = None,
+                       **kwargs) -> Tuple[Dict[str, Any], Dict[str, Any]]:
 
         ## think super method allows a simple "prompt" arg which could be just a string
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
 
+        cache = kwargs.pop('cache', self.prompt_cache)
+        retrying = retry_params(kwargs)
+
         api_kwargs = {
             "model": model,
             "messages": messages,
@@ -88,30 +176,133 @@ class Claude(Brain):
         if tool_choice:
             api_kwargs["tool_choice"] = tool_choice
 
-        max_retries = kwargs.pop('max_retries', 5)  ## non instructor retries
-
         if response_model:
             api_kwargs["response_model"] = response_model
+        else:
+            api_kwargs["stream"] = stream
+
+        if cache:
+            self._mark_cached(api_kwargs, auto=(cache == "auto"))
 
+        return api_kwargs, retrying
 
+    def _think(self,
+               messages: Union[List[Dict[str, str]] | str],
+               stream: bool,
+               model: Optional[str] = None,
+               max_tokens: Optional[int] = None,
+               context_window: Optional[int] = None,
+               temperature: Optional[float] = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[str] = None,
+               response_model: Optional[BaseModel] = None,
+               **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+
+        api_kwargs, retrying = self._to_api_kwargs(messages, stream, model, max_tokens, temperature,
+                                                   tools, tool_choice, response_model, **kwargs)
+
+        if response_model:
+            attempts = []
             response = with_retry(self.iclient,
                                   api_kwargs,
-                                  config={"max_attempts": max_retries})
+                                  attempts=attempts,
+                                  **retrying)
             # response = self.iclient.messages.create(**api_kwargs)
 
-            return response
+            return instructed(response, attempts, retrying["budget"].attempts)
         else:
-            api_kwargs["stream"] = stream
             if stream:
+                usage = Usage()
                 def response_generator():
                     for chunk in self.client.messages.create(**api_kwargs):
-                        if hasattr(chunk, 'delta') and hasattr(chunk.delta, 'text'):
-                            yield chunk.delta.text
-                        elif hasattr(chunk, 'delta') and hasattr(chunk.delta, 'content'):
-                            yield chunk.delta.content
-                        elif hasattr(chunk, 'content'):
-                            yield chunk.content
-                return response_generator()
+                        _count_chunk(usage, chunk)
+                        text = _chunk_text(chunk)
+                        if text is not None:
+                            yield text
+                return Stream(response_generator(), usage)
             else:
                 response = self.client.messages.create(**api_kwargs)
                 return self._to_deep_thought(response)
+
+    async def _athink(self,
+                      messages: Union[List[Dict[str, str]] | str],
+                      stream: bool,
+                      model: Optional[str] = None,
+                      max_tokens: Optional[int] = None,
+                      context_window: Optional[int] = None,
+                      temperature: Optional[float] = None,
+                      tools: Optional[List[Dict[str, Any]]] = None,
+                      tool_choice: Optional[str] = None,
+                      response_model: Optional[BaseModel] = None,
+                      **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+
+        api_kwargs, retrying = self._to_api_kwargs(messages, stream, model, max_tokens, temperature,
+                                                   tools, tool_choice, response_model, **kwargs)
+
+        if response_model:
+            attempts = []
+            response = await with_retry_async(self.aiclient,
+                                              api_kwargs,
+                                              attempts=attempts,
+                                              **retrying)
+            return instructed(response, attempts, retrying["budget"].attempts)
+        else:
+            if stream:
+                usage = Usage()
+                async def response_generator():
+                    async for chunk in await self.aclient.messages.create(**api_kwargs):
+                        _count_chunk(usage, chunk)
+                        text = _chunk_text(chunk)
+                        if text is not None:
+                            yield text
+                return AsyncStream(response_generator(), usage)
+            else:
+                response = await self.aclient.messages.create(**api_kwargs)
+                return self._to_deep_thought(response)
+
+_EPHEMERAL = {"type": "ephemeral"}
+_MAX_SEEN_PREFIXES = 1024
+_MIN_CACHEABLE_CHARS = 4096     ## ~1024 tokens: Anthropic does not cache shorter prefixes
+
+def _size(part: Any) -> int:
+    "characters of a prompt part: cheaper to tell than to hash it"
+    if isinstance(part, str):
+        return len(part)
+    if isinstance(part, dict):
+        return sum(_size(value) for value in part.values())
+    if isinstance(part, (list, tuple)):
+        return sum(_size(value) for value in part)
+    return 0
+
+def _blocks(message: Dict[str, Any]) -> List[Any]:
+    content = message["content"]
+    return list(content) if isinstance(content, list) else [{"type": "text", "text": content}]
+
+def _leading(message: Dict[str, Any],
+             upto: int) -> Dict[str, Any]:
+    return {**message, "content": _blocks(message)[:upto + 1]}
+
+def _with_breakpoint(message: Dict[str, Any],
+                     at: int) -> Dict[str, Any]:
+    blocks = _blocks(message)
+    block = blocks[at] if isinstance(blocks[at], dict) else {"type": "text", "text": str(blocks[at])}
+    blocks[at] = {**block, "cache_control": _EPHEMERAL}
+    return {**message, "content": blocks}
+
+def _count_chunk(usage: Usage,
+                 chunk):
+    "a stream tells its input tokens when it starts, and its output tokens as it goes"
+    kind = getattr(chunk, 'type', None)
+    if kind == 'message_start' and getattr(chunk.message, 'usage', None):
+        usage.fill(_usage_of_raw(chunk.message))
+    elif kind == 'message_delta' and getattr(chunk, 'usage', None):
+        usage.output_tokens = chunk.usage.output_tokens
+
+def _chunk_text(chunk) -> Optional[str]:
+    if hasattr(chunk, 'delta') and hasattr(chunk.delta, 'text'):
+        return chunk.delta.text
+    elif hasattr(chunk, 'delta') and hasattr(chunk.delta, 'content'):
+        return chunk.delta.content
+    elif hasattr(chunk, 'content'):
+        return chunk.content
+    return None
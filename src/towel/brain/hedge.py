@@ -0,0 +1,263 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from functools import partial
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator
+
+from pydantic import BaseModel
+
+from .base import Brain, DeepThought, Stream, AsyncStream
+
+class Hedge(Brain):
+    """
+    a brain made of brains: a thought goes to the first brain, and when it does not come back
+    within "hedge_after_ms" (or, by default, the first brain's "percentile" latency) the same thought goes to the next brain as well
+
+    the first good thought wins, the others are cancelled (or abandoned, when they are thought in a thread)
+    a brain that errors is fallen back from right away
+
+    streams are not hedged: a stream is read by whoever asked for it, so there is no "first" one to pick,
+    a stream goes to the next brain only when a brain errors
+    """
+
+    def __init__(self,
+                 brains: List[Brain],
+                 hedge_after_ms: Optional[float] = None,
+                 percentile: float = 95,
+                 history: int = 128,
+                 warm_up_ms: float = 2000):
+
+        if not brains:
+            raise ValueError("a hedge needs at least one brain to think with")
+
+        super().__init__()
+
+        self.brains = brains
+        self.model = " | ".join(str(brain.model) for brain in brains)
+
+        self.hedge_after_ms = hedge_after_ms
+        self.percentile = percentile
+        self.warm_up_ms = warm_up_ms                   ## hedge after this long until there are enough latencies to know better
+        self.latencies = deque(maxlen=history)         ## of the first brain's thoughts, in seconds: how long it took, or was thinking for
+        self.lock = threading.Lock()
+
+        self.hedges = 0                                ## thoughts that were sent to one more brain, because the others were slow
+        self.wins = [0] * len(brains)                  ## thoughts every brain was first to think
+
+    def hedge_after(self) -> float:
+        "seconds to wait for a brain before asking the next one"
+        if self.hedge_after_ms is not None:
+            return self.hedge_after_ms / 1000
+        with self.lock:
+            if len(self.latencies) < 10:
+                return self.warm_up_ms / 1000
+            latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+
+    def _took(self,
+              thinking: Dict[Any, Any],
+              brain: Optional[Brain] = None,
+              took: Optional[float] = None):
+        """
+        records how long the first brain took: on every thought, not only on the ones it wins,
+        when it is still thinking once another brain won, it is recorded as thinking for that long (at least)
+        """
+        now = time.monotonic()
+        if brain is not self.brains[0]:
+            brain, took = next(((brain, now - started) for brain, started in thinking.values()
+                                if brain is self.brains[0]), (None, None))
+        if brain is not None:
+            with self.lock:
+                self.latencies.append(took)
+
+    def _won(self,
+             brain: Brain):
+        with self.lock:
+            self.wins[self.brains.index(brain)] += 1
+
+    def _hedged(self):
+        with self.lock:
+            self.hedges += 1
+
+    def think(self,
+              messages: Optional[Union[List[Dict[str, str]], str]] = None,
+              stream: Optional[bool] = False,
+              prompt: Optional[str] = None,
+              model: Optional[str] = None,
+              max_tokens: Optional[int] = None,
+              context_window: Optional[int] = None,
+              temperature: Optional[float] = None,
+              tools: Optional[List[Dict[str, Any]]] = None,
+              tool_choice: Optional[str] = None,
+              response_model: Optional[BaseModel] = None,
+              **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+        "every brain thinks with its own model (a \"model\" is not passed on), streams are not hedged (see Hedge)"
+
+        kwargs = _passed_on(kwargs, max_tokens, context_window, temperature, tools, tool_choice, response_model)
+
+        if stream:
+            thought = None
+            for brain in self.brains:
+                thought = brain.think(messages, stream, prompt, **kwargs)
+                if not _failed(thought):
+                    return thought
+            return thought
+
+        pool = ThreadPoolExecutor(max_workers=len(self.brains))
+        try:
+            waiting = list(self.brains)
+            thinking = {}                              ## future => (brain, started at)
+            failed = None
+
+            def ask_next():
+                brain = waiting.pop(0)
+                future = pool.submit(copy_context().run, partial(brain.think, messages, stream, prompt, **kwargs))
+                thinking[future] = (brain, time.monotonic())
+
+            ask_next()
+            while thinking:
+                done, _ = wait(thinking,
+                               timeout=self.hedge_after() if waiting else None,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    self._hedged()
+                    ask_next()
+                    continue
+
+                for future in done:
+                    brain, started = thinking.pop(future)
+                    thought = _outcome(future.result)
+                    if not _failed(thought):
+                        self._took(thinking, brain, time.monotonic() - started)
+                        self._won(brain)
+                        return thought
+                    failed = thought
+
+                if waiting:
+                    ask_next()                         ## fall back right away
+
+            return self._failed_thought(failed, kwargs.get('response_model'))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def athink(self,
+                     messages: Optional[Union[List[Dict[str, str]], str]] = None,
+                     stream: Optional[bool] = False,
+                     prompt: Optional[str] = None,
+                     model: Optional[str] = None,
+                     max_tokens: Optional[int] = None,
+                     context_window: Optional[int] = None,
+                     temperature: Optional[float] = None,
+                     tools: Optional[List[Dict[str, Any]]] = None,
+                     tool_choice: Optional[str] = None,
+                     response_model: Optional[BaseModel] = None,
+                     **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+
+        kwargs = _passed_on(kwargs, max_tokens, context_window, temperature, tools, tool_choice, response_model)
+
+        if stream:
+            thought = None
+            for brain in self.brains:
+                thought = await brain.athink(messages, stream, prompt, **kwargs)
+                if not _failed(thought):
+                    return thought
+            return thought
+
+        waiting = list(self.brains)
+        thinking = {}                                  ## task => (brain, started at)
+        failed = None
+
+        def ask_next():
+            brain = waiting.pop(0)
+            task = asyncio.ensure_future(brain.athink(messages, stream, prompt, **kwargs))
+            thinking[task] = (brain, time.monotonic())
+
+        try:
+            ask_next()
+            while thinking:
+                done, _ = await asyncio.wait(thinking,
+                                             timeout=self.hedge_after() if waiting else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._hedged()
+                    ask_next()
+                    continue
+
+                for task in done:
+                    brain, started = thinking.pop(task)
+                    thought = _outcome(task.result)
+                    if not _failed(thought):
+                        self._took(thinking, brain, time.monotonic() - started)
+                        self._won(brain)
+                        return thought
+                    failed = thought
+
+                if waiting:
+                    ask_next()
+
+            return self._failed_thought(failed, kwargs.get('response_model'))
+        finally:
+            for task in thinking:
+                task.cancel()
+
+    def _failed_thought(self,
+                        failed: Any,
+                        response_model: Optional[BaseModel]) -> DeepThought:
+        if isinstance(failed, Exception):
+            return self._to_error_thought(failed, None, response_model)
+        return failed
+
+    def _think(self,
+               messages: Union[List[Dict[str, str]] | str],
+               stream: bool,
+               model: Optional[str] = None,
+               max_tokens: Optional[int] = None,
+               context_window: Optional[int] = None,
+               temperature: Optional[float] = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[str] = None,
+               response_model: Optional[BaseModel] = None,
+               **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+        "brains of a hedge think with their own models"
+        return self.think(messages,
+                          stream,
+                          max_tokens=max_tokens,
+                          context_window=context_window,
+                          temperature=temperature,
+                          tools=tools,
+                          tool_choice=tool_choice,
+                          response_model=response_model,
+                          **kwargs)
+
+    def _to_deep_thought(self,
+                         response) -> DeepThought:
+        return response
+
+def _passed_on(kwargs: Dict[str, Any],
+               max_tokens: Optional[int],
+               context_window: Optional[int],
+               temperature: Optional[float],
+               tools: Optional[List[Dict[str, Any]]],
+               tool_choice: Optional[str],
+               response_model: Optional[BaseModel]) -> Dict[str, Any]:
+    "what every brain of a hedge thinks with"
+    return {**kwargs,
+            "max_tokens": max_tokens,
+            "context_window": context_window,
+            "temperature": temperature,
+            "tools": tools,
+            "tool_choice": tool_choice,
+            "response_model": response_model}
+
+def _outcome(result) -> Any:
+    "a thought, or an exception a brain could not think because of"
+    try:
+        return result()
+    except Exception as e:
+        return e
+
+def _failed(thought: Any) -> bool:
+    return isinstance(thought, Exception) or (isinstance(thought, DeepThought) and thought.stop_reason == "error")
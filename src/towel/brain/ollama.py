@@ -1,40 +1,141 @@
 import time
 import json
-from typing import Dict, Any, List, Optional, Union, Generator
+import asyncio
+import hashlib
+import inspect
+from functools import cached_property, lru_cache
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator, Tuple, cast
 
 import ollama
 
-from openai import OpenAI ## for the "instructor" ollama api ¯\_(ツ)_/¯
+from openai import OpenAI, AsyncOpenAI ## for the "instructor" ollama api ¯\_(ツ)_/¯
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import instructor
 
 import towel.brain.tools.fun as fun
-from .base import Brain, DeepThought, TextThought, ToolUseThought
-from towel.tools import color, say, image_path_to_data, squuid, check_connection, with_retry
+from .repair import repairing
+from .base import Brain, DeepThought, TextThought, ToolUseThought, Usage, Stream, AsyncStream, instructed, _usage_of_raw
+from towel.tools import color, say, image_path_to_data, squuid, check_health, check_health_in_background, with_retry, with_retry_async, retry_params
+
+_UNREACHABLE = "failed to connect to Ollama server, you can configure an optional Ollama url via: thinker.Ollama(model=..., url=...)"
 
 class Ollama(Brain):
 
     def __init__(self,
                  model: str,
                  url: Optional[str] = "http://localhost:11434",
-                 chat: Optional[bool] = False):
+                 chat: Optional[bool] = False,
+                 health_check: Optional[str] = "lazy",
+                 keep_alive: Optional[Union[str, int]] = None,
+                 structured: Optional[str] = "prompt",
+                 tool_calling: Optional[str] = "auto"):
+        """
+        "health_check" is when the Ollama server is checked to be up:
+
+            "lazy"       on the first thought (default)
+            "background" right away, without waiting for it: the first thought waits if it is still going
+            "eager"      right away, waiting for it
+            None         never
+
+        checks are remembered per url for all the brains of a process, see "towel.tools.check_health"
+
+        "keep_alive" is how long Ollama keeps a model loaded after a thought (i.e. "30m", -1 forever), unless a thought says otherwise
+
+        "structured" is how a "response_model" (or a tool call) is made:
+
+            "prompt"     instructor asks for JSON, validates it and asks again when it does not validate (default)
+            "schema"     the JSON schema goes to Ollama's "format", so the model can only say what validates (Ollama 0.5+)
+
+        "tool_calling" is how tools are called:
+
+            "auto"       natively, when a model says it can (its "capabilities" or template), via a prompt otherwise (default)
+            "native"     "tools" go to Ollama: a model may call several of them at once
+            "prompt"     tools are described in a system prompt, and a (single) call comes back as JSON
+
+        a thought can say otherwise: "think(..., structured=..., tool_calling=...)"
+        """
 
         super().__init__(model)
 
         self.model = model
-
-        check_connection(url,
-                         message="failed to connect to Ollama server, you can configure an optional Ollama url via: thinker.Ollama(model=..., url=...)")
         self.url = url
-
         self.is_chat = chat
 
-        self.client = ollama.Client(host=self.url)
-
-        self.iclient = instructor.from_openai(OpenAI(base_url=self.url + "/v1",
-                                                     api_key="ollama"),
-                                              mode=instructor.Mode.JSON)
+        self.keep_alive = keep_alive
+        self.structured = structured
+        self.tool_calling = tool_calling
+
+        self.health_check = health_check
+        self.healthy_until = 0.0
+
+        if health_check == "eager":
+            self._check_health()
+        elif health_check == "background":
+            check_health_in_background(url, message=_UNREACHABLE)
+
+    def server(self) -> str:
+        return self.url
+
+    def warm_up(self,
+                model: Optional[str] = None,
+                keep_alive: Optional[Union[str, int]] = None):
+        """
+        loads a model before it is needed, so the first thought does not pay for the load
+        and keeps it loaded for "keep_alive" (the brain's "keep_alive" by default, or Ollama's when there is none)
+        """
+        self._check_health()
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive
+        self.client.generate(model=model or self.model,
+                             prompt="",
+                             keep_alive=keep_alive)
+
+    def pin(self,
+            model: Optional[str] = None):
+        "loads a model and keeps it loaded until it is unloaded"
+        self.warm_up(model, keep_alive=-1)
+
+    def unload(self,
+               model: Optional[str] = None):
+        self.client.generate(model=model or self.model,
+                             prompt="",
+                             keep_alive=0)
+
+    def loaded(self) -> List[str]:
+        "models the server has in memory right now"
+        return [model['name'] for model in self.client.ps()['models']]
+
+    def session(self,
+                model: Optional[str] = None) -> "Session":
+        "a /generate conversation that carries its KV context from one thought to the next"
+        return Session(self, model)
+
+    def _check_health(self):
+        if self.health_check and time.monotonic() > self.healthy_until:
+            self.healthy_until = check_health(self.url, message=_UNREACHABLE)
+
+    ## clients are made when they are first needed: most brains do not need all four
+
+    @cached_property
+    def client(self) -> ollama.Client:
+        return ollama.Client(host=self.url)
+
+    @cached_property
+    def iclient(self):
+        return instructor.from_openai(OpenAI(base_url=self.url + "/v1",
+                                             api_key="ollama"),
+                                      mode=instructor.Mode.JSON)
+
+    ## for "athink"
+    @cached_property
+    def aclient(self) -> ollama.AsyncClient:
+        return ollama.AsyncClient(host=self.url)
+
+    @cached_property
+    def aiclient(self):
+        return instructor.from_openai(AsyncOpenAI(base_url=self.url + "/v1",
+                                                  api_key="ollama"),
+                                      mode=instructor.Mode.JSON)
 
     def _to_deep_thought(self,
                          response: Union[Dict[str, Any],
@@ -64,33 +165,100 @@ class Ollama(Brain):
                 id=thought_id,
                 content=content,
                 model=model,
-                stop_reason=stop_reason
+                stop_reason=stop_reason,
+                usage=getattr(response, '_usage', None) or _usage_of_raw(getattr(response, '_raw_response', None))
             )
         else:
             # regular ollama response
-            content.append(TextThought(text=response['message']['content']))
+            message = response['message']
+            tool_calls = message.get('tool_calls') or []
+
+            if message['content'] or not tool_calls:
+                content.append(TextThought(text=message['content']))
+
+            for call in tool_calls:                          ## a model that calls tools natively may call several at once
+                content.append(ToolUseThought(
+                    id=str(squuid()),
+                    name=call['function']['name'],
+                    input=dict(call['function']['arguments'] or {})))
 
             return DeepThought(
                 id=thought_id,
                 content=content,
                 tokens_used=response.get('eval_count', 0),
                 model=response.get('model', ''),
-                stop_reason=response.get('done_reason', '')
+                stop_reason='tool_use' if tool_calls else response.get('done_reason', ''),
+                usage=_usage(response)
             )
 
-    def _think(self,
-               messages: Union[List[Dict[str, str]] | str],
-               stream: bool,
-               model: Optional[str] = None,
-               max_tokens: Optional[int] = None,
-               context_window: Optional[int] = None,
-               temperature: Optional[float] = None,
-               tools: Optional[List[Dict[str, Any]]] = None,
-               tool_choice: Optional[str] = None,
-               response_model: Optional[BaseModel] = None,
-               **kwargs) -> Union[Dict[str, Any], DeepThought, Generator[str, None, None]]:
+    def calls_tools(self,
+                    model: Optional[str] = None) -> bool:
+        "whether a model calls tools natively: asked once per server and model"
+        model = model or self.model
+        key = (self.url, model)
+        if key not in _native_tools:
+            try:
+                shown = self.client.show(model)
+                capabilities = shown.get('capabilities')
+                _native_tools[key] = ('tools' in capabilities if capabilities is not None
+                                      else '.Tools' in (shown.get('template') or ''))   ## older servers do not tell capabilities
+            except Exception:
+                _native_tools[key] = False
+        return _native_tools[key]
+
+    def _natively(self,
+                  model: str,
+                  tool_calling: Optional[str]) -> bool:
+        if tool_calling != "prompt" and not _takes_tools(self.client.chat):
+            if tool_calling == "native":
+                self.logger.warning("this ollama client has no \"tools\" (ollama 0.3.0+ does), tools are called the prompt way")
+            return False
+        if tool_calling == "auto":
+            return self.calls_tools(model)
+        return tool_calling == "native"
+
+    def _tool_kwargs(self,
+                     messages: Union[List[Dict[str, str]] | str],
+                     model: Optional[str],
+                     max_tokens: Optional[int],
+                     context_window: Optional[int],
+                     temperature: Optional[float],
+                     tools: List[Dict[str, Any]],
+                     kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        "/chat args of a thought that goes to Ollama with its tools"
+        api_kwargs, _, _, _ = self._prepare(messages, False, model, max_tokens, context_window,
+                                            temperature, None, None, None, **{**kwargs, "chat": True})
+        api_kwargs["tools"] = [_native_tool(tool) for tool in tools]
+        return api_kwargs
+
+    def _schema_kwargs(self,
+                       api_kwargs: Dict[str, Any],
+                       instructor_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        "/chat args of a thought that is constrained to its response model's JSON schema"
+        schema = instructor_kwargs["response_model"].model_json_schema()
+        return {"model": instructor_kwargs["model"],
+                "messages": _with_schema(instructor_kwargs["messages"], schema),
+                "format": schema,
+                "options": api_kwargs.get("options", {}),
+                "stream": False,
+                **({"keep_alive": api_kwargs["keep_alive"]} if "keep_alive" in api_kwargs else {})}
+
+    def _prepare(self,
+                 messages: Union[List[Dict[str, str]] | str],
+                 stream: bool,
+                 model: Optional[str] = None,
+                 max_tokens: Optional[int] = None,
+                 context_window: Optional[int] = None,
+                 temperature: Optional[float] = None,
+                 tools: Optional[List[Dict[str, Any]]] = None,
+                 tool_choice: Optional[str] = None,
+                 response_model: Optional[BaseModel] = None,
+                 **kwargs) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], bool, Dict[str, Any]]:
+        "ollama api args, instructor args (when a response model or tools are asked for), /chat or /generate and retry params"
 
         options = kwargs.pop('options', {})
+        retrying = retry_params(kwargs)
+        repair = kwargs.pop('repair', True)        ## responses that do not validate are repaired locally before the model is asked again
         if max_tokens is not None:
             options['num_predict'] = max_tokens
         if context_window is not None:
@@ -119,7 +287,7 @@ class Ollama(Brain):
             api_kwargs.update({
                 "messages": messages,
                 "format": kwargs.pop('format', ''),
-                "keep_alive": kwargs.pop('keep_alive', None),
+                "keep_alive": kwargs.pop('keep_alive', self.keep_alive),
             })
         else:                      # /generate
             api_kwargs.update({
@@ -130,7 +298,7 @@ class Ollama(Brain):
                 "raw": kwargs.pop('raw', False),
                 "format": kwargs.pop('format', ''),
                 "images": kwargs.pop('images', None),
-                "keep_alive": kwargs.pop('keep_alive', None),
+                "keep_alive": kwargs.pop('keep_alive', self.keep_alive),
             })
 
         # remove None values to use ollama's defaults
@@ -144,7 +312,7 @@ class Ollama(Brain):
         # if tool_choice:
         #     api_kwargs["tool_choice"] = tool_choice
 
-        max_retries = kwargs.pop('max_retries', 5)  ## non instructor retries
+        instructor_kwargs = None
 
         if response_model or tools:
 
@@ -158,8 +326,6 @@ class Ollama(Brain):
                 # "tool_choice": tool_choice,
                 "response_model": response_model,
                 **kwargs,  # other instructor args
-
-                "max_retries": kwargs.pop('instructor_retries', 6),
             }
             instructor_kwargs = {k: v for k, v in instructor_kwargs.items() if v is not None}
 
@@ -174,38 +340,310 @@ class Ollama(Brain):
                                                  {"role": "user", "content": prompt.footer}]
                 instructor_kwargs["response_model"] = fun.Response
 
+            if repair:
+                instructor_kwargs["response_model"] = repairing(instructor_kwargs["response_model"])
+
+        return api_kwargs, instructor_kwargs, is_chat, retrying
+
+    def _think(self,
+               messages: Union[List[Dict[str, str]] | str],
+               stream: bool,
+               model: Optional[str] = None,
+               max_tokens: Optional[int] = None,
+               context_window: Optional[int] = None,
+               temperature: Optional[float] = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[str] = None,
+               response_model: Optional[BaseModel] = None,
+               **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+
+        self._check_health()
+
+        session, reused = _in_session(kwargs, model or self.model)
+        structured = kwargs.pop('structured', self.structured)
+        tool_calling = kwargs.pop('tool_calling', self.tool_calling)
+
+        if tools and not response_model and self._natively(model or self.model, tool_calling):
+            try:
+                response = self.client.chat(**self._tool_kwargs(messages, model, max_tokens, context_window,
+                                                                temperature, tools, kwargs))
+                return self._to_deep_thought(response)
+            except ollama.ResponseError as e:
+                if not _no_tools(e):
+                    raise
+                _native_tools[(self.url, model or self.model)] = False    ## the prompt way then
+
+        api_kwargs, instructor_kwargs, is_chat, retrying = self._prepare(messages, stream, model, max_tokens, context_window,
+                                                                            temperature, tools, tool_choice, response_model, **kwargs)
+
+        if instructor_kwargs is not None:
+
             ## TODO: convert to a log
             # say("ollama thinker", f"ollama args: {instructor_kwargs}", color.GRAY_DIUM, color.GRAY_ME)
 
-            response = with_retry(self.iclient,
-                                  instructor_kwargs,
-                                  config={"max_attempts": max_retries},
-                                  new_seed=True)
-
-            return response if response_model else self._to_deep_thought(response, model=model or self.model)
+            if structured == "schema":
+                response = _constrained(instructor_kwargs["response_model"],
+                                        self.client.chat(**self._schema_kwargs(api_kwargs, instructor_kwargs)))
+                if response is not None:
+                    return response if response_model else self._to_deep_thought(cast(fun.Response, response), model=model or self.model)
+
+            attempts = []
+            response = instructed(with_retry(self.iclient,
+                                             instructor_kwargs,
+                                             new_seed=True,
+                                             attempts=attempts,
+                                             **retrying),
+                                  attempts,
+                                  retrying["budget"].attempts)
+
+            return response if response_model else self._to_deep_thought(cast(fun.Response, response), model=model or self.model)
         else:
-            api_kwargs["stream"] = stream
-
             if is_chat:
                 make_thoughts = self.client.chat      # type: ignore
             else:
                 make_thoughts = self.client.generate  # type: ignore
 
             if stream:
+                usage = Usage()
                 def response_generator():
                     for part in make_thoughts(**api_kwargs):
-                        if is_chat:
-                            yield part['message']['content']   # type: ignore
-                        else:
-                            yield part['response']             # type: ignore
-                return response_generator()
+                        _remember_context(session, part, reused, model or self.model)
+                        if part.get('done'):
+                            usage.fill(_usage(part))
+                        yield _part_text(part, is_chat)
+                return Stream(response_generator(), usage)
             else:
-                if is_chat:
-                    response = make_thoughts(**api_kwargs)
-                else:
-                    ## uniform it with the /chat response
-                    response = make_thoughts(**api_kwargs)
-                    response['message'] = {'role': 'assistant',
-                                           'content': response.pop('response')}
-
+                response = make_thoughts(**api_kwargs)
+                _remember_context(session, response, reused, model or self.model)
+                return self._to_deep_thought(_uniform(response, is_chat))
+
+    async def _athink(self,
+                      messages: Union[List[Dict[str, str]] | str],
+                      stream: bool,
+                      model: Optional[str] = None,
+                      max_tokens: Optional[int] = None,
+                      context_window: Optional[int] = None,
+                      temperature: Optional[float] = None,
+                      tools: Optional[List[Dict[str, Any]]] = None,
+                      tool_choice: Optional[str] = None,
+                      response_model: Optional[BaseModel] = None,
+                      **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+
+        if self.health_check and time.monotonic() > self.healthy_until:
+            await asyncio.to_thread(self._check_health)
+
+        session, reused = _in_session(kwargs, model or self.model)
+        structured = kwargs.pop('structured', self.structured)
+        tool_calling = kwargs.pop('tool_calling', self.tool_calling)
+
+        if tools and not response_model and await asyncio.to_thread(self._natively, model or self.model, tool_calling):
+            try:
+                response = await self.aclient.chat(**self._tool_kwargs(messages, model, max_tokens, context_window,
+                                                                       temperature, tools, kwargs))
                 return self._to_deep_thought(response)
+            except ollama.ResponseError as e:
+                if not _no_tools(e):
+                    raise
+                _native_tools[(self.url, model or self.model)] = False
+
+        api_kwargs, instructor_kwargs, is_chat, retrying = self._prepare(messages, stream, model, max_tokens, context_window,
+                                                                            temperature, tools, tool_choice, response_model, **kwargs)
+
+        if instructor_kwargs is not None:
+
+            if structured == "schema":
+                response = _constrained(instructor_kwargs["response_model"],
+                                        await self.aclient.chat(**self._schema_kwargs(api_kwargs, instructor_kwargs)))
+                if response is not None:
+                    return response if response_model else self._to_deep_thought(cast(fun.Response, response), model=model or self.model)
+
+            attempts = []
+            response = instructed(await with_retry_async(self.aiclient,
+                                                         instructor_kwargs,
+                                                         new_seed=True,
+                                                         attempts=attempts,
+                                                         **retrying),
+                                  attempts,
+                                  retrying["budget"].attempts)
+
+            return response if response_model else self._to_deep_thought(cast(fun.Response, response), model=model or self.model)
+        else:
+            if is_chat:
+                make_thoughts = self.aclient.chat      # type: ignore
+            else:
+                make_thoughts = self.aclient.generate  # type: ignore
+
+            if stream:
+                usage = Usage()
+                async def response_generator():
+                    async for part in await make_thoughts(**api_kwargs):
+                        _remember_context(session, part, reused, model or self.model)
+                        if part.get('done'):
+                            usage.fill(_usage(part))
+                        yield _part_text(part, is_chat)
+                return AsyncStream(response_generator(), usage)
+            else:
+                response = await make_thoughts(**api_kwargs)
+                _remember_context(session, response, reused, model or self.model)
+                return self._to_deep_thought(_uniform(response, is_chat))
+
+class Session:
+    """
+    a /generate conversation: the "context" (tokens of the conversation so far) Ollama returns with a thought
+    goes with the next thought, so the server does not prefill the whole conversation again
+
+    a context is only good for the model that made it: thinking with another model starts over
+    """
+    def __init__(self,
+                 brain: Ollama,
+                 model: Optional[str] = None):
+        self.brain = brain
+        self.model = model or brain.model
+        self.context: Optional[List[int]] = None
+        self.context_model: Optional[str] = None
+        self.digest: Optional[str] = None
+
+        self.turns = 0
+        self.tokens_saved = 0       ## prompt tokens that were not sent (and prefilled) again
+        self.prompt_tokens = 0      ## prompt tokens that were
+        self.invalidations = 0
+
+    def think(self,
+              prompt: str,
+              **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+        return self.brain.think(prompt, model=kwargs.pop('model', self.model), session=self, **kwargs)
+
+    async def athink(self,
+                     prompt: str,
+                     **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+        return await self.brain.athink(prompt, model=kwargs.pop('model', self.model), session=self, **kwargs)
+
+    def context_for(self,
+                    model: str) -> Optional[List[int]]:
+        if self.context is not None and model != self.context_model:
+            self.reset()
+            self.invalidations += 1
+        return self.context
+
+    def remember(self,
+                 model: str,
+                 context: Optional[List[int]],
+                 reused: Optional[List[int]],
+                 prompt_tokens: int):
+        self.turns += 1
+        self.tokens_saved += len(reused or [])
+        self.prompt_tokens += prompt_tokens
+        if context is not None:
+            self.context = list(context)
+            self.context_model = model
+            self.digest = hashlib.sha256(json.dumps(self.context).encode('utf-8')).hexdigest()[:16]
+
+    def reset(self):
+        self.context = None
+        self.context_model = None
+        self.digest = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"turns": self.turns,
+                "context_tokens": len(self.context or []),
+                "tokens_saved": self.tokens_saved,
+                "prompt_tokens": self.prompt_tokens,
+                "invalidations": self.invalidations}
+
+    def __repr__(self):
+        ## where the conversation is at: session thoughts are never remembered by a brain's cache
+        return f"Session({self.model}, {self.digest})"
+
+def _in_session(kwargs: Dict[str, Any],
+                model: str) -> Tuple[Optional[Session], Optional[List[int]]]:
+    "a thought in a session goes to /generate with the session's context"
+    session = kwargs.pop('session', None)
+    if session is None:
+        return None, None
+    reused = session.context_for(model)
+    kwargs['chat'] = False
+    if reused is not None:
+        kwargs['context'] = reused
+    return session, reused
+
+def _remember_context(session: Optional[Session],
+                      response,
+                      reused: Optional[List[int]],
+                      model: str):
+    if session is not None and response.get('done', True):
+        session.remember(model,
+                         response.get('context'),
+                         reused,
+                         response.get('prompt_eval_count') or 0)
+
+_native_tools: Dict[Tuple[str, str], bool] = {}     ## (url, model) => whether it calls tools natively
+
+def _native_tool(tool: Dict[str, Any]) -> Dict[str, Any]:
+    "a tool as Ollama (and OpenAI) has them: {\"type\": \"function\", \"function\": {..., \"parameters\": ...}}"
+    if tool.get("type") == "function":
+        return tool
+    return {"type": "function",
+            "function": {"name": tool["name"],
+                         "description": tool.get("description", ""),
+                         "parameters": tool.get("input_schema") or tool.get("parameters") or {"type": "object", "properties": {}}}}
+
+def _takes_tools(chat) -> bool:
+    "whether an ollama client's \"chat\" can be given \"tools\": ollama-python has them since 0.3.0"
+    return _has_tools(getattr(chat, '__func__', chat))
+
+@lru_cache(maxsize=None)
+def _has_tools(chat) -> bool:
+    try:
+        parameters = inspect.signature(chat).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(p.name == "tools" or p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters)
+
+def _no_tools(e: Exception) -> bool:
+    "Ollama says a model does not call tools (natively)"
+    return getattr(e, 'status_code', None) == 400 and "does not support tools" in str(e)
+
+def _with_schema(messages: List[Dict[str, Any]],
+                 schema: Dict[str, Any]) -> List[Dict[str, Any]]:
+    "the schema is also told to the model: it grounds what it says, while \"format\" makes sure it is said in it"
+    hint = f"respond with JSON that follows this schema: {json.dumps(schema)}"
+    if messages and messages[0].get("role") == "system":
+        return [{**messages[0], "content": f"{messages[0]['content']}\n\n{hint}"}, *messages[1:]]
+    return [{"role": "system", "content": hint}, *messages]
+
+def _constrained(response_model,
+                 response) -> Optional[BaseModel]:
+    """
+    a response model instance of a thought that was constrained to its schema,
+    or None when it still does not validate (i.e. it was cut short by "max_tokens"): it is then asked for the instructor way
+    """
+    try:
+        result = response_model.model_validate_json(response['message']['content'])
+    except ValidationError:
+        return None
+    result._usage = _usage(response)
+    return result
+
+def _seconds(nanoseconds: Optional[int]) -> Optional[float]:
+    return nanoseconds / 1e9 if nanoseconds is not None else None
+
+def _usage(response) -> Usage:
+    "ollama counts tokens and times (in nanoseconds) of a thought when it is done"
+    return Usage(input_tokens=response.get('prompt_eval_count'),
+                 output_tokens=response.get('eval_count'),
+                 load_duration=_seconds(response.get('load_duration')),
+                 prompt_eval_duration=_seconds(response.get('prompt_eval_duration')),
+                 eval_duration=_seconds(response.get('eval_duration')))
+
+def _part_text(part, is_chat: bool) -> str:
+    if is_chat:
+        return part['message']['content']   # type: ignore
+    return part['response']                 # type: ignore
+
+def _uniform(response, is_chat: bool):
+    "uniform a /generate response with the /chat one"
+    if not is_chat:
+        response = dict(response)    ## newer ollama clients respond with (pydantic) objects
+        response['message'] = {'role': 'assistant',
+                               'content': response.pop('response')}
+    return response
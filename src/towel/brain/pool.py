@@ -0,0 +1,310 @@
+import time
+import asyncio
+import weakref
+import threading
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator, Iterable, AsyncIterable, Callable, cast
+
+import httpx
+import openai
+from pydantic import BaseModel
+
+from .base import Brain, DeepThought, Stream, AsyncStream, usage_of
+from .ollama import Ollama
+
+class Host:
+    "an Ollama server of a pool: what it is doing, how fast it is, whether it is up and which models it has loaded"
+
+    def __init__(self,
+                 url: str,
+                 model: str,
+                 chat: bool):
+        self.url = url
+        self.model = model
+        self.chat = chat
+        self._brain: Optional[Ollama] = None
+        self.lock = threading.Lock()
+
+        self.outstanding = 0                   ## thoughts it is thinking right now
+        self.latency: Optional[float] = None   ## moving average of seconds per thought
+        self.failures = 0                      ## in a row
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+        self.loaded: set = set()               ## models it has in memory, as of "loaded_at"
+        self.loaded_at = 0.0
+
+    def brain(self) -> Ollama:
+        with self.lock:
+            if self._brain is None:
+                self._brain = Ollama(model=self.model, url=self.url, chat=self.chat)
+            return self._brain
+
+    def is_up(self,
+              now: float) -> bool:
+        return now >= self.ejected_until       ## an ejected host is let back in once its time is up
+
+    def stats(self) -> Dict[str, Any]:
+        return {"url": self.url,
+                "outstanding": self.outstanding,
+                "latency": self.latency,
+                "failures": self.failures,
+                "ejections": self.ejections,
+                "up": self.is_up(time.monotonic()),
+                "loaded": sorted(self.loaded)}
+
+class OllamaPool(Brain):
+    """
+    a brain over many Ollama servers: every thought goes to the host with the least thoughts in flight
+    (the fastest one on a tie), preferring hosts that already have the model loaded, so a model is not swapped in
+
+    a host that fails "max_failures" times in a row is ejected for "eject_for" seconds (twice as long every time it is ejected again),
+    and its thoughts are taken by the other hosts
+    """
+
+    def __init__(self,
+                 model: str,
+                 urls: List[str],
+                 chat: Optional[bool] = False,
+                 max_failures: int = 2,
+                 eject_for: float = 30,
+                 loaded_ttl: float = 10):
+
+        if not urls:
+            raise ValueError("an Ollama pool needs at least one url")
+
+        super().__init__()
+
+        self.model = model
+        self.hosts = [Host(url, model, chat) for url in urls]
+        self.max_failures = max_failures
+        self.eject_for = eject_for
+        self.loaded_ttl = loaded_ttl
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} 🧠 {self.model} ✅ x {len(self.hosts)}"
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [host.stats() for host in self.hosts]
+
+    def server(self) -> tuple:
+        return tuple(host.url for host in self.hosts)
+
+    def provider(self) -> str:
+        return "ollama"   ## so ollama's concurrency and rate limits are the pool's as well
+
+    def _refresh_loaded(self,
+                        host: Host,
+                        now: float):
+        if now - host.loaded_at < self.loaded_ttl:
+            return
+        host.loaded_at = now
+        try:
+            running = httpx.get(f"{host.url}/api/ps", timeout=1).json()
+            host.loaded = {model['name'] for model in running.get('models', [])}
+        except Exception:
+            pass                               ## not knowing what is loaded is not a failure to think
+
+    async def _arefresh_loaded(self,
+                               host: Host,
+                               now: float):
+        if now - host.loaded_at < self.loaded_ttl:
+            return
+        host.loaded_at = now
+        try:
+            async with httpx.AsyncClient(timeout=1) as client:
+                running = (await client.get(f"{host.url}/api/ps")).json()
+            host.loaded = {model['name'] for model in running.get('models', [])}
+        except Exception:
+            pass
+
+    def _candidates(self,
+                    tried: List[Host]) -> List[Host]:
+        now = time.monotonic()
+        hosts = [host for host in self.hosts if host not in tried and host.is_up(now)]
+        if not hosts:
+            hosts = [host for host in self.hosts if host not in tried]   ## all are down: try the ones not tried anyway
+        if not hosts:
+            raise ConnectionError(f"none of the Ollama hosts could think: {[host.url for host in self.hosts]}")
+        return hosts
+
+    def _choose(self,
+                model: str,
+                hosts: List[Host]) -> Host:
+        with self.lock:
+            warm = [host for host in hosts if model in host.loaded]
+            host = min(warm or hosts,
+                       key=lambda host: (host.outstanding, host.latency or 0))
+            host.outstanding += 1
+        return host
+
+    def _pick(self,
+              model: str,
+              tried: List[Host]) -> Host:
+        hosts = self._candidates(tried)
+        now = time.monotonic()
+        for host in hosts:
+            self._refresh_loaded(host, now)
+        return self._choose(model, hosts)
+
+    async def _apick(self,
+                     model: str,
+                     tried: List[Host]) -> Host:
+        "same as \"_pick\", without blocking the event loop on asking hosts what they have loaded"
+        hosts = self._candidates(tried)
+        now = time.monotonic()
+        await asyncio.gather(*[self._arefresh_loaded(host, now) for host in hosts])
+        return self._choose(model, hosts)
+
+    def _done(self,
+              host: Host,
+              model: str,
+              took: Optional[float] = None,
+              failed: bool = False):
+
+        with self.lock:
+            host.outstanding -= 1
+            if failed:
+                host.failures += 1
+                if host.failures >= self.max_failures:
+                    host.ejected_until = time.monotonic() + self.eject_for * 2 ** host.ejections
+                    host.ejections += 1
+                    host.failures = 0
+                return
+            host.failures = 0
+            host.ejections = 0
+            host.loaded.add(model)
+            if took is not None:
+                host.latency = took if host.latency is None else 0.7 * host.latency + 0.3 * took
+
+    def _think(self,
+               messages: Union[List[Dict[str, str]] | str],
+               stream: bool,
+               model: Optional[str] = None,
+               max_tokens: Optional[int] = None,
+               context_window: Optional[int] = None,
+               temperature: Optional[float] = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[str] = None,
+               response_model: Optional[BaseModel] = None,
+               **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, Stream, Generator[str, None, None]]:
+
+        model = model or self.model
+        tried: List[Host] = []
+
+        while True:
+            host = self._pick(model, tried)
+            tried.append(host)
+            try:
+                brain = host.brain()
+                started = time.monotonic()
+                thought = brain._think(messages, stream, model, max_tokens, context_window,
+                                       temperature, tools, tool_choice, response_model, **kwargs)
+            except Exception as e:
+                self._done(host, model, failed=_host_failed(e))
+                if not _host_failed(e) or len(tried) == len(self.hosts):
+                    raise
+                continue
+
+            if stream:
+                done = _once(lambda failed=False: self._done(host, model, failed=failed))
+                chunks = self._streamed(cast(Stream, thought), done)
+                weakref.finalize(chunks, done)      ## a stream that is never read is done once it is dropped
+                return Stream(chunks, usage_of(thought))
+
+            self._done(host, model, took=time.monotonic() - started)
+            return thought
+
+    async def _athink(self,
+                      messages: Union[List[Dict[str, str]] | str],
+                      stream: bool,
+                      model: Optional[str] = None,
+                      max_tokens: Optional[int] = None,
+                      context_window: Optional[int] = None,
+                      temperature: Optional[float] = None,
+                      tools: Optional[List[Dict[str, Any]]] = None,
+                      tool_choice: Optional[str] = None,
+                      response_model: Optional[BaseModel] = None,
+                      **kwargs) -> Union[Dict[str, Any], DeepThought, BaseModel, AsyncStream, AsyncGenerator[str, None]]:
+
+        model = model or self.model
+        tried: List[Host] = []
+
+        while True:
+            host = await self._apick(model, tried)
+            tried.append(host)
+            try:
+                brain = host.brain()
+                started = time.monotonic()
+                thought = await brain._athink(messages, stream, model, max_tokens, context_window,
+                                              temperature, tools, tool_choice, response_model, **kwargs)
+            except Exception as e:
+                self._done(host, model, failed=_host_failed(e))
+                if not _host_failed(e) or len(tried) == len(self.hosts):
+                    raise
+                continue
+
+            if stream:
+                done = _once(lambda failed=False: self._done(host, model, failed=failed))
+                achunks = self._astreamed(cast(AsyncStream, thought), done)
+                weakref.finalize(achunks, done)
+                return AsyncStream(achunks, usage_of(thought))
+
+            self._done(host, model, took=time.monotonic() - started)
+            return thought
+
+    def _streamed(self,
+                  chunks: Iterable[str],
+                  done: Callable[..., None]) -> Generator[str, None, None]:
+        "a host is thinking for as long as its stream is read: until it is read to the end, closed or dropped"
+        failed = False
+        try:
+            yield from chunks
+        except Exception as e:
+            failed = _host_failed(e)
+            raise
+        finally:
+            done(failed=failed)
+
+    async def _astreamed(self,
+                         chunks: AsyncIterable[str],
+                         done: Callable[..., None]) -> AsyncGenerator[str, None]:
+        failed = False
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            failed = _host_failed(e)
+            raise
+        finally:
+            done(failed=failed)
+
+    def _to_deep_thought(self,
+                         response) -> DeepThought:
+        return response
+
+def _once(done: Callable[..., None]) -> Callable[..., None]:
+    "a host's thought is done once, however many ways it is found to be done"
+    lock = threading.Lock()
+    called = []
+
+    def once(**kwargs):
+        with lock:
+            if called:
+                return
+            called.append(True)
+        done(**kwargs)
+    return once
+
+def _host_failed(error: BaseException) -> bool:
+    "whether a host is to blame: it is unreachable, timed out or broke (5xx), rather than a thought that went wrong"
+    seen = set()
+    e: Optional[BaseException] = error
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, (ConnectionError, TimeoutError, httpx.TransportError, openai.APIConnectionError)):
+            return True
+        if (getattr(e, 'status_code', None) or 0) >= 500:
+            return True
+        e = e.__cause__ or e.__context__
+    return False
@@ -0,0 +1,234 @@
+import re
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type, TypeVar, cast
+
+from pydantic import BaseModel, ValidationError
+
+from towel.tools import retry_meter
+
+## a local model's response that does not validate is often almost right:
+##
+##   prose around the JSON, a [{...}] instead of a {...}, unquoted keys, single quotes, trailing commas,
+##   Python's True / None, a "42" where 42 is expected, a truncated tail
+##
+## these are repaired here, deterministically, before the model is asked again
+
+_WORD = re.compile(r"[A-Za-z_$][\w$\-]*")
+_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+\-]?\d+)?")
+_LITERALS = {"true": "true", "True": "true",
+             "false": "false", "False": "false",
+             "null": "null", "None": "null", "undefined": "null"}
+
+def _outermost(text: str) -> Optional[str]:
+    "the outermost JSON object or array in a text: prose around it is dropped, a truncated one is kept to its end"
+    start = next((i for i, c in enumerate(text) if c in "{["), None)
+    if start is None:
+        return None
+    depth, quote, i = 0, None, start
+    while i < len(text):
+        c = text[i]
+        if quote:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c in "{[":
+            depth += 1
+        elif c in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        i += 1
+    return text[start:]
+
+def _string(text: str,
+            i: int,
+            out: List[str]) -> int:
+    "copies a single or double quoted string at \"i\" as a JSON string, returns where it ends"
+    quote = text[i]
+    chars = []
+    i += 1
+    while i < len(text) and text[i] != quote:
+        c = text[i]
+        if c == "\\" and i + 1 < len(text):
+            if text[i + 1] == "'":
+                chars.append("'")
+            else:
+                chars.append(c + text[i + 1])
+            i += 2
+            continue
+        if c == '"':
+            chars.append('\\"')
+        elif c == "\n":
+            chars.append("\\n")
+        else:
+            chars.append(c)
+        i += 1
+    out.append('"' + "".join(chars) + '"')
+    return i + 1
+
+def _drop_trailing_comma(out: List[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+def _tidy(text: str) -> str:
+    "fixes JSON syntax slips: quotes, unquoted keys and values, Python literals, comments, trailing commas and unclosed brackets"
+    out: List[str] = []
+    closing: List[str] = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c in "\"'":
+            i = _string(text, i, out)
+            continue
+        if text.startswith("//", i):
+            i = text.find("\n", i) if "\n" in text[i:] else len(text)
+            continue
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end < 0 else end + 2
+            continue
+        if c in "{[":
+            closing.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            _drop_trailing_comma(out)
+            if closing:
+                closing.pop()
+            out.append(c)
+        elif c == "-" or c == "." or c.isdigit():
+            number = _NUMBER.match(text, i)
+            if number:
+                out.append(number.group())
+                i = number.end()
+                continue
+            out.append(c)
+        elif _WORD.match(text, i):
+            word = _WORD.match(text, i).group()
+            is_key = text[i + len(word):].lstrip().startswith(":")
+            if not is_key and word in _LITERALS:
+                out.append(_LITERALS[word])
+            else:
+                out.append(json.dumps(word))
+            i += len(word)
+            continue
+        else:
+            out.append(c)
+        i += 1
+    while closing:                                         ## a truncated response
+        _drop_trailing_comma(out)
+        if out and out[-1] == ":":
+            out.append("null")
+        out.append(closing.pop())
+    return "".join(out)
+
+def _resolved(schema: Dict[str, Any],
+              defs: Dict[str, Any]) -> Dict[str, Any]:
+    ref = schema.get("$ref")
+    if ref:
+        return defs.get(ref.split("/")[-1], {})
+    options = schema.get("anyOf") or schema.get("oneOf")
+    if options:
+        typed = [option for option in options if option.get("type") != "null"]
+        if len(typed) == 1:
+            return _resolved(typed[0], defs)
+    return schema
+
+def _fit(value: Any,
+         schema: Dict[str, Any],
+         defs: Dict[str, Any]) -> Any:
+    "coerces a value to what a JSON schema expects, where it is plain what was meant"
+    schema = _resolved(schema, defs)
+    kind = schema.get("type") or ("object" if "properties" in schema else None)
+
+    if kind == "object":
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]                               ## [{...}] for {...}
+        if not isinstance(value, dict):
+            return value
+        properties = schema.get("properties", {})
+        if properties and len(value) == 1 and not value.keys() & properties.keys():
+            inner = next(iter(value.values()))
+            if isinstance(inner, dict):
+                value = inner                              ## {"Answer": {...}} for {...}
+        by_name = {name.lower(): name for name in properties}
+        fitted = {}
+        for key, item in value.items():
+            name = key if key in properties else by_name.get(str(key).lower(), key)
+            fitted[name] = _fit(item, properties[name], defs) if name in properties else item
+        return fitted
+
+    if kind == "array":
+        if value is None:
+            return value
+        if not isinstance(value, list):
+            value = [value]
+        items = schema.get("items")
+        return [_fit(item, items, defs) for item in value] if items else value
+
+    if isinstance(value, str):
+        text = value.strip()
+        if kind == "integer" and re.fullmatch(r"-?\d+(\.0*)?", text):
+            return int(float(text))
+        if kind == "number" and _NUMBER.fullmatch(text):
+            return float(text)
+        if kind == "boolean" and text.lower() in ("true", "yes", "1", "false", "no", "0"):
+            return text.lower() in ("true", "yes", "1")
+        return value
+
+    if kind == "integer" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if kind == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if kind == "string" and isinstance(value, bool):
+        return json.dumps(value)
+    return value
+
+def repair(text: str,
+           schema: Dict[str, Any]) -> Any:
+    "a model's response as data that fits a JSON schema, raises a ValueError when there is no JSON to repair"
+    candidate = _outermost(text)
+    if candidate is None:
+        raise ValueError("no JSON to repair")
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        data = json.loads(_tidy(candidate))
+    return _fit(data, schema, schema.get("$defs", {}))
+
+Model = TypeVar("Model", bound=BaseModel)
+
+@lru_cache(maxsize=256)
+def repairing(response_model: Type[Model]) -> Type[Model]:
+    """
+    a "response_model" that repairs a response that does not validate, before instructor asks the model again
+    every response it repairs is a round trip to the model saved: "retry_meter" counts them
+
+    it is a subclass made on the fly, so what it validates is made the "response_model" again once it is thought (see base._as_asked)
+    """
+    validate_json = getattr(response_model.model_validate_json, "__func__")    ## to validate as "cls", the repairing subclass
+
+    def model_validate_json(cls, json_data, *, strict=None, context=None, **kwargs):
+        try:
+            return validate_json(cls, json_data, strict=strict, context=context, **kwargs)
+        except ValidationError as invalid:
+            try:
+                data = repair(json_data if isinstance(json_data, str) else json_data.decode("utf-8"),
+                              cls.model_json_schema())
+                repaired = cls.model_validate(data, strict=strict, context=context)
+            except (ValueError, ValidationError):
+                raise invalid                              ## instructor re-asks with what was wrong to begin with
+            retry_meter.add(repaired=1)
+            return repaired
+
+    return cast(Type[Model], type(response_model.__name__,
+                                  (response_model,),
+                                  {"__module__": response_model.__module__,
+                                   "__qualname__": response_model.__qualname__,
+                                   "__doc__": response_model.__doc__,
+                                   "model_validate_json": classmethod(model_validate_json)}))
@@ -0,0 +1,99 @@
+import os
+import time
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+
+## a plan journal is an append only file of pickled records:
+##
+##   {"kind": "start", "plan_id": ..., "stash": {...}}                       once, when a plan is kicked off
+##   {"kind": "step",  "step_index": 3, "current_pin": "review",
+##                     "step_name": "review_stories", "result": {...}}       after every step
+##
+## a journal that was cut short (i.e. a process died mid write) is read up to its last complete record
+
+class Journal:
+    def __init__(self,
+                 path: str,
+                 fsync_every: int = 8,
+                 fsync_interval: float = 1.0,
+                 truncate_at: Optional[int] = None):
+        """
+        records are flushed to the OS on every write,
+        but only fsync'ed every "fsync_every" records or "fsync_interval" seconds (and on close),
+        so checkpointing does not dominate short steps
+
+        "truncate_at" drops whatever follows the last complete record before appending to a journal that is resumed,
+        without it a journal is started over: one journal holds a single plan run
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        if truncate_at is not None:
+            self.file = open(path, 'ab')
+            self.file.truncate(truncate_at)
+        else:
+            self.file = open(path, 'wb')
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def start(self,
+              plan_id: str,
+              stash: Dict[str, Any]):
+        self.write({"kind": "start",
+                    "plan_id": plan_id,
+                    "stash": stash})
+
+    def step(self,
+             step_index: int,
+             current_pin: Optional[str],
+             step_name: str,
+             result: Any):
+        self.write({"kind": "step",
+                    "step_index": step_index,
+                    "current_pin": current_pin,
+                    "step_name": step_name,
+                    "result": result})
+
+    def write(self,
+              record: Dict[str, Any]):
+        try:
+            data = pickle.dumps(record)
+        except Exception as e:
+            raise ValueError(f"could not checkpoint \"{record.get('step_name', record['kind'])}\" into {self.path} due to: {e}")
+
+        self.file.write(data)
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            self.sync()
+            self.file.close()
+
+def read_journal(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    "all the complete records of a journal and the offset right after the last one"
+    records = []
+    offset = 0
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                records.append(pickle.load(file))
+                offset = file.tell()
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                break    ## a torn last record
+    starts = sum(1 for record in records if record.get('kind') == 'start')
+    if records and (records[0].get('kind') != 'start' or starts > 1):
+        raise ValueError(f"{path} is not a journal of a single plan run: "
+                         f"it has {starts} start records, and should begin with one")
+    return records, offset
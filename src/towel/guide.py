@@ -1,11 +1,22 @@
-from typing import Callable, Optional, Dict, Any, List, Union
+from typing import Callable, Optional, Dict, Any, List, Union, Tuple, Mapping, MutableMapping, cast
+from collections import ChainMap
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import time
 import inspect
 import towel.base as towel
 import uuid
-from towel.brain.base import Brain
+from towel.brain.base import Brain, TokenMeter, metered
+from towel.checkpoint import Journal, read_journal
+from towel import memo
+from towel.memo import LRUCache, SqliteCache
 from towel.tools import say, color, LogLevel
 import json
 
+_FORGOTTEN = object()   ## a cache miss
+
 class Pin:
     def __init__(self,
                  name: str):
@@ -13,8 +24,10 @@ class Pin:
 
 class Route:
     def __init__(self,
-                 condition: Callable[[Dict[str, Any]], str]):
+                 condition: Callable[[Dict[str, Any]], str],
+                 to: Optional[List[str]] = None):
         self.condition = condition
+        self.to = to or []      ## optional pins this route may go to: checked when the plan is compiled
 
 class RouterException(Exception):
     def __init__(self,
@@ -31,11 +44,29 @@ class Step:
         self.func = func
         self.name = func.__name__ if hasattr(func, '__name__') else 'lambda'
         self.additional_inputs: Dict[str, str] = {}
+        self.memo: Optional[Union[LRUCache, SqliteCache]] = None
 
     def add(self, **kwargs):
         self.additional_inputs.update(kwargs)
         return self
 
+    def cache(self,
+              store: Optional[Union[LRUCache, SqliteCache]] = None):
+        """
+        a step result is looked up instead of taking the step again,
+        when its inputs, prompts and the model are all the same: i.e. a deterministic step
+        """
+        self.memo = store or memo.default_cache
+        return self
+
+class Parallel:
+    def __init__(self,
+                 steps: List[Step],
+                 max_workers: Optional[int] = None):
+        self.steps = steps
+        self.max_workers = max_workers or len(steps)
+        self.name = f"parallel({', '.join(step.name for step in steps)})"
+
 class StepExecutionError(Exception):
     def __init__(self,
                  step_name: str,
@@ -44,6 +75,184 @@ class StepExecutionError(Exception):
         self.original_error = original_error
         super().__init__(f"could not take this step '{step_name}' due to: {original_error}")
 
+class BudgetExceededError(Exception):
+    def __init__(self,
+                 reason: str,
+                 stash: Dict[str, Any]):
+        self.reason = reason
+        self.stash = stash      ## results of the steps taken so far
+        super().__init__(f"plan ran out of its budget: {reason}")
+
+class Budget:
+    def __init__(self,
+                 max_visits: Optional[Union[int, Dict[str, int]]] = None,
+                 max_hops: Optional[int] = None,
+                 max_seconds: Optional[float] = None,
+                 max_tokens: Optional[int] = None,
+                 fallback: Optional[str] = None):
+        """
+        hard bounds on a plan run:
+
+          max_visits:  times a pin may be visited: same for all pins, or {pin_name: times}
+          max_hops:    routes taken in total
+          max_seconds: wall clock time, checked before every step (a step in flight is not interrupted)
+          max_tokens:  tokens used by all the brains thinking for the plan
+
+        once a budget runs out, a plan is routed to the "fallback" pin, or stopped with a BudgetExceededError
+        a plan that fell back may only route to "end", so the fallback path is bounded as well
+        """
+        self.max_visits = max_visits
+        self.max_hops = max_hops
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.fallback = fallback
+
+    def visits_for(self,
+                   pin_name: str) -> Optional[int]:
+        if isinstance(self.max_visits, dict):
+            return self.max_visits.get(pin_name)
+        return self.max_visits
+
+class _Spending:
+    "what a plan run has spent of its budget so far"
+    def __init__(self,
+                 budget: Budget,
+                 meter: TokenMeter):
+        self.budget = budget
+        self.meter = meter
+        self.started_at = time.monotonic()
+        self.hops = 0
+        self.visits: Dict[str, int] = {}
+        self.fell_back = False
+
+    def step(self) -> Optional[str]:
+        if self.fell_back:
+            return None
+        seconds = time.monotonic() - self.started_at
+        if self.budget.max_seconds is not None and seconds > self.budget.max_seconds:
+            return f"ran for {seconds:.1f}s, which is over {self.budget.max_seconds}s"
+        if self.budget.max_tokens is not None and self.meter.tokens > self.budget.max_tokens:
+            return f"used {self.meter.tokens} tokens, which is over {self.budget.max_tokens}"
+        return None
+
+    def visit(self,
+              pin_name: str) -> Optional[str]:
+        self.visits[pin_name] = self.visits.get(pin_name, 0) + 1
+        max_visits = self.budget.visits_for(pin_name)
+        if not self.fell_back and max_visits is not None and self.visits[pin_name] > max_visits:
+            return f"visited \"{pin_name}\" pin {self.visits[pin_name]} times, which is over {max_visits}"
+        return None
+
+    def hop(self,
+            pin_name: str) -> Optional[str]:
+        self.hops += 1
+        if pin_name == 'end':
+            return None    ## done anyway
+        if self.fell_back:
+            return f"routed to \"{pin_name}\" after falling back to \"{self.budget.fallback}\""
+        if self.budget.max_hops is not None and self.hops > self.budget.max_hops:
+            return f"took {self.hops} routes, which is over {self.budget.max_hops}"
+        return self.visit(pin_name)
+
+class PlanCompilationError(Exception):
+    def __init__(self,
+                 reason: str):
+        self.reason = reason
+        super().__init__(f"could not compile the plan due to: {reason}")
+
+class Program:
+    """
+    a plan compiled for execution: plan elements are kept in order,
+    and every pin is resolved to its index once, so a route is a direct jump
+    instead of a scan of the whole plan
+    """
+    def __init__(self,
+                 plan_steps: List[Union[Pin, Step, Parallel, Route]]):
+
+        self.steps = list(plan_steps)
+        self.pins: Dict[str, int] = {}
+
+        for index, task in enumerate(self.steps):
+            if isinstance(task, Pin):
+                if task.name in self.pins:
+                    raise PlanCompilationError(f"pin \"{task.name}\" is defined more than once "
+                                               f"(at {self.pins[task.name]} and at {index})")
+                self.pins[task.name] = index
+
+        for task in self.steps:
+            if isinstance(task, Route):
+                unknown = [name for name in task.to if name != 'end' and name not in self.pins]
+                if unknown:
+                    raise PlanCompilationError(f"route can go to pins {unknown} that are not in the plan, "
+                                               f"known pins: {list(self.pins)}")
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __getitem__(self, index: int) -> Union[Pin, Step, Parallel, Route]:
+        return self.steps[index]
+
+    def entry(self) -> int:
+        "index of the first element to execute: right after the 'start' pin, or the very first one without it"
+        return self.pins['start'] + 1 if 'start' in self.pins else 0
+
+    def jump(self,
+             pin_name: str) -> int:
+        "index of the first element after the pin"
+        if pin_name == 'end':
+            return len(self.steps)
+        if pin_name not in self.pins:
+            raise ValueError(f"there is no pin \"{pin_name}\" in this plan, known pins: {list(self.pins)}")
+        return self.pins[pin_name] + 1
+
+def compile_plan(plan_steps: Union[Program, List[Union[Pin, Step, Parallel, Route]]]) -> Program:
+    if isinstance(plan_steps, Program):
+        return plan_steps
+    return Program(plan_steps)
+
+class StepResults:
+    """
+    a layered, read only view over the step results that steps take their arguments from
+
+    there is a layer per stash entry, kept in the stash order (later layers win),
+    dict results are their own layer (not copied), other results are a {step_name: result} layer
+    only the layer of the step that was just taken is replaced, the view is never rebuilt
+    """
+    def __init__(self,
+                 stash: Dict[str, Any],
+                 base: Dict[str, Any]):
+
+        self.names: List[str] = []          ## stash order
+        self.view: ChainMap[str, Any] = ChainMap(_read_only(base))
+
+        for name, result in stash.items():
+            self.put(name, result)
+
+    def put(self,
+            name: str,
+            result: Any) -> List[Tuple[str, str]]:
+        "puts a step result in its layer, returns (argument, other step) collisions this result brings"
+
+        layer = _read_only(result) if isinstance(result, dict) else _read_only({name: result})
+
+        if name in self.names:
+            position = len(self.names) - 1 - self.names.index(name)   ## chain map looks up the newest layer first
+            self.view.maps[position] = layer
+        else:
+            self.names.append(name)
+            position = 0
+            self.view.maps.insert(0, layer)
+
+        collisions = []
+        for other, other_layer in zip(reversed(self.names), self.view.maps):
+            if other != name:
+                collisions.extend((key, other) for key in layer if key in other_layer)
+        return collisions
+
+def _read_only(layer: Dict[str, Any]) -> MutableMapping[str, Any]:
+    ## a chain map is typed over mutable layers, this view is only ever read
+    return cast(MutableMapping[str, Any], MappingProxyType(layer))
+
 class Guide:
     def __init__(self,
                  llm: Brain,
@@ -54,125 +263,367 @@ class Guide:
         self.log_level = log_level
 
     def carry_out(self,
-                  plan_steps: List[Union[Pin, Step, Route]],
+                  plan_steps: Union[Program, List[Union[Pin, Step, Parallel, Route]]],
                   plan_id: Optional[str] = None,
-                  start_with: Optional[Any] = None) -> Dict[str, Any]:
-
-        if isinstance(start_with, dict):
-            stash = start_with
+                  start_with: Optional[Any] = None,
+                  checkpoint: Optional[str] = None,
+                  resume_from: Optional[str] = None,
+                  budget: Optional[Budget] = None) -> Dict[str, Any]:
+
+        journal, records = _open_journal(checkpoint, resume_from)
+        flow = self._walk(compile_plan(plan_steps),
+                          plan_id,
+                          start_with,
+                          journal,
+                          records,
+                          budget)
+        try:
+            task, use_context = next(flow)
+            while True:
+                if isinstance(task, Parallel):
+                    results = self._take_parallel_steps(task, use_context)
+                else:
+                    results = [self._take_step(task, use_context)]
+                task, use_context = flow.send(results)
+        except StopIteration as done:
+            return done.value
+        finally:
+            flow.close()
+            if journal:
+                journal.close()
+
+    async def carry_out_async(self,
+                              plan_steps: Union[Program, List[Union[Pin, Step, Parallel, Route]]],
+                              plan_id: Optional[str] = None,
+                              start_with: Optional[Any] = None,
+                              checkpoint: Optional[str] = None,
+                              resume_from: Optional[str] = None,
+                              budget: Optional[Budget] = None) -> Dict[str, Any]:
+        """
+        same plan, same pins and routes as "carry_out", but steps are awaited:
+        "async def" steps run on the event loop, regular steps run in a worker thread
+        every plan runs in its own task context, so many plans can be carried out concurrently on a single loop
+        """
+
+        journal, records = _open_journal(checkpoint, resume_from)
+        flow = self._walk(compile_plan(plan_steps),
+                          plan_id,
+                          start_with,
+                          journal,
+                          records,
+                          budget)
+        try:
+            task, use_context = next(flow)
+            while True:
+                if isinstance(task, Parallel):
+                    results = await self._take_parallel_steps_async(task, use_context)
+                else:
+                    results = [await self._take_step_async(task, use_context)]
+                task, use_context = flow.send(results)
+        except StopIteration as done:
+            return done.value
+        finally:
+            flow.close()
+            if journal:
+                journal.close()
+
+    def _walk(self,
+              program: Program,
+              plan_id: Optional[str],
+              start_with: Optional[Any],
+              journal: Optional[Journal] = None,
+              records: Optional[List[Dict[str, Any]]] = None,
+              budget: Optional[Budget] = None):
+        """
+        walks the plan: pins and routes are followed here,
+        steps to take are yielded out together with their context, and their results are sent back in
+        this way the same flow is carried out by both a sync and an async guide
+
+        when resumed from journal records, the stash and the step index are restored without taking any finished steps
+        """
+
+        if records:
+            stash = records[0]['stash']
+            plan_id = records[0]['plan_id']
         else:
-            stash = {"input": start_with}
+            if isinstance(start_with, dict):
+                stash = start_with
+            else:
+                stash = {"input": start_with}
+
+            if plan_id is None:
+                plan_id = str(uuid.uuid4())
+
+            if journal:
+                journal.start(plan_id, stash)
 
-        if plan_id is None:
-            plan_id = str(uuid.uuid4())
+        step_results = StepResults(stash,
+                                   base={'llm': self.default_llm,
+                                         'tools': self.default_tools,
+                                         'plan_id': plan_id})
 
         current_pin = 'start'
         last_result = None
-        step_index = 0
+        step_index = program.entry()
+
+        for record in (records or [])[1:]:
+            task = program[record['step_index']] if record['step_index'] < len(program) else None
+            if getattr(task, 'name', None) != record['step_name']:
+                raise ValueError(f"plan journal does not match the plan: "
+                                 f"\"{record['step_name']}\" was taken at {record['step_index']}, but the plan has \"{getattr(task, 'name', None)}\" there")
+
+            results = record['result'] if isinstance(task, Parallel) else {record['step_name']: record['result']}
+            for name, result in results.items():
+                stash[name] = result
+                step_results.put(name, result)
+                last_result = result
+
+            current_pin = record['current_pin']
+            step_index = record['step_index'] + 1
+
+        if records:
+            self.debug(f"resuming plan \"{plan_id}\" at \"{current_pin}\" pin, step index: {step_index}")
+
+        if budget and budget.fallback and budget.fallback not in program.pins:
+            raise PlanCompilationError(f"budget falls back to \"{budget.fallback}\" pin that is not in the plan")
 
         self.trace(f"plan validated and ready to roll...         [Ok]")
-        self.trace(f"plan step count..                           [{len(plan_steps)}]")
+        self.trace(f"plan step count..                           [{len(program)}]")
         self.trace(f"kicking it off with..                       \"{stash}\"\n")
 
-        while current_pin != 'end' and step_index < len(plan_steps):
+        with metered() as meter:
 
-            task = plan_steps[step_index]
-            self.trace(f"next: {step_index}, type: {type(task).__name__}")
+            spending = _Spending(budget, meter) if budget else None
 
-            match task:
-                case Pin(name=pin_name):
-                    self.trace(f"  - looking at pin: {pin_name}")
-                    if pin_name == current_pin:
-                        current_pin = None
-                        self.trace(f"  - going into pin: \"{pin_name}\"")
-                    else:
-                        self.trace(f"  - skipping pin: {pin_name} (current pin: {current_pin})")
-                    step_index += 1
+            while step_index < len(program):
 
-                case Step():
-                    self.trace(f"  - reached step: {task.name}")
-                    if current_pin is None:
-                        try:
+                task = program[step_index]
+                self.trace(f"next: {step_index}, type: {type(task).__name__}")
 
-                            step_results = self._to_step_results(stash)
+                if spending and isinstance(task, (Step, Parallel)):
+                    over = spending.step()
+                    if over:
+                        step_index, current_pin = self._fall_back(spending, over, program, stash)
+                        continue
 
-                            use_context = {
-                                'llm': self.default_llm,
-                                'tools': self.default_tools,
-                                'plan_id': plan_id,
-                                **step_results
-                            }
+                match task:
+                    case Pin(name=pin_name):
+                        self.trace(f"  - passing pin: \"{pin_name}\"")
+                        current_pin = pin_name
+                        step_index += 1
 
-                            self.debug(f"🐾 taking a step \"{task.name}\"")
-                            with towel.intel(**use_context):
+                        over = spending.visit(pin_name) if spending else None
+                        if over:
+                            step_index, current_pin = self._fall_back(spending, over, program, stash)
 
-                                self.trace(f"    - with inputs arguments: {use_context}\n")
+                    case Step():
+                        [result] = yield task, step_results.view
+
+                        stash[task.name] = result
+                        self._remember(step_results, task.name, result)
+                        last_result = result
+
+                        if journal:
+                            journal.step(step_index, current_pin, task.name, result)
+                        step_index += 1
 
-                                result = task.func()    ## step function call
+                    case Parallel(steps=branches):
+                        self.debug(f"🐾 taking {len(branches)} steps in parallel: {[branch.name for branch in branches]}")
+                        results = yield task, step_results.view
 
-                            stash[task.name] = result
+                        ## fan in: in plan order
+                        for branch, result in zip(branches, results):
+                            stash[branch.name] = result
+                            self._remember(step_results, branch.name, result)
                             last_result = result
-                            self.trace(f"    - done with step: {task.name}")
-                            self.debug(f"    => {result}", color.GRAY_LIGHT)
-                            # self.trace(f"    - results: {json.dumps(result, indent=4)}", color.GRAY_MEDIUM)
-                        except Exception as e:
-                            self.trace(f"  - (!) could not take this step: {task.name}")
-                            raise StepExecutionError(task.name, e)
-                    else:
-                        self.trace(f"  - skipping step: {task.name} (current_pin: {current_pin})")
-                    step_index += 1
-
-                case Route():
-                    self.trace(f"  - reached route")
-                    if current_pin is None:
+
+                        if journal:
+                            journal.step(step_index, current_pin, task.name, dict(zip([branch.name for branch in branches], results)))
+                        step_index += 1
+
+                    case Route():
+                        self.trace(f"  - reached route")
                         try:
                             new_pin = task.condition(stash)
+                            if new_pin != 'end' and new_pin not in program.pins:
+                                raise ValueError(f"it routes to \"{new_pin}\" pin that is not in the plan (known pins: {list(program.pins)}), "
+                                                 f"declare it with pin(\"{new_pin}\") where the plan should continue")
+                            step_index = program.jump(new_pin)  ## resolved at compile time
                             self.debug(f"routing to \"{new_pin}\"📌")
                             self.trace(f"   - based on \"{stash}\"")
                             current_pin = new_pin
-                            step_index = 0  # reset to start of plan to find the new pin
                         except Exception as e:
                             self.error(f"(!) could not route based on the condition")
                             self.error(f"    - stash: {stash}")
                             raise RouterException(task.condition, e)
-                    else:
-                        self.trace(f"  - skipping route (current pin: {current_pin})")
-                        step_index += 1
 
-                case _:
-                    self.trace(f"  - encountered unknown task type: {type(task)}")
-                    step_index += 1
+                        over = spending.hop(new_pin) if spending else None
+                        if over:
+                            step_index, current_pin = self._fall_back(spending, over, program, stash)
+
+                    case _:
+                        self.trace(f"  - encountered unknown task type: {type(task)}")
+                        step_index += 1
 
-            self.trace(f"  - ready for the next step: {current_pin}, step index: {step_index}")
+                self.trace(f"  - ready for the next step: {current_pin}, step index: {step_index}")
 
         self.debug(f"✔️ all done\n")
         return stash
 
-    def _to_step_results(self,
-                         stash: Dict[str, Any]) -> Dict[str, Any]:
-
-        step_results = {}
-        collisions = []
-
-        for step_name, step_result in stash.items():
-
-            if isinstance(step_result, dict):
-
-                for key, value in step_result.items():
-                    if key in step_results:
-                        collisions.append((key, step_name))
-                    step_results[key] = value
-                    # full_context[f"{step_name}_{key}"] = value
-            else:
-                # if a step result is not a dict, we include it directly
-                step_results[step_name] = step_result
+    def _fall_back(self,
+                   spending: _Spending,
+                   over: str,
+                   program: Program,
+                   stash: Dict[str, Any]) -> Tuple[int, str]:
+        "(step index, pin) to fall back to, when a plan runs out of its budget"
+
+        fallback = spending.budget.fallback
+        if fallback is None or spending.fell_back:
+            self.error(f"(!) plan ran out of its budget: {over}")
+            raise BudgetExceededError(over, stash)
+
+        self.warn(f"plan ran out of its budget: {over}, falling back to \"{fallback}\"📌")
+        spending.fell_back = True
+        return program.jump(fallback), fallback
+
+    def _take_parallel_steps(self,
+                             task: Parallel,
+                             use_context: Mapping[str, Any]) -> List[Any]:
+
+        ## each branch runs in a copy of the current context, so their @towel contexts do not see each other
+        with ThreadPoolExecutor(max_workers=min(task.max_workers, len(task.steps))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run,
+                                   self._take_step,
+                                   branch,
+                                   use_context)
+                       for branch in task.steps]
+
+        ## the first failed branch (in plan order) fails the whole plan
+        return [future.result() for future in futures]
+
+    async def _take_parallel_steps_async(self,
+                                         task: Parallel,
+                                         use_context: Mapping[str, Any]) -> List[Any]:
+
+        bound = asyncio.Semaphore(task.max_workers)
+
+        async def take_branch(branch):
+            async with bound:
+                return await self._take_step_async(branch, use_context)
+
+        ## every branch is its own task, hence its own copy of the context
+        return await asyncio.gather(*[take_branch(branch) for branch in task.steps])
+
+    def _take_step(self,
+                   task: Step,
+                   use_context: Mapping[str, Any]) -> Any:
+
+        key, result = self._recall(task, use_context)
+        if key is None:
+            return self._take_fresh_step(task, use_context)
+
+        if result is _FORGOTTEN:
+            result = self._take_fresh_step(task, use_context)
+            task.memo.put(key, result)
+        return result
+
+    def _recall(self,
+                task: Step,
+                use_context: Mapping[str, Any]) -> Tuple[Optional[str], Any]:
+        "(key, result) of a cached step, where result is _FORGOTTEN on a cache miss, (None, None) for steps that are not cached"
+
+        if task.memo is None:
+            return None, None
+
+        meta = getattr(task.func, '__towel__', {})
+        inputs = {param: use_context[param]
+                  for param in inspect.signature(task.func).parameters if param in use_context}
+
+        try:
+            key = memo.step_key(f"{task.func.__module__}.{task.func.__qualname__}",
+                                inputs,
+                                meta.get('prompts'),
+                                meta.get('llm') or use_context.get('llm'))   ## the model that thinks for this step
+        except TypeError as e:
+            self.warn(f"step \"{task.name}\" is not cached this time: {e}")
+            return None, None
+
+        hit, result = task.memo.get(key)
+        if hit:
+            self.debug(f"🐾 recalled a step \"{task.name}\" (cached)")
+            return key, result
+        return key, _FORGOTTEN
+
+    def _take_fresh_step(self,
+                         task: Step,
+                         use_context: Mapping[str, Any]) -> Any:
+        try:
+            if _is_async(task.func):
+                raise TypeError(f"\"{task.name}\" is an async step, plans with async steps are carried out by \"carry_out_async\"")
+
+            self.debug(f"🐾 taking a step \"{task.name}\"")
+            with towel.intel(use_context):
+
+                if self.log_level == LogLevel.TRACE:
+                    self.trace(f"    - with inputs arguments: {dict(use_context)}\n")
+
+                result = task.func()    ## step function call
+
+            self.trace(f"    - done with step: {task.name}")
+            self.debug(f"    => {result}", color.GRAY_LIGHT)
+            # self.trace(f"    - results: {json.dumps(result, indent=4)}", color.GRAY_MEDIUM)
+            return result
+        except Exception as e:
+            self.trace(f"  - (!) could not take this step: {task.name}")
+            raise StepExecutionError(task.name, e)
+
+    async def _take_step_async(self,
+                               task: Step,
+                               use_context: Mapping[str, Any]) -> Any:
+
+        if not _is_async(task.func):
+            ## a regular step should not block the event loop
+            return await asyncio.to_thread(self._take_step, task, use_context)
+
+        key, result = self._recall(task, use_context)
+        if key is None:
+            return await self._take_fresh_step_async(task, use_context)
+
+        if result is _FORGOTTEN:
+            result = await self._take_fresh_step_async(task, use_context)
+            task.memo.put(key, result)
+        return result
+
+    async def _take_fresh_step_async(self,
+                                     task: Step,
+                                     use_context: Mapping[str, Any]) -> Any:
+        try:
+            self.debug(f"🐾 taking a step \"{task.name}\"")
+            with towel.intel(use_context):
+
+                if self.log_level == LogLevel.TRACE:
+                    self.trace(f"    - with inputs arguments: {dict(use_context)}\n")
+
+                result = await task.func()    ## step function call
+
+            self.trace(f"    - done with step: {task.name}")
+            self.debug(f"    => {result}", color.GRAY_LIGHT)
+            return result
+        except Exception as e:
+            self.trace(f"  - (!) could not take this step: {task.name}")
+            raise StepExecutionError(task.name, e)
+
+    def _remember(self,
+                  step_results: StepResults,
+                  step_name: str,
+                  result: Any):
+
+        collisions = step_results.put(step_name, result)
 
         if collisions:
             self.warn("argument name collisions detected:")
-            for key, step in collisions:
-                self.warn(f"  - argument '{key}' value is overwritten by the later step '{step}'")
-
-        return step_results
+            for key, other_step in collisions:
+                self.warn(f"  - argument '{key}' is returned by both '{step_name}' and '{other_step}' steps, the later one in the plan is used")
 
 
     ## TODO: for now handrolled print with ASCII colors, later use python logging
@@ -208,18 +659,48 @@ class Guide:
         self.log(message, message_color)
 
 
+def _open_journal(checkpoint: Optional[str],
+                  resume_from: Optional[str]) -> Tuple[Optional[Journal], Optional[List[Dict[str, Any]]]]:
+    "a resumed plan keeps on journaling into the journal it was resumed from, unless a new checkpoint is given"
+
+    records, offset = read_journal(resume_from) if resume_from else (None, None)
+    if resume_from and not records:
+        raise ValueError(f"there is nothing to resume from in {resume_from}")
+
+    path = checkpoint or resume_from
+    if path is None:
+        return None, records
+
+    if path == resume_from:
+        return Journal(path, truncate_at=offset), records
+
+    journal = Journal(path)               ## a fresh run, or a resumed one in a new journal: starts over
+    for record in records or []:
+        journal.write(record)
+    return journal, records
+
+def _is_async(func: Callable) -> bool:
+    ## step functions can be wrapped: i.e. by mind maps
+    return inspect.iscoroutinefunction(inspect.unwrap(func))
+
 def step(func: Callable) -> Step:
     return Step(func)
 
+def parallel(*steps: Step,
+             max_workers: Optional[int] = None) -> Parallel:
+    return Parallel(list(steps), max_workers)
+
 def pin(name: str) -> Pin:
     return Pin(name)
 
-def route(condition: Callable[[Dict[str, Any]], str]) -> Route:
-    return Route(condition)
+def route(condition: Callable[[Dict[str, Any]], str],
+          to: Optional[List[str]] = None) -> Route:
+    return Route(condition, to)
 
-def plan(steps: List[Union[Pin, Step, Route]]) -> List[Union[Pin, Step, Route]]:
+def plan(steps: List[Union[Pin, Step, Parallel, Route]]) -> List[Union[Pin, Step, Parallel, Route]]:
     if not isinstance(steps[0], Pin) or steps[0].name != 'start':
         steps.insert(0, Pin('start'))
     if not isinstance(steps[-1], Pin) or steps[-1].name != 'end':
         steps.append(Pin('end'))
+    compile_plan(steps)  ## validate early: i.e. duplicate pins
     return steps
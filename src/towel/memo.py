@@ -0,0 +1,172 @@
+import re
+import copy
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import dataclasses
+from enum import Enum
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+## step results keyed by what went into them:
+##
+##   the step function, its bound inputs, its prompts and the model that thinks for it
+##
+## so a step that is taken again with the same inputs is not taken again, its result is looked up instead
+
+_NOT_INPUTS = ('llm', 'tools', 'plan_id')   ## the model is keyed by its id, tools and plan ids do not make a result
+
+class LRUCache:
+    "in memory, least recently used results are evicted first: results are copied in and out, so nobody changes them in place"
+
+    def __init__(self,
+                 max_size: int = 1024,
+                 ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()    ## key => (stored at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,
+            key: str) -> Tuple[bool, Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl is not None and time.time() - entry[0] > self.ttl):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return True, copy.deepcopy(value)
+
+    def put(self,
+            key: str,
+            value: Any):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+class SqliteCache:
+    "on disk, survives restarts: results older than a ttl are expired, least recently used are evicted over max_size"
+
+    def __init__(self,
+                 path: str,
+                 max_size: int = 10000,
+                 ttl: Optional[float] = None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("create table if not exists results "
+                        "(key text primary key, value blob, stored_at real, used_at real)")
+        self.db.commit()
+
+    def get(self,
+            key: str) -> Tuple[bool, Any]:
+        with self.lock:
+            row = self.db.execute("select value, stored_at from results where key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self.db.execute("delete from results where key = ?", (key,))
+                    self.db.commit()
+                self.misses += 1
+                return False, None
+            self.db.execute("update results set used_at = ? where key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+            return True, pickle.loads(row[0])
+
+    def put(self,
+            key: str,
+            value: Any):
+        with self.lock:
+            now = time.time()
+            self.db.execute("insert or replace into results values (?, ?, ?, ?)",
+                            (key, pickle.dumps(value), now, now))
+            self.db.execute("delete from results where key in "
+                            "(select key from results order by used_at desc limit -1 offset ?)",
+                            (self.max_size,))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")   ## i.e. <object at 0x10a2f3d90>: differs from process to process
+
+def _canonical(value: Any) -> Any:
+    """
+    a stable, json friendly form of a value to hash,
+    raises a TypeError for values that have no such form: i.e. objects that are only known by their address
+    """
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_canonical(v) for v in value]
+        return sorted(items, key=repr) if isinstance(value, (set, frozenset)) else items
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, 'model_dump'):                                      ## pydantic
+        return _canonical(value.model_dump())
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {"dataclass": type(value).__qualname__,
+                "fields": _canonical({field.name: getattr(value, field.name) for field in dataclasses.fields(value)})}
+    if isinstance(value, Enum):
+        return f"{type(value).__qualname__}.{value.name}"
+    if isinstance(value, bytes):
+        return value.hex()
+    if callable(value) and hasattr(value, '__qualname__'):                ## functions and classes
+        return f"{getattr(value, '__module__', None)}.{value.__qualname__}"
+    text = repr(value)
+    if _ADDRESS.search(text):
+        raise TypeError(f"{type(value).__qualname__} has no stable form to be a part of a cache key: {text}")
+    return text
+
+def model_id(llm: Any) -> Optional[str]:
+    if llm is None:
+        return None
+    return f"{llm.__class__.__name__}:{getattr(llm, 'model', None)}"
+
+def step_key(func_name: str,
+             inputs: Dict[str, Any],
+             prompts: Optional[Dict[str, str]],
+             llm: Any) -> str:
+
+    content = {"step": func_name,
+               "inputs": {k: v for k, v in inputs.items() if k not in _NOT_INPUTS},
+               "prompts": prompts or {},
+               "model": model_id(llm)}
+
+    return hashlib.sha256(json.dumps(_canonical(content),
+                                     sort_keys=True).encode('utf-8')).hexdigest()
+
+def thought_key(provider: str,
+                model: Optional[str],
+                messages: Any,
+                stream: bool,
+                params: Dict[str, Any],
+                response_model: Any) -> str:
+    "a \"think\" keyed by the model, the messages, sampling params, tools and the response model schema"
+
+    content = {"model": f"{provider}:{model}",
+               "messages": messages,
+               "stream": bool(stream),
+               "params": {k: v for k, v in params.items() if v is not None},
+               "response_model": response_model.model_json_schema() if response_model else None}
+
+    return hashlib.sha256(json.dumps(_canonical(content),
+                                     sort_keys=True).encode('utf-8')).hexdigest()
+
+default_cache = LRUCache()
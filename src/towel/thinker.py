@@ -1,60 +1,146 @@
+import time
+import asyncio
 import argparse
-
-from functools import wraps
-from typing import Any, Dict, List, Optional, Union
+import inspect
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+from functools import wraps, partial
+from typing import Any, Callable, Dict, List, Optional, Union, Iterable, Generator, cast
 from .tools import color
-from .brain.base import Brain, DeepThought, ToolUseThought, TextThought
-from .guide import Guide, Step, Pin, Route
+from .brain.base import Brain, DeepThought, ToolUseThought, TextThought, ModelTurns, _model_turns, _batch_limits, Usage, usage_of
+from .guide import Guide, Step, Parallel, Pin, Route
 from towel.base import towel, intel
 
 from towel.tools import LogLevel
 
 from .brain.claude import Claude
 from .brain.ollama import Ollama
+from .brain.hedge import Hedge
+from .brain.pool import OllamaPool
+
+def _tool_timeout(timeout: Optional[Union[float, Dict[str, float]]],
+                  name: str) -> Optional[float]:
+    return timeout.get(name) if isinstance(timeout, dict) else timeout
+
+def _called(thought: ToolUseThought,
+            took: float,
+            result: Any = None,
+            error: Optional[str] = None) -> Dict[str, Any]:
+    called: Dict[str, Any] = {"tool_id": thought.id,
+                              "tool_name": thought.name,
+                              "input": thought.input}
+    if error is not None:
+        called["error"] = error
+    else:
+        called["result"] = result
+    called["took"] = took
+    return called
+
+def _call_tool(thought: ToolUseThought,
+               tool_function,
+               timeout: Optional[float]) -> Dict[str, Any]:
+    "calls a tool in a thread of its own: an async one in its own event loop, where it is cancelled once it is out of time"
+    started = time.monotonic()
+    if tool_function is None:
+        return _called(thought, 0.0, error=f"function '{thought.name}' not found")
+    try:
+        ## TODO: log vs. print
+        print(color.GRAY_DIUM + f"calling tool: {thought.name}" + color.END)
+        if inspect.iscoroutinefunction(tool_function):
+            result = asyncio.run(asyncio.wait_for(tool_function(**thought.input), timeout))
+        else:
+            result = tool_function(**thought.input)
+        return _called(thought, time.monotonic() - started, result=result)
+    except asyncio.TimeoutError:
+        return _called(thought, time.monotonic() - started, error=f"timed out after {timeout}s")
+    except Exception as e:
+        return _called(thought, time.monotonic() - started, error=str(e))
+
+def _on_a_daemon(call: Callable[[], Any]) -> Future:
+    "calls in a daemon thread: a tool that is out of time is abandoned there, and does not keep the process from exiting"
+    future: Future = Future()
+    future.set_running_or_notify_cancel()          ## it is running: there is no cancelling it, only abandoning
+    def run():
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True).start()
+    return future
 
 def call_tools(deep_thought: DeepThought,
-               tools) -> List[Dict[str, Any]]:
+               tools,
+               timeout: Optional[Union[float, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
     """
     process the DeepThought response, calling tools if necessary
 
-    tools is a {name: function} dictionary
+    tools is a {name: function} dictionary, functions could be async
+    tools are called all at once, each within "timeout" seconds: for all the tools, or a {name: seconds} dictionary
+
+    results come back in the order tools were asked for, with seconds every call "took"
+    a tool that is out of time is cancelled when it is async, and abandoned (left to finish in its daemon thread) when it is not
     """
     if deep_thought.stop_reason != "tool_use":
         return []
 
-    tool_results = []
+    calls = [thought for thought in deep_thought.content if isinstance(thought, ToolUseThought)]
+    if not calls:
+        return []
+
+    started = time.monotonic()
+    futures = [_on_a_daemon(partial(contextvars.copy_context().run,
+                                    _call_tool,
+                                    thought,
+                                    tools.get(thought.name, None),
+                                    _tool_timeout(timeout, thought.name)))
+               for thought in calls]
 
-    for thought in deep_thought.content:
-        if isinstance(thought, ToolUseThought):
-            tool_function = tools.get(thought.name, None)
-            if tool_function is None:
-                tool_results.append({
-                    "tool_id": thought.id,
-                    "tool_name": thought.name,
-                    "input": thought.input,
-                    "error": f"function '{thought.name}' not found"
-                })
-            else:
-                try:
-                    ## TODO: log vs. print
-                    print(color.GRAY_DIUM + f"calling tool: {thought.name}" + color.END)
-                    result = tool_function(**thought.input)
-                    tool_results.append({
-                        "tool_id": thought.id,
-                        "tool_name": thought.name,
-                        "input": thought.input,
-                        "result": result
-                    })
-                except Exception as e:
-                    tool_results.append({
-                        "tool_id": thought.id,
-                        "tool_name": thought.name,
-                        "input": thought.input,
-                        "error": str(e)
-                    })
+    tool_results = []
+    for thought, future in zip(calls, futures):
+        limit = _tool_timeout(timeout, thought.name)
+        try:
+            tool_results.append(future.result(timeout=None if limit is None
+                                              else max(0.0, started + limit - time.monotonic())))
+        except FutureTimeout:
+            tool_results.append(_called(thought, time.monotonic() - started, error=f"timed out after {limit}s"))
 
     return tool_results
 
+async def _acall_tool(thought: ToolUseThought,
+                      tool_function,
+                      timeout: Optional[float]) -> Dict[str, Any]:
+    started = time.monotonic()
+    if tool_function is None:
+        return _called(thought, 0.0, error=f"function '{thought.name}' not found")
+    try:
+        print(color.GRAY_DIUM + f"calling tool: {thought.name}" + color.END)
+        if inspect.iscoroutinefunction(tool_function):
+            call = tool_function(**thought.input)
+        else:
+            call = asyncio.wrap_future(_on_a_daemon(partial(contextvars.copy_context().run, tool_function, **thought.input)))
+        result = await asyncio.wait_for(call, timeout)
+        return _called(thought, time.monotonic() - started, result=result)
+    except asyncio.TimeoutError:
+        return _called(thought, time.monotonic() - started, error=f"timed out after {timeout}s")
+    except Exception as e:
+        return _called(thought, time.monotonic() - started, error=str(e))
+
+async def acall_tools(deep_thought: DeepThought,
+                      tools,
+                      timeout: Optional[Union[float, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
+    "same as \"call_tools\", but awaited: async tools are awaited, the others are called in threads"
+    if deep_thought.stop_reason != "tool_use":
+        return []
+
+    return list(await asyncio.gather(*[_acall_tool(thought,
+                                                   tools.get(thought.name, None),
+                                                   _tool_timeout(timeout, thought.name))
+                                       for thought in deep_thought.content
+                                       if isinstance(thought, ToolUseThought)]))
+
 def _parse_args():
     parser = argparse.ArgumentParser(description="thinking with a model")
     parser.add_argument('--provider', '-p',
@@ -81,15 +167,16 @@ def from_cli():
 
     args = _parse_args()
 
+    ## only the provider asked for is made
     providers = {
-        'ollama':      Ollama(model=args.model,
-                              url=args.url),
-        'anthropic':   Claude(model=args.model),
-        # 'openai':    OpenAI(model=args.model),
-        # 'replicate': Replicate(model=args.model)
+        'ollama':      lambda: Ollama(model=args.model,
+                                      url=args.url),
+        'anthropic':   lambda: Claude(model=args.model),
+        # 'openai':    lambda: OpenAI(model=args.model),
+        # 'replicate': lambda: Replicate(model=args.model)
         }
 
-    brain = providers[args.provider]
+    brain = providers[args.provider]()
     print(color.GRAY_MEDIUM + f"{brain}" + color.END)
 
     return brain
@@ -121,7 +208,46 @@ def serialize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 ## make thinker help planning instead of the Guide .carry_out
 ##      i.e. single interface for thinking and planning
 
-def plan(steps: List[Union[Step, Pin, Route]],
+def _with_mind_map(step: Union[Step, Parallel, Pin, Route],
+                   mind_map: Dict[str, Brain]) -> Union[Step, Parallel, Pin, Route]:
+
+    if isinstance(step, Parallel):
+        return Parallel([cast(Step, _with_mind_map(branch, mind_map)) for branch in step.steps],
+                        step.max_workers)
+
+    if isinstance(step, Step) and step.func.__name__ in mind_map:
+
+        def create_wrapper(original_func, step_llm):
+
+            ## need this to override the step specific llm in the context
+            ##              according to the mind_map
+            if inspect.iscoroutinefunction(inspect.unwrap(original_func)):
+                @wraps(original_func)
+                async def async_wrapper(*args, **kwargs):
+                    with intel(llm=step_llm):
+                        return await original_func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(original_func)
+            def wrapper(*args, **kwargs):
+                with intel(llm=step_llm):
+                    return original_func(*args, **kwargs)
+            return wrapper
+
+        step_llm = mind_map[step.func.__name__]
+        new_func = create_wrapper(step.func,
+                                  step_llm)
+        meta = getattr(step.func, '__towel__', {})
+        new_func.__towel__ = {**meta, 'llm': meta.get('llm') or step_llm}   ## cached steps are keyed by the model that thinks for them:
+                                                                            ## a towel's own llm wins over the mind map
+        new_step = Step(new_func)
+        new_step.additional_inputs = step.additional_inputs.copy()
+        new_step.memo = step.memo
+        return new_step
+
+    return step
+
+def plan(steps: List[Union[Step, Parallel, Pin, Route]],
          llm: Brain,
          mind_map: Optional[Dict[str, Brain]] = None, # {step_name: llm}
          start_with: Optional[Any] = None,
@@ -132,34 +258,110 @@ def plan(steps: List[Union[Step, Pin, Route]],
                   log_level=log_level)
 
     if mind_map:
+        steps = [_with_mind_map(step, mind_map) for step in steps]
+
+    # set the default llm in the context for all other steps
+    with intel(llm=llm):
+        return guide.carry_out(steps,
+                               start_with=start_with,
+                               **kwargs)
 
-        modified_steps: List[Union[Step, Pin, Route]] = []
+async def plan_async(steps: List[Union[Step, Parallel, Pin, Route]],
+                     llm: Brain,
+                     mind_map: Optional[Dict[str, Brain]] = None, # {step_name: llm}
+                     start_with: Optional[Any] = None,
+                     log_level=LogLevel.DEBUG,
+                     **kwargs: Any) -> Dict[str, Any]:
 
-        for step in steps:
-            if isinstance(step, Step) and step.func.__name__ in mind_map:
+    guide = Guide(llm=llm,
+                  log_level=log_level)
 
-                def create_wrapper(original_func, step_llm):
+    if mind_map:
+        steps = [_with_mind_map(step, mind_map) for step in steps]
 
-                    ## need this to override the step specific llm in the context
-                    ##              according to the mind_map
-                    @wraps(original_func)
-                    def wrapper(*args, **kwargs):
-                        with intel(llm=step_llm):
-                            return original_func(*args, **kwargs)
-                    return wrapper
+    with intel(llm=llm):
+        return await guide.carry_out_async(steps,
+                                           start_with=start_with,
+                                           **kwargs)
+
+class Outcome:
+    "how a single plan run of a batch went: its input, and either a result or an error"
+    def __init__(self,
+                 index: int,
+                 input: Any,
+                 result: Optional[Dict[str, Any]] = None,
+                 error: Optional[Exception] = None):
+        self.index = index
+        self.input = input
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"Outcome(index={self.index}, {'result' if self.ok else 'error'}={self.result if self.ok else self.error!r})"
+
+def plan_many(steps: List[Union[Step, Parallel, Pin, Route]],
+              inputs: Iterable[Any],
+              llm: Brain,
+              mind_map: Optional[Dict[str, Brain]] = None, # {step_name: llm}
+              max_concurrency: int = 4,
+              provider_limits: Optional[Dict[str, int]] = None, # {provider: max concurrent thinks}, i.e. {"ollama": 2}
+              group_by_model: bool = False,
+              log_level=LogLevel.INFO,
+              **kwargs: Any) -> Generator[Outcome, None, None]:
+    """
+    carries out the same plan for every input, at most "max_concurrency" plans at a time
+    outcomes are yielded as plans finish (not in the input order): every run has its own intel,
+    and a failed run is reported in its outcome without stopping the batch
 
-                new_func = create_wrapper(step.func,
-                                          mind_map[step.func.__name__])
-                new_step = Step(new_func)
-                new_step.additional_inputs = step.additional_inputs.copy()
-                modified_steps.append(new_step)
-            else:
-                modified_steps.append(step)
+    inputs are taken as runs start: at most "max_concurrency" of them are in flight, so "inputs" could be a (long) generator
 
-        steps = modified_steps
+    "provider_limits" caps concurrent thinking per provider for the runs of this batch,
+    instead of the caps of the process (see brain.base.limit_concurrency), that are left as they are
 
-    # set the default llm in the context for all other steps
-    with intel(llm=llm):
-        return guide.carry_out(steps,
-                               start_with=start_with,
-                               **kwargs)
+    "group_by_model" has thoughts of all the plans that share an Ollama server take turns by model (see brain.base.ModelTurns),
+    so only one model thinks on a server at a time
+    """
+
+    limits = {provider.lower(): threading.BoundedSemaphore(max_concurrent)
+              for provider, max_concurrent in (provider_limits or {}).items()}
+
+    turns = ModelTurns() if group_by_model else None
+
+    def run(index, start_with):
+        if limits:
+            _batch_limits.set(limits)  ## in this run's own context
+        if turns:
+            _model_turns.set(turns)
+        try:
+            return Outcome(index,
+                           start_with,
+                           result=plan(steps,
+                                       llm=llm,
+                                       mind_map=mind_map,
+                                       start_with=start_with,
+                                       log_level=log_level,
+                                       **kwargs))
+        except Exception as e:
+            return Outcome(index, start_with, error=e)
+
+    runs = enumerate(inputs)
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def start(how_many: int):
+        ## every run starts in its own copy of the caller's context
+        return {pool.submit(contextvars.copy_context().run, run, index, start_with)
+                for index, start_with in itertools.islice(runs, how_many)}
+
+    try:
+        in_flight = start(max_concurrency)
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight |= start(len(done))          ## the next runs start before outcomes are looked at
+            for future in done:
+                yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -5,10 +5,15 @@ from urllib.parse import urlparse
 from pathlib import Path
 from datetime import datetime
 import random
-import copy
 import json
-
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import asyncio
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+from tenacity import Retrying, AsyncRetrying, RetryError, stop_after_attempt, stop_any, retry_if_exception_type
+from tenacity.stop import stop_base
 from pydantic import ValidationError
 
 class LogLevel(Enum):
@@ -187,6 +192,56 @@ def check_connection(url,
     except requests.RequestException as e:
         raise ConnectionError(f"{message}. tried connecting to: {url} but could not due to {e}")
 
+## ----------------------------------------------------- server health, checked once per url and remembered
+
+class _Health:
+    def __init__(self):
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()    ## a url is checked by one caller at a time, the others wait for its answer
+
+_health: Dict[str, _Health] = {}
+_health_lock = threading.Lock()
+
+def check_health(url,
+                 message="failed to connect to server",
+                 ttl: float = 30,
+                 failed_ttl: float = 5,
+                 timeout: int = 10) -> float:
+    """
+    "check_connection" that is remembered per url for "ttl" seconds ("failed_ttl" when it failed),
+    so many brains (or many threads) of the same server do not check it over and over
+
+    returns the (monotonic) time until which the url is known to be healthy
+    """
+    with _health_lock:
+        health = _health.setdefault(url, _Health())
+
+    with health.lock:
+        now = time.monotonic()
+        if health.checked_at is None or now - health.checked_at > (failed_ttl if health.error else ttl):
+            try:
+                check_connection(url, message, timeout)
+                health.error = None
+            except ConnectionError as e:
+                health.error = str(e)
+            health.checked_at = time.monotonic()
+
+        if health.error:
+            raise ConnectionError(health.error)
+        return health.checked_at + ttl
+
+def check_health_in_background(url,
+                               message="failed to connect to server",
+                               **kwargs):
+    "starts checking a url right away, so its health is known (or being learned) by the time it is needed"
+    def check():
+        try:
+            check_health(url, message, **kwargs)
+        except ConnectionError:
+            pass                        ## remembered, and raised to whoever needs the url
+    threading.Thread(target=check, daemon=True).start()
+
 def warn(message,
          who="thinker"):
     print(color.BLUE + "> " + color.BOLD + color.YELLOW + color.UNDERLINE + who + color.END + ": ", end="")
@@ -195,61 +250,322 @@ def warn(message,
 
 ## ----------------------------------------------------- retrying instructor calls
 
-def wrap_retry(max_attempts=5,
-               wait_multiplier=1,
-               wait_min=4,
-               wait_max=10,
-               retry_exceptions=(ValidationError)):
-    return retry(
-        stop=stop_after_attempt(max_attempts),
-        wait=wait_exponential(multiplier=wait_multiplier,
-                              min=wait_min,
-                              max=wait_max),
-        retry=retry_if_exception_type(retry_exceptions),
-        reraise=True
-    )
-
-## TODO: optionally change seed, temperature on retries
+class RetryBudget:
+    """
+    one budget for all the attempts to get a thought right: instructor's re-asks and the retries around them
+    "max_attempts" (calls to the model), "max_tokens" (of all the attempts) and "max_seconds" are never exceeded
+    """
+    def __init__(self,
+                 max_attempts: int = 5,
+                 max_tokens: Optional[int] = None,
+                 max_seconds: Optional[float] = 120):
+        self.max_attempts = max_attempts
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.attempts = 0
+        self.tokens = 0
+        self.started = time.monotonic()
+
+    def seconds_left(self) -> Optional[float]:
+        if self.max_seconds is None:
+            return None
+        return self.max_seconds - (time.monotonic() - self.started)
+
+    def spent(self,
+              upcoming: int = 0) -> bool:
+        "whether there is nothing left for another attempt, that is expected to take \"upcoming\" tokens"
+        return (self.attempts >= self.max_attempts
+                or (self.max_tokens is not None and self.tokens + upcoming >= self.max_tokens)
+                or (self.max_seconds is not None and self.seconds_left() <= 0))
+
+    def __repr__(self):
+        return f"RetryBudget(attempts={self.attempts}/{self.max_attempts}, tokens={self.tokens}/{self.max_tokens}, max_seconds={self.max_seconds})"
+
+class RetryMeter:
+    "what retries cost, across all the thoughts of a process"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.thoughts = 0
+            self.attempts = 0                          ## calls to models, re-asks included
+            self.retries = {"invalid": 0, "transient": 0, "throttled": 0}   ## throttled ones are waited out by the brain's pacing
+            self.wasted_tokens = 0                     ## of attempts that did not make it
+            self.waited = 0.0                          ## seconds slept backing off
+            self.gave_up = 0
+            self.repaired = 0                          ## responses repaired locally: round trips to the model saved
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                if name in self.retries:
+                    self.retries[name] += value
+                else:
+                    setattr(self, name, getattr(self, name) + value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"thoughts": self.thoughts,
+                    "attempts": self.attempts,
+                    "retries": dict(self.retries),
+                    "wasted_tokens": self.wasted_tokens,
+                    "waited": round(self.waited, 3),
+                    "gave_up": self.gave_up,
+                    "repaired": self.repaired}
+
+retry_meter = RetryMeter()
+
+def _retry_after(e: Optional[BaseException]) -> Optional[float]:
+    "seconds a provider asked to wait before trying again (i.e. a 429), if it did"
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        response = getattr(e, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers is not None and getattr(response, 'status_code', None) in (429, 503, 529):
+            try:
+                return float(headers.get('retry-after', 1))
+            except (TypeError, ValueError):
+                return 1.0
+        e = e.__cause__ or e.__context__
+    return None
+
+def _retry_kind(e: Optional[BaseException]) -> Optional[str]:
+    """
+    "invalid":   the model said something that does not validate: asked again right away, differently
+    "throttled": the provider asked to "retry-after": left to the brain's pacing, that waits it out for all thoughts of the provider
+    "transient": unreachable, timed out or broke (5xx): asked again after a short backoff
+    None:        would fail the same way again (i.e. a 400 or a 401)
+    """
+    if hasattr(e, 'n_attempts'):                       ## instructor gave up: on what it failed with last
+        failed = getattr(e, 'failed_attempts', None)
+        last = failed[-1].exception if failed else e.__cause__
+        if isinstance(last, RetryError):
+            last = last.last_attempt.exception()
+        if last is None or hasattr(last, 'n_attempts'):
+            return "invalid"
+        e = last
+    if isinstance(e, (ValidationError, json.JSONDecodeError)):
+        return "invalid"
+    if _retry_after(e) is not None:
+        return "throttled"
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, (ConnectionError, TimeoutError, httpx.TransportError)):
+            return "transient"
+        if (getattr(e, 'status_code', None) or 0) >= 500:
+            return "transient"
+        e = e.__cause__ or e.__context__
+    return None
+
+def _tokens_of(usage) -> int:
+    "tokens of an anthropic (input / output) or openai (prompt / completion / total) usage"
+    if usage is None:
+        return 0
+    if isinstance(usage, int):
+        return usage
+    total = getattr(usage, 'total_tokens', None)
+    if total is not None:
+        return total
+    return (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+
+def _tokens_of_attempt(result=None, error=None) -> int:
+    """
+    tokens of a try, its re-asks included: of instructor's raw response,
+    or, when instructor gave up, of what it counted (or of the raw responses it failed with)
+    """
+    if error is None:
+        return _tokens_of(getattr(getattr(result, '_raw_response', None), 'usage', None))
+    total = getattr(error, 'total_usage', None)
+    if total is not None:
+        return _tokens_of(total)
+    failed = getattr(error, 'failed_attempts', None)
+    if failed:
+        return sum(_tokens_of(getattr(attempt.completion, 'usage', None)) for attempt in failed)
+    return _tokens_of(getattr(getattr(error, 'last_completion', None), 'usage', None))
+
+def _fresh(messages):
+    """
+    messages for an attempt: instructor appends its re-asks to the list and may add to the first message,
+    so the list and the message dicts are new, but whatever they hold (i.e. images, papers) is shared, not copied
+    """
+    return [dict(message) if isinstance(message, dict) else message for message in messages]
+
+def retry_params(kwargs) -> Dict[str, Any]:
+    """
+    pops retry params of a thought out of its kwargs:
+    "retry_budget" (a RetryBudget), or "max_retries" (calls to the model to get a valid response, re-asks included),
+    and "instructor_retries" (re-asks within a single try)
+    """
+    max_retries = kwargs.pop('max_retries', 5)
+    budget = kwargs.pop('retry_budget', None) or RetryBudget(max_attempts=max_retries)
+    return {"budget": budget,
+            "reasks": kwargs.pop('instructor_retries', 3)}
+
+def _estimated_tokens(messages) -> int:
+    "~4 characters per token"
+    return len(json.dumps(messages, default=str)) // 4
+
+class _over_budget(stop_base):
+    """
+    stops re-asking once the next re-ask would go over the budget's tokens:
+    instructor tells what a try took only once it is over, until then every call of the try is taken to cost
+    the conversation so far, that instructor adds the response and the re-ask to
+    """
+    def __init__(self,
+                 budget: RetryBudget,
+                 conversation: List[Any]):
+        self.budget = budget
+        self.conversation = conversation
+        self.tokens = 0
+
+    def __call__(self, retry_state) -> bool:
+        if self.budget.max_tokens is None:
+            return self.budget.spent()                     ## nothing to estimate
+        asked = _estimated_tokens(self.conversation)
+        self.tokens += asked                               ## the call that did not validate
+        return self.budget.spent(self.tokens + asked)      ## and the re-ask that would ask it all again
+
+def _reasks(budget: RetryBudget,
+            reasks: int,
+            conversation: List[Any],
+            retrying=Retrying):
+    "instructor re-asks a model whose response does not validate: up to \"reasks\" times in a conversation, and as long as the budget lets it"
+
+    def count(state):
+        budget.attempts += 1
+        retry_meter.add(attempts=1)
+
+    return retrying(stop=stop_any(stop_after_attempt(max(reasks, 1)),
+                                  _over_budget(budget, conversation)),
+                    retry=retry_if_exception_type((ValidationError, json.JSONDecodeError)),
+                    before=count,
+                    reraise=False)         ## instructor tells what the tries it gave up on took: "total_usage"
+
+def _retry_differently(instructor_kwargs,
+                       new_seed=False):
+
+    warn(f"retrying: asking \"{instructor_kwargs['model']}\" to conform the response into \"{instructor_kwargs['response_model'].__name__}\" type")
+
+    ## these won't work for Ollama via instructor until: https://github.com/jxnl/instructor/issues/816
+    if new_seed:
+        # create a new seed for each attempt
+        current_seed = random.randint(0, 2**32 - 1)  # 32-bit integer
+        instructor_kwargs['seed'] = current_seed
+
+    instructor_kwargs['temperature'] = round(random.uniform(0, 0.4), 1) # lowering temperature for retries
+    ## instructor_kwargs['options']['temperature']...
+
+def _backoff(retry: int,
+             budget: RetryBudget) -> Optional[float]:
+    "seconds to wait before a transient error is retried, or None when the budget has no time for it"
+    wait = min(0.5 * 2 ** retry, 8) * random.uniform(0.5, 1)
+    left = budget.seconds_left()
+    if left is not None and wait >= left:
+        return None
+    return wait
+
+def _retried(e: Exception,
+             kind: Optional[str],
+             tries: int,
+             budget: RetryBudget,
+             instructor_kwargs,
+             new_seed: bool) -> Optional[float]:
+    "seconds to wait before the next try, or None when there is no next try"
+    if kind == "throttled":
+        retry_meter.add(throttled=1)
+        return None
+    upcoming = _estimated_tokens(instructor_kwargs['messages']) if budget.max_tokens is not None else 0
+    if kind not in ("invalid", "transient") or budget.spent(upcoming):
+        retry_meter.add(gave_up=1)
+        return None
+    if kind == "invalid":
+        retry_meter.add(invalid=1)
+        _retry_differently(instructor_kwargs, new_seed)
+        return 0                                       ## a validation error is not going away by waiting
+    wait = _backoff(tries, budget)
+    if wait is None:
+        retry_meter.add(gave_up=1)
+        return None
+    retry_meter.add(transient=1, waited=wait)
+    return wait
+
 def with_retry(iclient,
                instructor_kwargs,
-               config=None,
-               new_seed=False):
-
-    if config is None:
-        config = {}
-
-    messages = copy.deepcopy(instructor_kwargs['messages'])
-
-    @wrap_retry(**config)
-    def _with_retry():
+               budget: Optional[RetryBudget] = None,
+               reasks: int = 3,
+               new_seed=False,
+               attempts=None):
+    """
+    asks instructor for a "response_model" within a "budget": instructor re-asks a model whose response does not validate,
+    and once it has re-asked "reasks" times, the thought is tried again from scratch (a new seed, a lower temperature)
+
+    "attempts", when given, is a list every try appends the tokens it took to
+    """
+
+    budget = budget or RetryBudget()
+    messages = instructor_kwargs['messages']
+    differently = {k: v for k, v in instructor_kwargs.items() if k != 'max_retries'}
+    retry_meter.add(thoughts=1)
+
+    for tries in itertools.count():
         try:
-
-            instructor_kwargs['messages'] = copy.deepcopy(messages)
-            # print(f"""trying with: {json.dumps(instructor_kwargs['messages'], indent=2)},
-            #           instructor retries: {instructor_kwargs['max_retries']}""")
-
-            return iclient.chat.completions.create(**instructor_kwargs)
-
-        except ValidationError as e:
-
-            warn(f"retrying: asking \"{instructor_kwargs['model']}\" to conform the response into \"{instructor_kwargs['response_model'].__name__}\" type")
-
-            ## these won't work for Ollama via instructor until: https://github.com/jxnl/instructor/issues/816
-            if new_seed:
-                # create a new seed for each attempt
-                current_seed = random.randint(0, 2**32 - 1)  # 32-bit integer
-                instructor_kwargs['seed'] = current_seed
-
-            instructor_kwargs['temperature'] = round(random.uniform(0, 0.4), 1) # lowering temperature for retries
-            ## instructor_kwargs['options']['temperature']...
-
-            instructor_kwargs['max_retries'] = instructor_kwargs.get('max_retries', 0) + 3
-
-            # print(f"messages after: {json.dumps(instructor_kwargs['messages'], indent=2)}")
-
-            raise
+            conversation = _fresh(messages)
+            result = iclient.chat.completions.create(**{**differently,
+                                                        'messages': conversation,
+                                                        'max_retries': _reasks(budget, reasks, conversation)})
+            tokens = _tokens_of_attempt(result=result)
+            budget.tokens += tokens
+            if attempts is not None:
+                attempts.append(tokens)
+            return result
 
         except Exception as e:
-            raise
+            tokens = _tokens_of_attempt(error=e)
+            budget.tokens += tokens
+            retry_meter.add(wasted_tokens=tokens)
+            if attempts is not None:
+                attempts.append(tokens)
+            wait = _retried(e, _retry_kind(e), tries, budget, differently, new_seed)
+            if wait is None:
+                raise
+            time.sleep(wait)
+
+async def with_retry_async(aiclient,
+                           instructor_kwargs,
+                           budget: Optional[RetryBudget] = None,
+                           reasks: int = 3,
+                           new_seed=False,
+                           attempts=None):
+    "same as \"with_retry\", but for async instructor clients"
+
+    budget = budget or RetryBudget()
+    messages = instructor_kwargs['messages']
+    differently = {k: v for k, v in instructor_kwargs.items() if k != 'max_retries'}
+    retry_meter.add(thoughts=1)
+
+    for tries in itertools.count():
+        try:
+            conversation = _fresh(messages)
+            result = await aiclient.chat.completions.create(**{**differently,
+                                                               'messages': conversation,
+                                                               'max_retries': _reasks(budget, reasks, conversation, AsyncRetrying)})
+            tokens = _tokens_of_attempt(result=result)
+            budget.tokens += tokens
+            if attempts is not None:
+                attempts.append(tokens)
+            return result
 
-    return _with_retry()
+        except Exception as e:
+            tokens = _tokens_of_attempt(error=e)
+            budget.tokens += tokens
+            retry_meter.add(wasted_tokens=tokens)
+            if attempts is not None:
+                attempts.append(tokens)
+            wait = _retried(e, _retry_kind(e), tries, budget, differently, new_seed)
+            if wait is None:
+                raise
+            await asyncio.sleep(wait)
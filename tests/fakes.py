@@ -0,0 +1,167 @@
+import time
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from pydantic import ValidationError
+from tenacity import RetryError
+
+from towel.brain.base import Brain, DeepThought, TextThought, Usage, Stream
+from towel.brain.ollama import Ollama
+from towel.guide import Guide
+from towel.tools import squuid, LogLevel
+
+def carry_out(steps, llm=None, **kwargs):
+    "carries out a plan with a guide of its own"
+    return Guide(llm=llm, log_level=LogLevel.INFO).carry_out(steps, **kwargs)
+
+class Echo(Brain):
+    "a brain that thinks by echoing the last message back: counts its thoughts, and can take its time"
+
+    def __init__(self,
+                 model: str = "echo",
+                 delay: float = 0.0,
+                 chunks: int = 3):
+        super().__init__(model=model)
+        self.delay = delay
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.thoughts = 0
+        self.asked: List = []
+
+    def _think(self, messages, stream, model, max_tokens, context_window, temperature,
+               tools, tool_choice, response_model, **kwargs):
+        with self.lock:
+            self.thoughts += 1
+            self.asked.append(messages)
+        if self.delay:
+            time.sleep(self.delay)
+        text = messages if isinstance(messages, str) else messages[-1]['content']
+        if stream:
+            return Stream((f"{text}:{i}" for i in range(self.chunks)),
+                          Usage(input_tokens=len(text), output_tokens=self.chunks))
+        if response_model is not None:
+            return response_model(answer=text)
+        return self._to_deep_thought(text)
+
+    def _to_deep_thought(self, response) -> DeepThought:
+        return DeepThought(id=str(squuid()),
+                           content=[TextThought(text=response)],
+                           model=self.model,
+                           stop_reason="end_turn",
+                           tokens_used=10,
+                           usage=Usage(input_tokens=5, output_tokens=5))
+
+def ollama(model="llama3",
+           **clients_and_options):
+    "an ollama brain whose (fake) clients are given: i.e. ollama(client=FakeOllama(), structured=\"schema\")"
+    clients: Dict[str, Any] = {name: clients_and_options.pop(name)
+               for name in ("client", "aclient", "iclient", "aiclient") if name in clients_and_options}
+    brain = Ollama(model=model, health_check=None, **clients_and_options)
+    brain.__dict__.update(clients)
+    return brain
+
+class FakeOllama:
+    "an ollama client (sync or async) that answers from a script: every call is recorded"
+
+    def __init__(self,
+                 answer: str = "42",
+                 chunks: int = 3,
+                 asynchronous: bool = False):
+        self.answer = answer
+        self.chunks = chunks
+        self.asynchronous = asynchronous
+        self.calls: List = []
+
+    def _response(self, kwargs):
+        done = {"done": True, "model": kwargs["model"], "done_reason": "stop",
+                "prompt_eval_count": 7, "eval_count": 3, "eval_duration": 3_000_000,
+                "context": [1, 2, 3]}
+        if "messages" in kwargs:
+            return {**done, "message": {"role": "assistant", "content": self.answer}}
+        return {**done, "response": self.answer}
+
+    def _parts(self, kwargs):
+        chat = "messages" in kwargs
+        for i in range(self.chunks):
+            text = f"{self.answer}:{i}"
+            yield ({"done": False, "message": {"content": text}} if chat else {"done": False, "response": text})
+        last = self._response(kwargs)
+        if chat:
+            last["message"] = {"content": ""}
+        else:
+            last["response"] = ""
+        yield last
+
+    def _call(self, kind, kwargs):
+        self.calls.append((kind, kwargs))
+        if kwargs.get("stream"):
+            if self.asynchronous:
+                async def parts():
+                    for part in self._parts(kwargs):
+                        yield part
+                return parts()
+            return self._parts(kwargs)
+        return self._response(kwargs)
+
+    def chat(self, **kwargs):
+        return self._answered(self._call("chat", kwargs))
+
+    def generate(self, **kwargs):
+        return self._answered(self._call("generate", kwargs))
+
+    def _answered(self, response):
+        if not self.asynchronous:
+            return response
+        async def answered():
+            return response
+        return answered()
+
+class GaveUp(Exception):
+    "instructor's InstructorRetryException: what instructor raises once its re-asks (\"max_retries\") stop"
+
+    def __init__(self, cause, last_completion, n_attempts, total_usage):
+        super().__init__(cause)
+        self.last_completion = last_completion
+        self.n_attempts = n_attempts
+        self.total_usage = total_usage
+
+class FakeInstructor:
+    """
+    an instructor client as instructor 1.3.4 is: every call takes the next of "answers" (JSON), an answer that does not validate
+    is re-asked within "max_retries" (a tenacity Retrying), and every call takes "tokens" (the last 10 of them are the answer's)
+    """
+
+    def __init__(self,
+                 answers: List[str],
+                 tokens: int = 100):
+        self.answers = list(answers)
+        self.tokens = tokens
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, response_model, messages, max_retries, **kwargs):
+        total = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        response = None
+        try:
+            for attempt in max_retries:
+                with attempt:
+                    self.calls += 1
+                    answer = self.answers.pop(0)
+                    response = SimpleNamespace(content=answer,
+                                               usage=SimpleNamespace(prompt_tokens=self.tokens - 10, completion_tokens=10,
+                                                                     total_tokens=self.tokens))
+                    total.prompt_tokens += self.tokens - 10
+                    total.completion_tokens += 10
+                    total.total_tokens += self.tokens
+                    try:
+                        result = response_model.model_validate_json(answer)
+                    except ValidationError as e:
+                        messages.append({"role": "assistant", "content": answer})
+                        messages.append({"role": "user", "content": f"fix the errors: {e}"})
+                        raise
+                    response.usage = total
+                    result._raw_response = response
+                    return result
+        except RetryError as e:
+            raise GaveUp(e, response, self.calls, total) from e
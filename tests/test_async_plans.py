@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from towel import towel, step, parallel, pin, route, plan
+from towel.guide import Guide, StepExecutionError
+from towel.tools import LogLevel
+
+@towel
+async def fetch(topic: str):
+    await asyncio.sleep(0.2)
+    return {"fetched": topic}
+
+@towel
+async def fetch_more(topic: str):
+    await asyncio.sleep(0.2)
+    return {"more": topic.upper()}
+
+@towel
+def combine(fetched: str, more: str):
+    return f"{fetched}/{more}"
+
+class Meeting:
+    "only plans that run at the same time on one loop get past it"
+    def __init__(self, plans: int):
+        self.plans = plans
+        self.arrived = 0
+        self.all_here = asyncio.Event()
+
+    async def wait(self):
+        self.arrived += 1
+        if self.arrived == self.plans:
+            self.all_here.set()
+        await asyncio.wait_for(self.all_here.wait(), 5)
+
+meeting = None
+
+@towel
+async def meet(topic: str):
+    await meeting.wait()
+    return {"met": topic}
+
+@towel
+def sync_only(topic: str):
+    return topic
+
+def guide():
+    return Guide(llm=None, log_level=LogLevel.INFO)
+
+def test_async_and_regular_steps_in_one_plan():
+    stash = asyncio.run(guide().carry_out_async(plan([parallel(step(fetch), step(fetch_more)),
+                                                      step(combine)]),
+                                                start_with={"topic": "towel"}))
+    assert stash['combine'] == "towel/TOWEL"
+
+def test_many_plans_on_one_loop():
+
+    async def many():
+        global meeting
+        meeting = Meeting(10)
+        return await asyncio.gather(*[guide().carry_out_async(plan([step(meet)]),
+                                                              start_with={"topic": str(i)})
+                                      for i in range(10)])
+
+    stashes = asyncio.run(many())
+    assert [stash['meet']['met'] for stash in stashes] == [str(i) for i in range(10)]
+
+def test_async_routes():
+    stash = asyncio.run(guide().carry_out_async(plan([step(fetch),
+                                                      route(lambda result: 'skip'),
+                                                      step(sync_only),
+                                                      pin('skip')]),
+                                                start_with={"topic": "towel"}))
+    assert 'sync_only' not in stash
+
+def test_async_steps_need_an_async_guide():
+    with pytest.raises(StepExecutionError, match="carry_out_async"):
+        guide().carry_out(plan([step(fetch)]), start_with={"topic": "towel"})
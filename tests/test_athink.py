@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from towel.brain.base import DeepThought, TextThought, AsyncStream, usage_of
+
+from fakes import Echo, FakeOllama, ollama
+
+def test_athink_thinks_in_a_worker_thread():
+    llm = Echo(delay=0.2)
+
+    async def many():
+        return await asyncio.gather(*[llm.athink(f"question {i}") for i in range(5)])
+
+    started = time.monotonic()
+    thoughts = asyncio.run(many())
+    assert time.monotonic() - started < 0.6
+    assert [thought.content[0].text for thought in thoughts] == [f"question {i}" for i in range(5)]
+
+def test_athink_streams_as_an_async_generator():
+    llm = Echo(chunks=3)
+
+    async def read():
+        stream = await llm.athink("towel", stream=True)
+        assert isinstance(stream, AsyncStream)
+        return [chunk async for chunk in stream], usage_of(stream)
+
+    chunks, usage = asyncio.run(read())
+    assert chunks == ["towel:0", "towel:1", "towel:2"]
+    assert usage.output_tokens == 3
+
+def test_ollama_athink_uses_the_async_client():
+    client = FakeOllama(answer="42", asynchronous=True)
+    thought = asyncio.run(ollama(aclient=client).athink("the answer?"))
+    assert isinstance(thought, DeepThought) and isinstance(thought.content[0], TextThought)
+    assert thought.content[0].text == "42"
+    assert thought.usage.input_tokens == 7
+    assert client.calls[0][0] == "generate"
+
+def test_ollama_athink_streams():
+    client = FakeOllama(answer="42", asynchronous=True)
+
+    async def read():
+        stream = await ollama(aclient=client).athink([{"role": "user", "content": "the answer?"}], stream=True, chat=True)
+        assert isinstance(stream, AsyncStream)
+        return [chunk async for chunk in stream], usage_of(stream)
+
+    chunks, usage = asyncio.run(read())
+    assert "".join(chunks) == "42:042:142:2"
+    assert usage.output_tokens == 3
+    assert client.calls[0][0] == "chat"
@@ -0,0 +1,86 @@
+import pytest
+from pydantic import BaseModel
+
+from towel import towel, tow, step, pin, route, plan
+from towel.brain.base import Usage
+from towel.guide import Budget, BudgetExceededError
+
+from fakes import Echo, carry_out as carry_out_plan
+
+@towel
+def think_again(input: str):
+    llm, *_ = tow()
+    llm.think(input)                       ## 10 tokens a thought
+    return {"thought": True}
+
+@towel
+def give_up():
+    return "gave up"
+
+class Answer(BaseModel):
+    answer: str
+
+class Measured(Echo):
+    "an echo whose \"response_model\" answers know their usage"
+    def _think(self, *args, **kwargs):
+        thought = super()._think(*args, **kwargs)
+        if isinstance(thought, Answer):
+            setattr(thought, "_usage", Usage(input_tokens=5, output_tokens=10))
+        return thought
+
+@towel
+def stream_again(input: str):
+    llm, *_ = tow()
+    "".join(llm.think(input, stream=True))  ## 3 tokens a stream, once it is read
+    return {"thought": True}
+
+@towel
+def answer_again(input: str):
+    llm, *_ = tow()
+    llm.think(input, response_model=Answer) ## 10 tokens an answer
+    return {"thought": True}
+
+def looping(thinking=think_again):
+    return plan([pin('loop'),
+                 step(thinking),
+                 route(lambda _: 'loop'),
+                 pin('fallback'),
+                 step(give_up)])
+
+def carry_out(budget, llm=None, thinking=think_again):
+    return carry_out_plan(looping(thinking), llm=llm or Echo(), start_with="towel", budget=budget)
+
+def test_pin_visits_are_bounded():
+    with pytest.raises(BudgetExceededError, match="visited \"loop\" pin 4 times") as e:
+        carry_out(Budget(max_visits={"loop": 3}))
+    assert e.value.stash['think_again'] == {"thought": True}
+
+def test_route_hops_are_bounded():
+    with pytest.raises(BudgetExceededError, match="took 6 routes"):
+        carry_out(Budget(max_hops=5))
+
+def test_tokens_are_bounded():
+    llm = Echo()
+    with pytest.raises(BudgetExceededError, match="tokens"):
+        carry_out(Budget(max_tokens=35), llm)
+    assert llm.thoughts == 4
+
+def test_streamed_tokens_are_bounded():
+    llm = Echo()
+    with pytest.raises(BudgetExceededError, match="tokens"):
+        carry_out(Budget(max_tokens=10), llm, thinking=stream_again)
+    assert llm.thoughts == 4
+
+def test_structured_tokens_are_bounded():
+    llm = Measured()
+    with pytest.raises(BudgetExceededError, match="tokens"):
+        carry_out(Budget(max_tokens=35), llm, thinking=answer_again)
+    assert llm.thoughts == 4
+
+def test_a_plan_falls_back_once_out_of_budget():
+    stash = carry_out(Budget(max_hops=2, fallback='fallback'))
+    assert stash['give_up'] == "gave up"
+
+def test_the_fallback_pin_must_be_in_the_plan():
+    with pytest.raises(Exception, match="nowhere"):
+        carry_out(Budget(max_hops=2, fallback='nowhere'))
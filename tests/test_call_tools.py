@@ -0,0 +1,106 @@
+import os
+import sys
+import asyncio
+import contextvars
+import subprocess
+import time
+from typing import Optional
+
+from towel.brain.base import DeepThought, TextThought, ToolUseThought
+from towel.thinker import call_tools, acall_tools
+
+who: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("who", default=None)
+
+def nap(seconds: float):
+    time.sleep(seconds)
+    return seconds
+
+async def anap(seconds: float):
+    await asyncio.sleep(seconds)
+    return seconds
+
+def add(a: int, b: int):
+    return a + b
+
+def boom():
+    raise RuntimeError("no towel")
+
+def whoami():
+    return who.get()
+
+TOOLS = {"nap": nap, "anap": anap, "add": add, "boom": boom, "whoami": whoami}
+
+def asked(*calls, stop_reason="tool_use"):
+    return DeepThought(id="thought", model="llama3", stop_reason=stop_reason,
+                       content=[TextThought(text="calling"),
+                                *[ToolUseThought(id=str(i), name=name, input=input)
+                                  for i, (name, input) in enumerate(calls)]])
+
+def test_tools_are_called_at_once_and_come_back_in_order():
+    started = time.monotonic()
+    results = call_tools(asked(("nap", {"seconds": 0.3}), ("anap", {"seconds": 0.2}), ("add", {"a": 1, "b": 2})), TOOLS)
+
+    assert time.monotonic() - started < 0.5
+    assert [(r["tool_id"], r["tool_name"], r["result"]) for r in results] == [("0", "nap", 0.3), ("1", "anap", 0.2), ("2", "add", 3)]
+    assert all(r["took"] >= 0 for r in results)
+
+def test_a_tool_out_of_time_comes_back_with_an_error():
+    started = time.monotonic()
+    results = call_tools(asked(("nap", {"seconds": 1}), ("anap", {"seconds": 1}), ("add", {"a": 1, "b": 2})),
+                         TOOLS,
+                         timeout={"nap": 0.1, "anap": 0.1})
+
+    assert time.monotonic() - started < 0.5
+    assert [r.get("error") for r in results] == ["timed out after 0.1s", "timed out after 0.1s", None]
+    assert results[2]["result"] == 3
+
+def test_missing_and_failing_tools_come_back_with_errors():
+    results = call_tools(asked(("nope", {}), ("boom", {})), TOOLS)
+    assert [r["error"] for r in results] == ["function 'nope' not found", "no towel"]
+
+def test_no_tool_use_calls_nothing():
+    assert call_tools(asked(("boom", {}), stop_reason="end_turn"), TOOLS) == []
+
+def test_tools_see_the_caller_context():
+    who.set("ford")
+    try:
+        assert call_tools(asked(("whoami", {})), TOOLS)[0]["result"] == "ford"
+    finally:
+        who.set(None)
+
+def test_async_tools_are_awaited_at_once():
+    async def call():
+        who.set("arthur")
+        started = time.monotonic()
+        results = await acall_tools(asked(("anap", {"seconds": 0.2}), ("nap", {"seconds": 0.2}),
+                                          ("whoami", {}), ("nap", {"seconds": 1})),
+                                    TOOLS,
+                                    timeout={"nap": 0.5})
+        return results, time.monotonic() - started
+
+    results, took = asyncio.run(call())
+
+    assert took < 0.9
+    assert [r.get("result") for r in results] == [0.2, 0.2, "arthur", None]
+    assert results[3]["error"] == "timed out after 0.5s"
+
+def test_a_tool_out_of_time_does_not_keep_the_process_from_exiting():
+    script = """
+import time
+from towel.brain.base import DeepThought, ToolUseThought
+from towel.thinker import call_tools, acall_tools
+import asyncio
+
+def forever():
+    time.sleep(60)
+
+asked = DeepThought(id="thought", model="llama3", stop_reason="tool_use",
+                    content=[ToolUseThought(id="0", name="forever", input={})])
+call_tools(asked, {"forever": forever}, timeout=0.1)
+asyncio.run(acall_tools(asked, {"forever": forever}, timeout=0.1))
+"""
+    done = subprocess.run([sys.executable, "-c", script],
+                          env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},    ## towel as pytest sees it
+                          capture_output=True,
+                          timeout=30)
+    assert done.returncode == 0, done.stderr
@@ -0,0 +1,83 @@
+import pickle
+
+import pytest
+
+from towel import towel, step, pin, route, plan
+from towel.guide import StepExecutionError
+from towel.checkpoint import read_journal
+
+from fakes import carry_out
+
+calls = []
+fail_on = set()
+
+@towel
+def first(input: str):
+    calls.append("first")
+    return {"seen": input}
+
+@towel
+def second(seen: str):
+    calls.append("second")
+    if "second" in fail_on:
+        raise RuntimeError("died mid plan")
+    return {"done": f"{seen}, twice"}
+
+@pytest.fixture(autouse=True)
+def fresh():
+    calls.clear()
+    fail_on.clear()
+
+def the_plan():
+    return plan([step(first), step(second)])
+
+def test_resume_skips_finished_steps(tmp_path):
+    journal = str(tmp_path / "plan.journal")
+    fail_on.add("second")
+    with pytest.raises(StepExecutionError):
+        carry_out(the_plan(), start_with="towel", checkpoint=journal)
+
+    fail_on.clear()
+    calls.clear()
+    stash = carry_out(the_plan(), resume_from=journal)
+    assert calls == ["second"]
+    assert stash['second']['done'] == "towel, twice"
+
+def test_a_fresh_run_starts_its_journal_over(tmp_path):
+    journal = str(tmp_path / "plan.journal")
+    carry_out(the_plan(), start_with="one", checkpoint=journal)
+    carry_out(the_plan(), start_with="two", checkpoint=journal)
+
+    records, _ = read_journal(journal)
+    assert [record['kind'] for record in records] == ["start", "step", "step"]
+    assert records[0]['stash'] == {"input": "two"}
+
+    calls.clear()
+    assert carry_out(the_plan(), resume_from=journal)['second']['done'] == "two, twice"
+    assert calls == []
+
+def test_resume_into_a_new_journal(tmp_path):
+    journal, other = str(tmp_path / "plan.journal"), str(tmp_path / "other.journal")
+    fail_on.add("second")
+    with pytest.raises(StepExecutionError):
+        carry_out(the_plan(), start_with="towel", checkpoint=journal)
+
+    fail_on.clear()
+    carry_out(the_plan(), resume_from=journal, checkpoint=other)
+    records, _ = read_journal(other)
+    assert [record['kind'] for record in records] == ["start", "step", "step"]
+
+def test_a_torn_record_is_dropped(tmp_path):
+    journal = str(tmp_path / "plan.journal")
+    carry_out(the_plan(), start_with="towel", checkpoint=journal)
+    with open(journal, 'ab') as file:
+        file.write(pickle.dumps({"kind": "step"})[:5])
+    records, offset = read_journal(journal)
+    assert len(records) == 3
+
+def test_journals_of_many_runs_are_rejected(tmp_path):
+    journal = tmp_path / "plan.journal"
+    start = {"kind": "start", "plan_id": "42", "stash": {}}
+    journal.write_bytes(pickle.dumps(start) + pickle.dumps(start))
+    with pytest.raises(ValueError, match="single plan run"):
+        read_journal(str(journal))
@@ -0,0 +1,80 @@
+import time
+import threading
+
+import pytest
+import requests
+
+import towel.tools as tools
+from towel.brain.ollama import Ollama
+
+from fakes import FakeOllama
+
+class Server:
+    "answers /api/tags, slowly: counts how many times it was asked"
+    def __init__(self, up=True, delay=0.1):
+        self.up = up
+        self.delay = delay
+        self.checks = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self.lock:
+            self.checks += 1
+        time.sleep(self.delay)
+        if not self.up:
+            raise requests.ConnectionError("connection refused")
+        return _Ok()
+
+class _Ok:
+    def raise_for_status(self):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    server = Server()
+    monkeypatch.setattr(tools.requests, "get", server.get)
+    tools._health.clear()
+    yield server
+    tools._health.clear()
+
+def test_many_threads_check_a_url_once(server):
+    threads = [threading.Thread(target=tools.check_health, args=("http://gpu:11434",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.checks == 1
+
+def test_a_failed_check_is_remembered_for_a_shorter_while(server):
+    server.up = False
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            tools.check_health("http://gpu:11434", failed_ttl=60)
+    assert server.checks == 1
+
+    server.up = True
+    with pytest.raises(ConnectionError):
+        tools.check_health("http://gpu:11434", failed_ttl=60)
+    assert tools.check_health("http://gpu:11434", failed_ttl=0) > time.monotonic()
+    assert server.checks == 2
+
+def test_brains_of_a_server_share_its_health(server):
+    brains = [Ollama(model=f"model-{i}", url="http://gpu:11434") for i in range(3)]
+    for brain in brains:
+        brain.__dict__['client'] = FakeOllama()
+        brain.think("towel")
+        brain.think("towel")
+    assert server.checks == 1
+
+def test_lazy_brains_are_not_checked_until_they_think(server):
+    Ollama(model="llama3", url="http://gpu:11434")
+    assert server.checks == 0
+
+def test_background_checks_do_not_wait(server):
+    server.delay = 0.5
+    started = time.monotonic()
+    brain = Ollama(model="llama3", url="http://gpu:11434", health_check="background")
+    assert time.monotonic() - started < 0.3
+    brain.__dict__['client'] = FakeOllama()
+    brain.think("towel")                   ## waits for the check that is already going
+    assert server.checks == 1
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from towel.brain.base import DeepThought
+from towel.brain.hedge import Hedge
+
+from fakes import Echo
+
+class Broken(Echo):
+    def _think(self, *args, **kwargs):
+        raise RuntimeError("no towel")
+
+def text(thought):
+    return thought.content[0].text
+
+def test_a_fast_brain_wins():
+    slow, fast = Echo(model="slow", delay=1.0), Echo(model="fast")
+    llm = Hedge([slow, fast], hedge_after_ms=50)
+    started = time.monotonic()
+    assert text(llm.think("towel")) == "towel"
+    assert time.monotonic() - started < 0.5
+    assert llm.hedges == 1
+    assert llm.wins == [0, 1]
+
+def test_a_fast_first_brain_is_not_hedged():
+    first, second = Echo(model="first"), Echo(model="second")
+    llm = Hedge([first, second], hedge_after_ms=500)
+    llm.think("towel")
+    assert llm.hedges == 0
+    assert second.thoughts == 0
+
+def test_a_broken_brain_is_fallen_back_from_right_away():
+    llm = Hedge([Broken(), Echo()], hedge_after_ms=5000)
+    started = time.monotonic()
+    assert text(llm.think("towel")) == "towel"
+    assert time.monotonic() - started < 1
+
+def test_all_brains_broken_is_an_error_thought():
+    thought = Hedge([Broken(), Broken()]).think("towel")
+    assert isinstance(thought, DeepThought) and thought.stop_reason == "error"
+
+def test_the_first_brain_latency_is_recorded_when_it_loses():
+    llm = Hedge([Echo(delay=0.5), Echo()], hedge_after_ms=50)
+    llm.think("towel")
+    assert len(llm.latencies) == 1
+    assert llm.latencies[0] >= 0.05
+
+def test_the_first_brain_latency_is_recorded_when_it_wins():
+    llm = Hedge([Echo(delay=0.05), Echo()], hedge_after_ms=1000)
+    llm.think("towel")
+    assert len(llm.latencies) == 1 and llm.latencies[0] >= 0.05
+
+def test_hedge_after_follows_the_first_brain_percentile():
+    llm = Hedge([Echo(), Echo()], warm_up_ms=1234)
+    assert llm.hedge_after() == 1.234
+    llm.latencies.extend([0.1] * 19 + [2.0])
+    assert llm.hedge_after() == 2.0
+
+def test_streams_fall_back_but_are_not_hedged():
+    slow, fast = Echo(delay=0.2), Echo()
+    assert list(Hedge([slow, fast], hedge_after_ms=10).think("towel", stream=True)) == ["towel:0", "towel:1", "towel:2"]
+    assert fast.thoughts == 0
+    assert list(Hedge([Broken(), fast]).think("towel", stream=True))[0] == "towel:0"
+
+def test_async_hedges():
+    llm = Hedge([Echo(delay=1.0), Echo()], hedge_after_ms=50)
+
+    async def timed():
+        started = time.monotonic()
+        thought = await llm.athink("towel")
+        return thought, time.monotonic() - started
+
+    thought, took = asyncio.run(timed())
+    assert text(thought) == "towel"
+    assert took < 0.9
+    assert llm.wins == [0, 1] and len(llm.latencies) == 1
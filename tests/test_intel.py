@@ -0,0 +1,62 @@
+import threading
+
+from towel import towel, tow, intel
+from towel.base import Intel
+
+@towel
+def first():
+    return 1
+
+@towel
+def second(first: int):
+    return first + 1
+
+@towel
+def seen():
+    *_, rest = tow()
+    return dict(rest)
+
+def test_towels_in_an_intel_block_see_each_other():
+    with intel():
+        first()
+        assert second() == 2
+
+def test_towels_at_the_top_level_see_each_other():
+    first()
+    assert second() == 2
+
+def test_intel_is_released_with_its_block():
+    with intel(answer=42):
+        with intel(answer=43, question="?"):
+            assert seen()['answer'] == 43
+        assert seen()['answer'] == 42
+        assert 'question' not in seen()
+
+def test_threads_do_not_see_each_other():
+    seen_by = {}
+
+    def run(name):
+        with intel(name=name):
+            seen_by[name] = seen()['name']
+
+    threads = [threading.Thread(target=run, args=(str(i),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen_by == {str(i): str(i) for i in range(8)}
+
+def test_versions_share_what_is_below_them():
+    base = Intel({"a": 1})
+    version = base.derive({"b": 2}, {"a": 3})
+    assert dict(version) == {"a": 3, "b": 2}
+    assert dict(base) == {"a": 1}
+    assert base.derive() is not base
+
+def test_deep_versions_are_flattened():
+    version = Intel()
+    for i in range(Intel.max_depth * 3):
+        version = version.derive({f"k{i}": i})
+    assert version.depth <= Intel.max_depth
+    assert version[f"k{Intel.max_depth * 3 - 1}"] == Intel.max_depth * 3 - 1
+    assert version["k0"] == 0
@@ -0,0 +1,96 @@
+import gc
+import time
+import asyncio
+import threading
+
+import pytest
+
+import towel.brain.base as base
+from towel.brain.base import DeepThought, TextThought, Stream, AsyncStream, limit_concurrency, rate_limit, _provider_limits, _provider_rates
+
+from fakes import Echo
+
+@pytest.fixture(autouse=True)
+def limits():
+    yield
+    _provider_limits.pop("echo", None)
+    _provider_rates.pop("echo", None)
+
+def thinking_in_background(llm):
+    done = threading.Event()
+    def think():
+        llm.think("next")
+        done.set()
+    threading.Thread(target=think, daemon=True).start()
+    return done
+
+def test_think_many_is_bounded_by_the_provider_limit():
+    limit_concurrency("echo", 2)
+    llm = Echo(delay=0.1)
+    started = time.monotonic()
+    thoughts = dict(llm.think_many([f"q{i}" for i in range(4)], max_concurrency=4))
+    assert time.monotonic() - started >= 0.2
+    assert sorted(thought.content[0].text for thought in thoughts.values()) == ["q0", "q1", "q2", "q3"]
+
+def test_a_stream_holds_its_slot_until_it_is_read():
+    limit_concurrency("echo", 1)
+    llm = Echo()
+    stream = llm.think("first", stream=True)
+
+    done = thinking_in_background(llm)
+    assert not done.wait(0.2)
+
+    assert list(stream) == ["first:0", "first:1", "first:2"]
+    assert done.wait(1)
+
+def test_a_closed_stream_gives_its_slot_back():
+    limit_concurrency("echo", 1)
+    llm = Echo()
+    stream = llm.think("first", stream=True)
+    assert isinstance(stream, Stream)
+    next(stream)
+    stream.close()
+    assert thinking_in_background(llm).wait(1)
+
+def test_a_dropped_stream_gives_its_slot_back():
+    limit_concurrency("echo", 1)
+    llm = Echo()
+    stream = llm.think("first", stream=True)
+    del stream
+    gc.collect()
+    assert thinking_in_background(llm).wait(1)
+
+def test_an_async_stream_holds_its_slot_until_it_is_read():
+    limit_concurrency("echo", 1)
+    llm = Echo()
+
+    async def race():
+        stream = await llm.athink("first", stream=True)
+        assert isinstance(stream, AsyncStream)
+        second = asyncio.create_task(llm.athink("second"))
+        await asyncio.sleep(0.2)
+        waited = not second.done()
+        chunks = [chunk async for chunk in stream]
+        await asyncio.wait_for(second, 1)
+        return waited, chunks
+
+    waited, chunks = asyncio.run(race())
+    assert waited
+    assert chunks == ["first:0", "first:1", "first:2"]
+
+def test_a_stream_settles_its_rate_estimate_once_it_is_read():
+    rate_limit("echo", tokens_per_minute=100_000)
+    llm = Echo()
+    stream = llm.think("first", stream=True, max_tokens=10_000)
+    rate = _provider_rates["echo"]
+    assert rate.tokens < 95_000
+    list(stream)
+    assert rate.tokens > 99_000
+
+def test_a_thought_is_not_estimated_without_rate_limits(monkeypatch):
+    def estimated(*args):
+        raise AssertionError("estimated")
+    monkeypatch.setattr(base, "_Estimate", estimated)
+    thought = Echo().think([{"role": "user", "content": "no rates"}])
+    assert isinstance(thought, DeepThought) and isinstance(thought.content[0], TextThought)
+    assert thought.content[0].text == "no rates"
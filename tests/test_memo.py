@@ -0,0 +1,110 @@
+import dataclasses
+
+import pytest
+
+from towel import towel, step, plan
+from towel.memo import LRUCache, SqliteCache, step_key, _canonical
+from towel.thinker import plan as think_plan
+from towel.tools import LogLevel
+
+from fakes import Echo, carry_out
+
+taken = []
+
+@towel
+def summarize(text: str):
+    taken.append("summarize")
+    return {"summary": text[:5], "words": text.split()}
+
+@towel(llm=Echo(model="own"))
+def own_model(text: str):
+    taken.append("own_model")
+    return {"own": text}
+
+@pytest.fixture(autouse=True)
+def fresh():
+    taken.clear()
+
+def test_a_step_with_the_same_inputs_is_not_taken_again():
+    store = LRUCache()
+    for _ in range(3):
+        stash = carry_out(plan([step(summarize).cache(store)]), start_with={"text": "towels are useful"})
+    assert taken == ["summarize"]
+    assert stash['summarize']['summary'] == "towel"
+
+    carry_out(plan([step(summarize).cache(store)]), start_with={"text": "towels are a must"})
+    assert taken == ["summarize", "summarize"]
+
+def test_steps_are_keyed_by_the_model_that_thinks_for_them():
+    store = LRUCache()
+    for model in ("one", "two", "one"):
+        think_plan(plan([step(summarize).cache(store)]),
+                   llm=Echo(model=model), start_with={"text": "towel"}, log_level=LogLevel.INFO)
+    assert taken == ["summarize", "summarize"]
+
+def test_a_mind_map_model_is_the_key():
+    store = LRUCache()
+    for model in ("one", "two"):
+        think_plan(plan([step(summarize).cache(store)]),
+                   llm=Echo(model="plan"),
+                   mind_map={"summarize": Echo(model=model)},
+                   start_with={"text": "towel"}, log_level=LogLevel.INFO)
+    assert taken == ["summarize", "summarize"]
+
+def test_a_towel_model_wins_over_the_plan_and_mind_map_models():
+    store = LRUCache()
+    for model in ("one", "two"):
+        think_plan(plan([step(own_model).cache(store)]),
+                   llm=Echo(model=model),
+                   mind_map={"own_model": Echo(model=model)},
+                   start_with={"text": "towel"}, log_level=LogLevel.INFO)
+    assert taken == ["own_model"]    ## "own" thinks for it either way
+
+def test_recalled_results_are_copies():
+    store = LRUCache()
+    first = carry_out(plan([step(summarize).cache(store)]), start_with={"text": "towels are useful"})
+    first['summarize']['words'].append("changed")
+    again = carry_out(plan([step(summarize).cache(store)]), start_with={"text": "towels are useful"})
+    assert again['summarize']['words'] == ["towels", "are", "useful"]
+
+    hit, value = store.get(next(iter(store.entries)))
+    value['words'].clear()
+    assert store.get(next(iter(store.entries)))[1]['words'] == ["towels", "are", "useful"]
+
+def test_values_known_by_their_address_are_not_keys():
+    with pytest.raises(TypeError, match="stable form"):
+        step_key("f", {"thing": object()}, None, None)
+
+def test_steps_with_such_inputs_are_taken_uncached():
+    store = LRUCache()
+    for _ in range(2):
+        carry_out(plan([step(summarize).cache(store)]), start_with={"text": "towel", "thing": object()})
+    ## "thing" is not an input of summarize, so it is still cached
+    assert taken == ["summarize"]
+
+    @towel
+    def uses(thing):
+        taken.append("uses")
+        return "used"
+
+    for _ in range(2):
+        carry_out(plan([step(uses).cache(store)]), start_with={"thing": object()})
+    assert taken == ["summarize", "uses", "uses"]
+
+def test_structured_values_hash_by_their_content():
+
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int
+
+    assert _canonical(Point(1, 2)) == _canonical(Point(1, 2))
+    assert _canonical(Point(1, 2)) != _canonical(Point(2, 1))
+    assert _canonical(summarize) == _canonical(summarize)
+
+def test_sqlite_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / "steps.db")
+    store = SqliteCache(path)
+    store.put("key", {"answer": 42})
+    store.close()
+    assert SqliteCache(path).get("key") == (True, {"answer": 42})
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+from towel import towel, tow, step, plan
+from towel.thinker import plan_many
+from towel.brain.base import ModelTurns, _model_turns
+
+from fakes import Echo
+
+class GPU:
+    "a single GPU: tracks which models think on it at the same time"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thinking = {}
+        self.overlaps = 0
+        self.swaps = 0
+        self.loaded = None
+
+    def enter(self, model):
+        with self.lock:
+            if any(n for m, n in self.thinking.items() if m != model):
+                self.overlaps += 1
+            if self.loaded not in (None, model):
+                self.swaps += 1
+            self.loaded = model
+            self.thinking[model] = self.thinking.get(model, 0) + 1
+
+    def leave(self, model):
+        with self.lock:
+            self.thinking[model] -= 1
+
+class OnGPU(Echo):
+    def __init__(self, gpu, **kwargs):
+        super().__init__(**kwargs)
+        self.gpu = gpu
+
+    def server(self):
+        return "gpu"
+
+    def _think(self, messages, stream, model, *args, **kwargs):
+        self.gpu.enter(model)
+        try:
+            return super()._think(messages, stream, model, *args, **kwargs)
+        finally:
+            self.gpu.leave(model)
+
+@towel
+def draft(input: str):
+    llm, *_ = tow()
+    return {"draft": llm.think(f"draft {input}").content[0].text}
+
+@towel
+def review(draft: str):
+    llm, *_ = tow()
+    return {"review": llm.think(f"review {draft}").content[0].text}
+
+def run(gpu, grouped):
+    a = OnGPU(gpu, model="a", delay=0.01)
+    b = OnGPU(gpu, model="b", delay=0.01)
+    return list(plan_many(plan([step(draft), step(review)]),
+                          inputs=range(16),
+                          llm=a,
+                          mind_map={"draft": a, "review": b},
+                          max_concurrency=8,
+                          group_by_model=grouped))
+
+def test_grouped_models_never_think_at_once():
+    gpu = GPU()
+    outcomes = run(gpu, grouped=True)
+    assert all(outcome.ok for outcome in outcomes)
+    assert gpu.overlaps == 0
+
+def test_models_overlap_without_grouping():
+    gpu = GPU()
+    outcomes = run(gpu, grouped=False)
+    assert all(outcome.ok for outcome in outcomes)
+    assert gpu.overlaps > 0
+
+def test_a_stream_holds_its_turn_until_it_is_read():
+    turns = ModelTurns()
+    a = OnGPU(GPU(), model="a")
+    b = OnGPU(GPU(), model="b")
+    taken = threading.Event()
+
+    def other():
+        _model_turns.set(turns)
+        b.think("later")
+        taken.set()
+
+    _model_turns.set(turns)
+    try:
+        stream = a.think("now", stream=True)
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not taken.wait(0.2)          ## "b" waits while "a" is still streaming
+        assert list(stream) == ["now:0", "now:1", "now:2"]
+        assert taken.wait(1)
+        thread.join()
+    finally:
+        _model_turns.set(None)
+
+def test_an_async_thought_takes_its_turn_once_the_other_model_leaves():
+    turns = ModelTurns()
+    thinking = turns.take("gpu", "a")
+
+    async def other():
+        taking = asyncio.create_task(turns.atake("gpu", "b"))
+        await asyncio.sleep(0.1)
+        waited = not taking.done()              ## "b" waits while "a" is thinking
+        turns.leave(thinking)
+        turns.leave(await asyncio.wait_for(taking, 1))
+        return waited
+
+    assert asyncio.run(other())
+    assert turns.switches == 1
@@ -0,0 +1,85 @@
+import json
+from functools import partial
+
+import ollama as ollama_client
+import pytest
+
+from towel.brain.base import ToolUseThought
+from towel.brain.ollama import _native_tools
+
+import fakes
+from fakes import FakeOllama
+
+ADD = {"name": "add", "description": "adds two numbers",
+       "input_schema": {"type": "object", "properties": {"a": {"type": "integer"}, "b": {"type": "integer"}}}}
+
+PROMPTED = json.dumps({"text_response": "adding", "tool_call": {"tool": "add", "args": {"a": 1, "b": 2}}})
+
+class Calling(FakeOllama):
+    "an ollama client whose model calls every tool it is given, twice"
+
+    def _response(self, kwargs):
+        response = super()._response(kwargs)
+        if "tools" in kwargs:
+            response["message"] = {"role": "assistant", "content": "",
+                                   "tool_calls": [{"function": {"name": "add", "arguments": {"a": i, "b": 2}}}
+                                                  for i in range(2)]}
+        return response
+
+class Old:
+    "an ollama client as ollama-python 0.2.1 is: its \"chat\" has no \"tools\""
+
+    def __init__(self, answer):
+        self.client = FakeOllama(answer=answer)
+        self.calls = self.client.calls
+
+    def chat(self, model="", messages=None, stream=False, format="", options=None, keep_alive=None):
+        return self.client.chat(model=model, messages=messages, stream=stream, format=format,
+                                options=options, keep_alive=keep_alive)
+
+class Refusing(FakeOllama):
+    def chat(self, **kwargs):
+        if "tools" in kwargs:
+            self.calls.append(("chat", kwargs))
+            raise ollama_client.ResponseError("llama3 does not support tools", 400)
+        return super().chat(**kwargs)
+
+@pytest.fixture(autouse=True)
+def forget():
+    _native_tools.clear()
+    yield
+    _native_tools.clear()
+
+ollama = partial(fakes.ollama, structured="schema")
+
+def test_native_tools_go_to_ollama():
+    client = Calling()
+    thought = ollama(client=client, tool_calling="native").think("1 + 2? and 0 + 2?", tools=[ADD])
+
+    assert thought.stop_reason == "tool_use"
+    assert [(call.name, call.input) for call in thought.content] == [("add", {"a": 0, "b": 2}), ("add", {"a": 1, "b": 2})]
+    assert client.calls[0][1]["tools"][0]["function"]["name"] == "add"
+
+def test_an_old_client_calls_tools_the_prompt_way():
+    client = Old(answer=PROMPTED)
+    thought = ollama(client=client, tool_calling="native").think("1 + 2?", tools=[ADD])
+
+    [text, call] = thought.content
+    assert isinstance(call, ToolUseThought) and call.input == {"a": 1, "b": 2}
+    assert all("tools" not in asked for _, asked in client.calls)
+
+def test_auto_does_not_ask_an_old_client_about_capabilities():
+    client = Old(answer=PROMPTED)
+    ollama(client=client, tool_calling="auto").think("1 + 2?", tools=[ADD])
+    assert [kind for kind, _ in client.calls] == ["chat"]
+
+def test_a_model_that_does_not_call_tools_is_asked_the_prompt_way_from_then_on():
+    client = Refusing(answer=PROMPTED)
+    brain = ollama(client=client, tool_calling="auto")
+    _native_tools[(brain.url, "llama3")] = True
+
+    brain.think("1 + 2?", tools=[ADD])
+    brain.think("1 + 2?", tools=[ADD])
+
+    assert ["tools" in asked for _, asked in client.calls] == [True, False, False]
+    assert _native_tools[(brain.url, "llama3")] is False
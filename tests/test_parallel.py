@@ -0,0 +1,82 @@
+import time
+import threading
+
+import pytest
+
+from towel import towel, step, parallel, plan
+from towel.guide import StepExecutionError
+
+from fakes import carry_out
+
+meeting = threading.Barrier(2, timeout=5)     ## only branches that run at the same time get past it
+
+@towel
+def left(topic: str):
+    meeting.wait()
+    return {"left": f"{topic} from the left", "thread": threading.get_ident()}
+
+@towel
+def right(topic: str):
+    meeting.wait()
+    return {"right": f"{topic} from the right", "thread": threading.get_ident()}
+
+class Running:
+    "how many branches are running at once, at most"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = 0
+        self.most = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.now += 1
+            self.most = max(self.most, self.now)
+
+    def __exit__(self, *_):
+        with self.lock:
+            self.now -= 1
+
+running = Running()
+
+@towel
+def one(topic: str):
+    with running:
+        time.sleep(0.05)
+    return {"one": topic}
+
+@towel
+def another(topic: str):
+    with running:
+        time.sleep(0.05)
+    return {"another": topic}
+
+@towel
+def merge(left: str, right: str):
+    return f"{left} and {right}"
+
+@towel
+def broken(topic: str):
+    raise RuntimeError("no towel")
+
+@pytest.fixture(autouse=True)
+def fresh():
+    meeting.reset()
+    running.most = 0
+
+def test_branches_run_at_the_same_time_and_fan_in():
+    stash = carry_out(plan([parallel(step(left), step(right)),
+                            step(merge)]),
+                      start_with={"topic": "towels"})
+    assert stash['merge'] == "towels from the left and towels from the right"
+    assert stash['left']['thread'] != stash['right']['thread']
+
+def test_max_workers_bounds_branches():
+    carry_out(plan([parallel(step(one), step(another), max_workers=1)]),
+              start_with={"topic": "towels"})
+    assert running.most == 1
+
+def test_a_failed_branch_fails_the_plan():
+    with pytest.raises(StepExecutionError, match="broken"):
+        carry_out(plan([parallel(step(one), step(broken)),
+                        step(merge)]),
+                  start_with={"topic": "towels"})
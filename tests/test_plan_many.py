@@ -0,0 +1,80 @@
+import threading
+
+from towel import towel, tow, step, plan
+from towel.brain.base import _provider_limits
+from towel.thinker import plan_many
+
+from fakes import Echo
+
+@towel
+def shout(input: str):
+    llm, *_ = tow()
+    thought = llm.think(input)
+    if input == "boom":
+        raise RuntimeError("no towel")
+    return {"shouted": thought.content[0].text.upper()}
+
+class Counting(Echo):
+    "an echo that knows how many of its thoughts were thought at once, at most"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.now = 0
+        self.most = 0
+        self.counting = threading.Lock()
+
+    def _think(self, *args, **kwargs):
+        with self.counting:
+            self.now += 1
+            self.most = max(self.most, self.now)
+        try:
+            return super()._think(*args, **kwargs)
+        finally:
+            with self.counting:
+                self.now -= 1
+
+def test_every_input_gets_its_own_outcome():
+    llm = Counting(delay=0.05)
+    outcomes = list(plan_many(plan([step(shout)]),
+                              inputs=["one", "two", "boom", "four"],
+                              llm=llm,
+                              max_concurrency=4))
+
+    by_index = {outcome.index: outcome for outcome in outcomes}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[1].ok and by_index[1].result['shout']['shouted'] == "TWO"
+    assert not by_index[2].ok and "no towel" in str(by_index[2].error)
+    assert llm.thoughts == 4
+
+def test_max_concurrency_bounds_runs():
+    llm = Counting(delay=0.05)
+    list(plan_many(plan([step(shout)]),
+                   inputs=["one", "two", "three"],
+                   llm=llm,
+                   max_concurrency=1))
+    assert llm.most == 1
+
+def test_inputs_are_taken_as_runs_start():
+    taken = []
+
+    def inputs():
+        for i in range(100):
+            taken.append(i)
+            yield str(i)
+
+    outcomes = plan_many(plan([step(shout)]), inputs=inputs(), llm=Echo(delay=0.01), max_concurrency=2)
+    next(outcomes)
+    outcomes.close()
+    assert len(taken) <= 4
+
+def test_provider_limits_are_for_the_batch_only():
+    before = dict(_provider_limits)
+    llm = Counting(delay=0.05)
+    list(plan_many(plan([step(shout)]),
+                   inputs=["one", "two", "three", "four"],
+                   llm=llm,
+                   max_concurrency=4,
+                   provider_limits={"Counting": 1}))
+
+    assert llm.most == 1
+    assert _provider_limits == before
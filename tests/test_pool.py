@@ -0,0 +1,141 @@
+import gc
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from towel.brain.base import limit_concurrency, _provider_limits
+from towel.brain.pool import OllamaPool
+from towel.brain.ollama import Ollama
+
+from fakes import FakeOllama
+
+class Down(FakeOllama):
+    def _call(self, kind, kwargs):
+        self.calls.append((kind, kwargs))
+        raise httpx.ConnectError("connection refused")
+
+class Running:
+    "/api/ps of every host: {url: [models]}"
+    def __init__(self, loaded):
+        self.loaded = loaded
+        self.asked = []
+
+    def json_of(self, url):
+        self.asked.append(url)
+        host = url.rsplit("/api/ps", 1)[0]
+        return {"models": [{"name": name} for name in self.loaded.get(host, [])]}
+
+@pytest.fixture
+def running(monkeypatch):
+    running = Running({})
+
+    class Response:
+        def __init__(self, url):
+            self.url = url
+        def json(self):
+            return running.json_of(self.url)
+
+    class AsyncClient:
+        def __init__(self, **kwargs):
+            pass
+        async def __aenter__(self):
+            return self
+        async def __aexit__(self, *args):
+            pass
+        async def get(self, url):
+            return Response(url)
+
+    monkeypatch.setattr(httpx, "get", lambda url, **kwargs: Response(url))
+    monkeypatch.setattr(httpx, "AsyncClient", AsyncClient)
+    return running
+
+def pool(*clients, **kwargs):
+    llm = OllamaPool(model="llama3", urls=[f"http://gpu-{i}:11434" for i in range(len(clients))], **kwargs)
+    for host, client in zip(llm.hosts, clients):
+        brain = Ollama(model="llama3", url=host.url, health_check=None)
+        brain.__dict__['client'] = client
+        brain.__dict__['aclient'] = client
+        host._brain = brain
+    return llm
+
+def outstanding(llm):
+    return [host.outstanding for host in llm.hosts]
+
+def test_hosts_with_the_model_loaded_are_preferred(running):
+    cold, warm = FakeOllama(), FakeOllama()
+    llm = pool(cold, warm)
+    running.loaded = {"http://gpu-1:11434": ["llama3"]}
+    llm.think("towel")
+    llm.think("towel")
+    assert (len(cold.calls), len(warm.calls)) == (0, 2)
+
+def test_a_host_that_is_down_is_ejected(running):
+    down, up = Down(), FakeOllama()
+    llm = pool(down, up, max_failures=2, loaded_ttl=0)
+    running.loaded = {"http://gpu-0:11434": ["llama3"], "http://gpu-1:11434": ["llama3"]}
+    for _ in range(4):
+        assert llm.think("towel").content[0].text == "42"
+    assert len(down.calls) == 2                   ## ejected after the second failure
+    assert llm.hosts[0].ejections == 1
+    assert not llm.stats()[0]["up"]
+    assert outstanding(llm) == [0, 0]
+
+def test_a_stream_is_in_flight_until_it_is_read(running):
+    llm = pool(FakeOllama())
+    stream = llm.think("towel", stream=True)
+    assert outstanding(llm) == [1]
+    list(stream)
+    assert outstanding(llm) == [0]
+
+def test_a_stream_that_is_never_read_is_done_once_dropped(running):
+    llm = pool(FakeOllama())
+    stream = llm.think("towel", stream=True)
+    del stream
+    gc.collect()
+    assert outstanding(llm) == [0]
+
+def test_a_closed_stream_is_done(running):
+    llm = pool(FakeOllama())
+    stream = llm.think("towel", stream=True)
+    next(stream)
+    stream.close()
+    assert outstanding(llm) == [0]
+
+def test_async_thoughts_do_not_block_on_what_hosts_have_loaded(running, monkeypatch):
+    monkeypatch.setattr(httpx, "get", lambda *args, **kwargs: pytest.fail("a blocking call on the event loop"))
+    cold, warm = FakeOllama(asynchronous=True), FakeOllama(asynchronous=True)
+    llm = pool(cold, warm)
+    running.loaded = {"http://gpu-1:11434": ["llama3"]}
+    thought = asyncio.run(llm.athink("towel"))
+    assert thought.content[0].text == "42"
+    assert len(warm.calls) == 1
+    assert len(running.asked) == 2
+
+def test_an_async_stream_that_is_never_read_is_done_once_dropped(running):
+    llm = pool(FakeOllama(asynchronous=True))
+
+    async def drop():
+        stream = await llm.athink("towel", stream=True)
+        del stream
+        gc.collect()
+
+    asyncio.run(drop())
+    assert outstanding(llm) == [0]
+
+def test_ollama_limits_are_the_pool_limits(running):
+    limit_concurrency("ollama", 1)
+    try:
+        llm = pool(FakeOllama(), FakeOllama())
+        stream = llm.think("towel", stream=True)
+        done = threading.Event()
+        def think():
+            llm.think("next")
+            done.set()
+        threading.Thread(target=think, daemon=True).start()
+        assert not done.wait(0.2)                 ## waits for ollama's only slot
+        list(stream)
+        assert done.wait(1)
+    finally:
+        _provider_limits.pop("ollama", None)
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+from pydantic import BaseModel
+
+from towel.brain.claude import Claude
+
+class Answer(BaseModel):
+    answer: str
+
+class FakeAnthropic:
+    "an anthropic client that answers \"42\": every call is recorded"
+
+    def __init__(self):
+        self.calls = []
+        self.messages = self
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if "response_model" in kwargs:
+            kwargs["system"] + "\n\n"              ## as instructor's ANTHROPIC_JSON adds its instructions
+            return kwargs["response_model"](answer="42")
+        return SimpleNamespace(id="msg", model=kwargs["model"], stop_reason="end_turn",
+                               content=[SimpleNamespace(text="42")],
+                               usage=SimpleNamespace(input_tokens=12, output_tokens=2,
+                                                     cache_read_input_tokens=None,
+                                                     cache_creation_input_tokens=None))
+
+SYSTEM = "you are a towel. " * 300          ## long enough for Anthropic to cache
+
+def claude(prompt_cache="auto"):
+    brain = Claude(api_key="none", model="claude-3-haiku-20240307", prompt_cache=prompt_cache)
+    fake = FakeAnthropic()
+    brain.__dict__.update(client=fake, iclient=fake)
+    return brain
+
+def marked(blocks):
+    return [block for block in blocks if isinstance(block, dict) and "cache_control" in block]
+
+def test_auto_marks_a_system_once_it_is_seen_again():
+    brain = claude()
+    brain.think("hi", system=SYSTEM)
+    brain.think("hi", system=SYSTEM)
+
+    first, second = brain.client.calls
+    assert first["system"] == SYSTEM
+    assert second["system"] == [{"type": "text", "text": SYSTEM,
+                                 "cache_control": {"type": "ephemeral"}}]
+
+def test_auto_does_not_hash_what_is_too_short_to_cache():
+    brain = claude()
+    brain.think("hi", system="you are a towel")
+    brain.think("hi", system="you are a towel")
+
+    assert all(call["system"] == "you are a towel" for call in brain.client.calls)
+    assert not brain.seen_prefixes
+
+def test_a_structured_thought_keeps_its_system_a_string():
+    brain = claude()
+    for _ in range(2):
+        answer = brain.think("the answer?", system=SYSTEM, response_model=Answer)
+        assert isinstance(answer, Answer) and answer.answer == "42"
+
+    assert [call["system"] for call in brain.client.calls] == [SYSTEM] * 2
+
+def test_leading_message_blocks_are_marked():
+    brain = claude(prompt_cache=True)
+    brain.think([{"role": "user", "content": "a long paper"},
+                 {"role": "assistant", "content": "read it"},
+                 {"role": "user", "content": "what is it about?"}])
+
+    messages = brain.client.calls[0]["messages"]
+    assert marked(messages[1]["content"])
+    assert isinstance(messages[2]["content"], str)
+
+def test_no_cache_marks_nothing():
+    brain = claude(prompt_cache=False)
+    brain.think("hi", system="you are a towel")
+    brain.think("hi", system="you are a towel")
+    assert all(call["system"] == "you are a towel" for call in brain.client.calls)
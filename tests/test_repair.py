@@ -0,0 +1,85 @@
+import pickle
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from towel.brain.repair import repair, repairing
+from towel.memo import SqliteCache
+from towel.tools import retry_meter
+
+from fakes import FakeInstructor, ollama
+
+class Answer(BaseModel):
+    "the answer"
+    answer: int
+    sure: bool = False
+    tags: List[str] = []
+    note: Optional[str] = None
+
+SCHEMA = Answer.model_json_schema()
+
+@pytest.mark.parametrize("text, data", [
+    ('here you go: {"answer": 42} hope it helps', {"answer": 42}),
+    ('[{"answer": 42}]',                          {"answer": 42}),
+    ("{answer: '42', sure: True, note: None,}",   {"answer": 42, "sure": True, "note": None}),
+    ('{"answer": 42, "tags": ["a", "b"',          {"answer": 42, "tags": ["a", "b"]}),
+    ('{"answer": 4.0, "tags": "a"}',              {"answer": 4, "tags": ["a"]}),
+    ('// a comment\n{"answer": 1 /* and another */}', {"answer": 1}),
+])
+def test_almost_right_responses_are_repaired(text, data):
+    assert repair(text, SCHEMA) == data
+
+def test_no_json_is_not_repaired():
+    with pytest.raises(ValueError):
+        repair("the answer is 42", SCHEMA)
+
+def test_a_repairing_model_is_the_model():
+    Repairing = repairing(Answer)
+    assert issubclass(Repairing, Answer)
+    assert Repairing.__name__ == "Answer" and Repairing.__doc__ == "the answer"
+    assert repairing(Answer) is Repairing
+
+def test_a_repairing_model_counts_what_it_repairs():
+    retry_meter.reset()
+    Repairing = repairing(Answer)
+
+    assert Repairing.model_validate_json('{"answer": 42}').answer == 42
+    assert retry_meter.stats()["repaired"] == 0
+
+    assert Repairing.model_validate_json("sure! {answer: '42'}").answer == 42
+    assert retry_meter.stats()["repaired"] == 1
+
+def test_what_can_not_be_repaired_raises_what_did_not_validate():
+    with pytest.raises(ValidationError) as invalid:
+        repairing(Answer).model_validate_json('{"answer": "forty two"}')
+    assert "answer" in str(invalid.value)
+
+def test_a_repaired_response_saves_a_re_ask():
+    retry_meter.reset()
+    iclient = FakeInstructor(["sure! {answer: '42', sure: True,}"])
+
+    answer = ollama(iclient=iclient).think("the answer?", response_model=Answer)
+
+    assert (answer.answer, answer.sure) == (42, True)
+    assert iclient.calls == 1
+    assert retry_meter.stats()["repaired"] == 1
+
+def test_repair_can_be_turned_off():
+    iclient = FakeInstructor(["sure! {answer: '42'}", '{"answer": 42}'])
+
+    answer = ollama(iclient=iclient).think("the answer?", response_model=Answer, repair=False)
+
+    assert answer.answer == 42
+    assert iclient.calls == 2
+
+def test_a_repaired_response_is_the_model_it_was_asked_for(tmp_path):
+    iclient = FakeInstructor(["sure! {answer: '42'}"])
+    llm = ollama(iclient=iclient).cache(SqliteCache(str(tmp_path / "thoughts.db")))
+
+    answer = llm.think("the answer?", response_model=Answer)
+
+    assert type(answer) is Answer
+    assert pickle.loads(pickle.dumps(answer)) == answer
+    assert llm.think("the answer?", response_model=Answer) == answer    ## remembered on disk
+    assert iclient.calls == 1
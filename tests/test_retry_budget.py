@@ -0,0 +1,70 @@
+from pydantic import BaseModel
+
+import towel.tools as tools
+from towel.brain.base import DeepThought
+from towel.tools import RetryBudget, retry_meter
+
+from fakes import FakeInstructor, ollama
+
+class Answer(BaseModel):
+    answer: int
+
+PROMPT = "x" * 2000                                     ## ~500 tokens a call
+
+def test_max_tokens_stops_re_asks_within_a_try():
+    retry_meter.reset()
+    iclient = FakeInstructor(["nope"] * 10, tokens=500)
+
+    thought = ollama(iclient=iclient).think(PROMPT,
+                                    response_model=Answer,
+                                    retry_budget=RetryBudget(max_attempts=10, max_tokens=1200))
+
+    assert isinstance(thought, DeepThought) and thought.stop_reason == "error"
+    assert iclient.calls == 2                           ## a third re-ask would have gone over 1200 tokens
+    stats = retry_meter.stats()
+    assert stats["wasted_tokens"] == 1000
+    assert stats["gave_up"] == 1
+
+def test_max_tokens_stops_another_try():
+    retry_meter.reset()
+    iclient = FakeInstructor(["nope"] * 10, tokens=500)
+
+    ollama(iclient=iclient).think(PROMPT,
+                          response_model=Answer,
+                          instructor_retries=1,
+                          retry_budget=RetryBudget(max_attempts=10, max_tokens=1400))
+
+    assert iclient.calls == 2                           ## a try, another try, and no tokens left for a third one
+    assert retry_meter.stats()["wasted_tokens"] == 1000
+
+def test_re_asks_go_on_within_the_budget():
+    iclient = FakeInstructor(["nope", "nope", '{"answer": 42}'], tokens=500)
+
+    answer = ollama(iclient=iclient).think(PROMPT,
+                                   response_model=Answer,
+                                   retry_budget=RetryBudget(max_attempts=10, max_tokens=5000))
+
+    assert answer.answer == 42
+    assert iclient.calls == 3
+
+def test_attempts_are_never_exceeded():
+    iclient = FakeInstructor(["nope"] * 10, tokens=10)
+
+    ollama(iclient=iclient).think("the answer?",
+                          response_model=Answer,
+                          retry_budget=RetryBudget(max_attempts=4))
+
+    assert iclient.calls == 4
+
+def test_tokens_are_not_estimated_without_max_tokens(monkeypatch):
+    def estimated(messages):
+        raise AssertionError("estimated")
+    monkeypatch.setattr(tools, "_estimated_tokens", estimated)
+    iclient = FakeInstructor(["nope"] * 10, tokens=10)
+
+    ollama(iclient=iclient).think(PROMPT,
+                                  response_model=Answer,
+                                  instructor_retries=1,
+                                  retry_budget=RetryBudget(max_attempts=4))
+
+    assert iclient.calls == 4
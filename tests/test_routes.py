@@ -0,0 +1,48 @@
+import pytest
+
+from towel import towel, step, pin, route, plan
+from towel.guide import Program, PlanCompilationError, RouterException, compile_plan
+
+from fakes import carry_out
+
+@towel
+def count(counter: int = 0):
+    return {"counter": counter + 1}
+
+@towel
+def done(counter: int):
+    return f"counted to {counter}"
+
+def test_pins_are_resolved_once():
+    program = compile_plan(plan([step(count),
+                                 pin('again'),
+                                 step(count),
+                                 pin('stop')]))
+    assert isinstance(program, Program)
+    assert program.entry() == 1
+    assert program.jump('again') == program.pins['again'] + 1
+    assert program.jump('end') == len(program)
+
+def test_routes_loop_until_done():
+    stash = carry_out(plan([pin('again'),
+                            step(count),
+                            route(lambda result: 'again' if result['count']['counter'] < 3 else 'stop'),
+                            pin('stop'),
+                            step(done)]),
+                      start_with={"counter": 0})
+    assert stash['done'] == "counted to 3"
+
+def test_duplicate_pins_do_not_compile():
+    with pytest.raises(PlanCompilationError, match="more than once"):
+        plan([pin('again'), step(count), pin('again')])
+
+def test_declared_route_pins_are_checked_at_compile_time():
+    with pytest.raises(PlanCompilationError, match="nowhere"):
+        plan([step(count),
+              route(lambda _: 'nowhere', to=['nowhere'])])
+
+def test_routing_to_a_missing_pin_points_at_it():
+    with pytest.raises(RouterException, match='pin\\("nowhere"\\)'):
+        carry_out(plan([step(count),
+                        route(lambda _: 'nowhere'),
+                        step(done)]))
@@ -0,0 +1,80 @@
+import asyncio
+
+from towel.brain.base import Stream
+
+from fakes import FakeOllama, ollama
+
+class Growing(FakeOllama):
+    "every thought's context is the one it was given and three more tokens"
+
+    def _response(self, kwargs):
+        response = super()._response(kwargs)
+        response["context"] = list(kwargs.get("context") or []) + [len(self.calls)] * 3
+        return response
+
+def test_a_session_threads_the_context_into_the_next_thought():
+    client = Growing()
+    session = ollama(client=client).session()
+
+    session.think("hi")
+    session.think("and then?")
+
+    (first, asked), (second, asked_again) = client.calls
+    assert first == second == "generate"
+    assert "context" not in asked
+    assert asked_again["context"] == [1, 1, 1]
+    assert session.context == [1, 1, 1, 2, 2, 2]
+    assert session.stats() == {"turns": 2,
+                               "context_tokens": 6,
+                               "tokens_saved": 3,
+                               "prompt_tokens": 14,
+                               "invalidations": 0}
+
+def test_another_model_starts_over():
+    client = Growing()
+    session = ollama(client=client).session()
+
+    session.think("hi")
+    session.think("hi again", model="mistral")
+
+    assert "context" not in client.calls[1][1]
+    assert session.context_model == "mistral"
+    assert session.stats()["invalidations"] == 1
+    assert session.stats()["tokens_saved"] == 0
+
+def test_a_streamed_thought_is_remembered_once_it_is_done():
+    client = Growing()
+    session = ollama(client=client).session()
+
+    stream = session.think("hi", stream=True)
+    assert isinstance(stream, Stream)
+    assert session.context is None
+    assert "".join(stream) == "42:042:142:2"
+    assert session.context == [1, 1, 1]
+
+    session.think("more")
+    assert client.calls[1][1]["context"] == [1, 1, 1]
+
+def test_an_async_session_threads_the_context():
+    client = Growing(asynchronous=True)
+    session = ollama(aclient=client).session()
+
+    async def talk():
+        await session.athink("hi")
+        await session.athink("and then?")
+
+    asyncio.run(talk())
+    assert client.calls[1][1]["context"] == [1, 1, 1]
+    assert session.stats()["tokens_saved"] == 3
+
+def test_reset_forgets_the_conversation():
+    client = Growing()
+    session = ollama(client=client).session()
+    session.think("hi")
+    assert session.digest is not None
+
+    session.reset()
+    session.think("who are you?")
+    assert session.context == [2, 2, 2]
+    assert "context" not in client.calls[1][1]
+    assert session.digest is not None
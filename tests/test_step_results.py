@@ -0,0 +1,25 @@
+import pytest
+
+from towel.guide import StepResults
+
+def test_later_steps_win_and_layers_are_replaced_in_place():
+    results = StepResults({"input": "towel"}, base={"llm": None})
+    results.put("first", {"answer": 1})
+    results.put("second", {"answer": 2})
+    assert results.view["answer"] == 2
+
+    collisions = results.put("first", {"answer": 3})
+    assert ("answer", "second") in collisions
+    assert results.view["answer"] == 2     ## "second" is still later in the plan
+    assert results.view["input"] == "towel"
+    assert len(results.view.maps) == 4     ## not rebuilt, not grown
+
+def test_non_dict_results_are_under_the_step_name():
+    results = StepResults({}, base={})
+    results.put("count", 42)
+    assert results.view["count"] == 42
+
+def test_the_view_is_read_only():
+    results = StepResults({"input": "towel"}, base={})
+    with pytest.raises(TypeError):
+        results.view["input"] = "changed"
@@ -0,0 +1,65 @@
+import asyncio
+import json
+from functools import partial
+
+from pydantic import BaseModel
+
+from towel.brain.base import DeepThought, TextThought, ToolUseThought, usage_of
+
+import fakes
+from fakes import FakeOllama, FakeInstructor
+
+class Answer(BaseModel):
+    answer: int
+
+ADD = {"name": "add", "description": "adds two numbers",
+       "input_schema": {"type": "object", "properties": {"a": {"type": "integer"}, "b": {"type": "integer"}}}}
+
+ollama = partial(fakes.ollama, structured="schema", tool_calling="prompt")
+
+def test_a_response_model_goes_to_format():
+    client = FakeOllama(answer='{"answer": 42}')
+    iclient = FakeInstructor([])
+    answer = ollama(client=client, iclient=iclient).think("the answer?", response_model=Answer)
+
+    assert isinstance(answer, Answer) and answer.answer == 42
+    assert iclient.calls == 0                                  ## nothing to validate and ask again
+
+    [(kind, asked)] = client.calls
+    assert kind == "chat" and asked["format"] == Answer.model_json_schema()
+    assert asked["messages"][0]["role"] == "system" and "answer" in asked["messages"][0]["content"]
+    assert (usage_of(answer).input_tokens, usage_of(answer).output_tokens) == (7, 3)
+
+def test_a_tool_call_goes_to_format():
+    client = FakeOllama(answer=json.dumps({"text_response": "adding",
+                                           "tool_call": {"tool": "add", "args": {"a": 1, "b": 2}}}))
+    thought = ollama(client=client).think("1 + 2?", tools=[ADD])
+
+    assert isinstance(thought, DeepThought) and thought.stop_reason == "tool_use"
+    [text, call] = thought.content
+    assert isinstance(text, TextThought) and text.text == "adding"
+    assert isinstance(call, ToolUseThought) and (call.name, call.input) == ("add", {"a": 1, "b": 2})
+    assert "format" in client.calls[0][1]
+
+def test_a_response_cut_short_is_asked_for_the_instructor_way():
+    client = FakeOllama(answer='{"answer": 4')
+    iclient = FakeInstructor(['{"answer": 42}'])
+    answer = ollama(client=client, iclient=iclient).think("the answer?", response_model=Answer, repair=False)
+
+    assert answer.answer == 42
+    assert len(client.calls) == 1 and iclient.calls == 1
+
+def test_a_thought_can_ask_for_the_prompt_way():
+    client = FakeOllama(answer='{"answer": 1}')
+    iclient = FakeInstructor(['{"answer": 42}'])
+    answer = ollama(client=client, iclient=iclient).think("the answer?", response_model=Answer, structured="prompt")
+
+    assert answer.answer == 42
+    assert client.calls == []
+
+def test_an_async_response_model_goes_to_format():
+    client = FakeOllama(answer='{"answer": 42}', asynchronous=True)
+    answer = asyncio.run(ollama(aclient=client).athink("the answer?", response_model=Answer))
+
+    assert answer.answer == 42
+    assert client.calls[0][1]["format"] == Answer.model_json_schema()
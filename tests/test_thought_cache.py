@@ -0,0 +1,69 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from towel.memo import LRUCache
+from towel.brain.base import DeepThought
+from towel.brain.ollama import Ollama
+
+from fakes import Echo, FakeOllama
+
+class Answer(BaseModel):
+    answer: str
+
+def test_the_same_thought_is_remembered():
+    llm = Echo().cache(LRUCache())
+    first = llm.think("towel", temperature=0)
+    again = llm.think("towel", temperature=0)
+    assert llm.thoughts == 1
+    assert again.content[0].text == first.content[0].text
+
+    llm.think("towel", temperature=0.5)
+    assert llm.thoughts == 2
+
+def test_remembered_thoughts_are_copies():
+    llm = Echo().cache(LRUCache())
+    llm.think("towel").content.clear()
+    assert llm.think("towel").content[0].text == "towel"
+
+def test_response_models_are_remembered_as_they_were():
+    llm = Echo().cache(LRUCache())
+    llm.think("towel", response_model=Answer)
+    again = llm.think("towel", response_model=Answer)
+    assert isinstance(again, Answer) and again.answer == "towel"
+    assert llm.thoughts == 1
+
+def test_streams_are_recorded_and_replayed():
+    llm = Echo(chunks=2).cache(LRUCache())
+    assert list(llm.think("towel", stream=True)) == ["towel:0", "towel:1"]
+    assert list(llm.think("towel", stream=True)) == ["towel:0", "towel:1"]
+    assert llm.thoughts == 1
+
+def test_async_thoughts_are_remembered():
+    llm = Echo().cache(LRUCache())
+
+    async def twice():
+        await llm.athink("towel")
+        return await llm.athink("towel")
+
+    assert asyncio.run(twice()).content[0].text == "towel"
+    assert llm.thoughts == 1
+
+def test_session_thoughts_are_not_remembered():
+    client = FakeOllama(answer="42")
+    llm = Ollama(model="llama3", health_check=None).cache(LRUCache())
+    llm.__dict__['client'] = client
+
+    chat = llm.session()
+    chat.think("the answer?")
+    chat.think("the answer?")
+
+    assert len(client.calls) == 2
+    assert client.calls[1][1]['context'] == [1, 2, 3]
+    assert chat.stats()['turns'] == 2
+
+def test_thoughts_with_args_that_have_no_stable_form_are_not_remembered():
+    llm = Echo().cache(LRUCache())
+    llm.think("towel", whatever=object())
+    llm.think("towel", whatever=object())
+    assert llm.thoughts == 2
@@ -0,0 +1,30 @@
+import pytest
+
+from towel import towel, tow, intel
+
+@towel(prompts={"greet": "hello {name}"})
+def greet(name: str, punctuation: str = "!"):
+    llm, prompts, tools, iam, _ = tow()
+    return prompts['greet'].format(name=name) + punctuation
+
+@towel
+def whoami():
+    *_, iam, _ = tow()
+    return iam
+
+def test_positional_and_keyword_arguments():
+    assert greet("arthur") == "hello arthur!"
+    assert greet("arthur", "?") == "hello arthur?"
+    assert greet(name="ford", punctuation=".") == "hello ford."
+
+def test_arguments_come_from_intel():
+    with intel(name="trillian"):
+        assert greet() == "hello trillian!"
+        assert greet(name="marvin") == "hello marvin!"
+
+def test_iam_defaults_to_the_qualified_name():
+    assert whoami() == f"{__name__}.whoami"
+
+def test_missing_arguments_fail_as_a_call_would():
+    with pytest.raises(TypeError):
+        greet()
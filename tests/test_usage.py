@@ -0,0 +1,61 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from towel.brain.base import Stream, AsyncStream, usage_of
+from towel.memo import LRUCache
+from towel.tools import retry_meter
+
+from fakes import Echo, FakeOllama, FakeInstructor, ollama
+
+class Answer(BaseModel):
+    answer: int
+
+def test_a_thought_has_its_usage():
+    thought = ollama(client=FakeOllama()).think("the answer?")
+    usage = usage_of(thought)
+    assert (usage.input_tokens, usage.output_tokens) == (7, 3)
+    assert usage.latency is not None
+
+def test_a_stream_has_its_usage_once_it_is_read():
+    stream = ollama(client=FakeOllama()).think("the answer?", stream=True)
+    assert isinstance(stream, Stream)
+    assert "".join(stream) == "42:042:142:2"
+    usage = usage_of(stream)
+    assert (usage.input_tokens, usage.output_tokens) == (7, 3)
+    assert usage.time_to_first_token is not None and usage.latency >= usage.time_to_first_token
+
+def test_a_replayed_stream_has_the_usage_it_was_recorded_with():
+    llm = Echo(chunks=2).cache(LRUCache())
+    list(llm.think("towel", stream=True))
+
+    replayed = llm.think("towel", stream=True)
+    assert isinstance(replayed, Stream)
+    assert list(replayed) == ["towel:0", "towel:1"]
+    assert usage_of(replayed).output_tokens == 2
+    assert llm.thoughts == 1
+
+def test_a_replayed_async_stream_has_the_usage_it_was_recorded_with():
+    llm = Echo(chunks=2).cache(LRUCache())
+
+    async def twice():
+        stream = await llm.athink("towel", stream=True)
+        [chunk async for chunk in stream]
+        replayed = await llm.athink("towel", stream=True)
+        return replayed, [chunk async for chunk in replayed]
+
+    replayed, chunks = asyncio.run(twice())
+    assert isinstance(replayed, AsyncStream)
+    assert chunks == ["towel:0", "towel:1"]
+    assert usage_of(replayed).output_tokens == 2
+
+def test_failed_tries_count_their_tokens():
+    retry_meter.reset()
+    iclient = FakeInstructor(["nope", "nope", "nope", '{"answer": 42}'], tokens=100)
+    answer = ollama(iclient=iclient).think("the answer?", response_model=Answer)
+
+    assert answer.answer == 42
+    usage = usage_of(answer)
+    assert usage.attempts == 4                        ## three re-asks in the first try, one call in the second
+    assert usage.attempt_tokens == [300, 100]
+    assert retry_meter.stats()["wasted_tokens"] == 300